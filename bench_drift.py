@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the drift pipeline.
+
+Generates synthetic Terraform state files and stubbed AWS inventories, runs the
+pipeline stages against the in-process fake AWS backend and prints wall time,
+peak memory and API call counts per stage as JSON.
+
+    python bench_drift.py --sizes 100 10000 --drift-rate 0.05 --output bench_output.txt
+
+With --workers the sharded scan coordinator is also timed for each worker
+count, invoking the fake Lambda in parallel. Inject per-call latency with
+--latency so the fan-out has waiting to overlap:
+
+    python bench_drift.py --sizes 10000 --workers 1 2 4 8 --latency '{"*": 0.001}'
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "terraform", "modules", "lambda", "code")
+sys.path.insert(0, CODE_DIR)
+
+import aws_backend
+import bedrock_analyzer
+import config_history
+import drift_checker
+import drift_prompt
+import drift_render
+import fake_aws
+import report_handoff
+import scan_shards
+
+DEFAULT_SIZES = [100, 10000, 100000]
+
+# Terraform type -> inventory type, in the proportions used for synthetic estates
+RESOURCE_MIX = [
+    ("aws_instance", "EC2", 0.5),
+    ("aws_s3_bucket", "S3", 0.3),
+    ("aws_iam_user", "IAM", 0.1),
+    ("aws_db_instance", "RDS", 0.1),
+]
+
+BASE_TIME = datetime(2025, 7, 1, 0, 0, 0)
+
+
+def build_fake_aws(inventory, latency=None):
+    """Seed an in-process fake AWS backend with a synthetic inventory"""
+    aws = fake_aws.FakeAWS(latency=latency)
+    for resource_id, details in inventory.items():
+        attrs = details["attributes"]
+        if details["type"] == "EC2":
+            aws.add_instance(resource_id, attrs.get("instance_type"), attrs.get("tags"), subnet_id=attrs.get("subnet_id"), security_groups=attrs.get("security_groups"))
+        elif details["type"] == "S3":
+            aws.add_bucket(resource_id, attrs.get("tags"))
+        elif details["type"] == "IAM":
+            aws.add_user(resource_id, attrs.get("path") or "/")
+        elif details["type"] == "RDS":
+            aws.add_db_instance(resource_id, attrs.get("instance_class"), attrs.get("engine"), attrs.get("storage_size"), attrs.get("multi_az"), attrs.get("tags"), attrs.get("resource_id"))
+    return aws
+
+
+def pick_type(rng):
+    """Pick a resource type according to RESOURCE_MIX"""
+    roll = rng.random()
+    for tf_type, aws_type, weight in RESOURCE_MIX:
+        if roll < weight:
+            return tf_type, aws_type
+        roll -= weight
+    return RESOURCE_MIX[-1][0], RESOURCE_MIX[-1][1]
+
+
+def provider_attributes(tf_type, resource_id, index, tags):
+    """Attributes the AWS provider records in state besides the ones drift detection looks at"""
+    policy = json.dumps({
+        "Version": "2012-10-17",
+        "Statement": [{"Sid": f"Stmt{n}", "Effect": "Allow", "Action": ["s3:GetObject", "s3:PutObject", "s3:ListBucket"], "Resource": [f"arn:aws:s3:::bench-bucket-{index}/*"], "Principal": {"AWS": f"arn:aws:iam::123456789012:role/app-{n}"}} for n in range(3)]
+    })
+    common = {"tags_all": dict(tags, ManagedBy="terraform"), "timeouts": None}
+    if tf_type == "aws_instance":
+        return dict(common, **{
+            "arn": f"arn:aws:ec2:{fake_aws.DEFAULT_REGION}:123456789012:instance/{resource_id}",
+            "user_data": "IyEvYmluL2Jhc2gKc2V0IC1ldXhvIHBpcGVmYWlsCmN1cmwgLWZzU0wgaHR0cHM6Ly9leGFtcGxlLmNvbS9ib290c3RyYXAuc2ggfCBiYXNoCg==" * 4,
+            "root_block_device": [{"delete_on_termination": True, "device_name": "/dev/xvda", "encrypted": True, "iops": 3000, "kms_key_id": "", "tags": {}, "throughput": 125, "volume_id": f"vol-{index:017x}", "volume_size": 20, "volume_type": "gp3"}],
+            "metadata_options": [{"http_endpoint": "enabled", "http_put_response_hop_limit": 1, "http_tokens": "required", "instance_metadata_tags": "disabled"}],
+            "credit_specification": [], "ebs_block_device": [], "ephemeral_block_device": [], "network_interface": [], "launch_template": [],
+            "private_ip": f"10.{index % 256}.{index // 256 % 256}.10", "private_dns": f"ip-10-0-0-{index % 256}.ec2.internal",
+            "public_ip": "", "public_dns": "", "availability_zone": "ap-southeast-1a", "instance_state": "running",
+            "vpc_security_group_ids": ["sg-0123456789abcdef0"], "key_name": "deployer", "monitoring": False, "ebs_optimized": False
+        })
+    if tf_type == "aws_s3_bucket":
+        return dict(common, **{
+            "bucket_domain_name": f"{resource_id}.s3.amazonaws.com", "bucket_regional_domain_name": f"{resource_id}.s3.{fake_aws.DEFAULT_REGION}.amazonaws.com",
+            "hosted_zone_id": "Z3O0J2DXBE1FTB", "region": fake_aws.DEFAULT_REGION, "force_destroy": False, "object_lock_enabled": False,
+            "policy": policy,
+            "versioning": [{"enabled": True, "mfa_delete": False}],
+            "server_side_encryption_configuration": [{"rule": [{"apply_server_side_encryption_by_default": [{"kms_master_key_id": "", "sse_algorithm": "AES256"}], "bucket_key_enabled": False}]}],
+            "lifecycle_rule": [], "grant": [{"id": "0123456789abcdef" * 4, "permissions": ["FULL_CONTROL"], "type": "CanonicalUser", "uri": ""}]
+        })
+    if tf_type == "aws_iam_user":
+        return dict(common, **{"unique_id": f"AIDA{index:017d}", "force_destroy": False, "permissions_boundary": "", "inline_policy": policy})
+    return dict(common, **{
+        "address": f"{resource_id}.abcdefghij.{fake_aws.DEFAULT_REGION}.rds.amazonaws.com", "endpoint": f"{resource_id}.abcdefghij.{fake_aws.DEFAULT_REGION}.rds.amazonaws.com:3306",
+        "engine_version": "8.0.35", "parameter_group_name": "default.mysql8.0", "option_group_name": "default:mysql-8-0", "db_subnet_group_name": "private",
+        "backup_retention_period": 7, "backup_window": "03:00-04:00", "maintenance_window": "sun:05:00-sun:06:00", "storage_type": "gp3", "storage_encrypted": True,
+        "vpc_security_group_ids": ["sg-0123456789abcdef0"], "enabled_cloudwatch_logs_exports": ["error", "slowquery"], "performance_insights_enabled": False,
+        "username": "admin", "port": 3306, "publicly_accessible": False, "skip_final_snapshot": True, "deletion_protection": False
+    })
+
+
+def make_resource(rng, index, tf_type):
+    """Build one resource id plus matching Terraform and AWS attributes"""
+    tags = {"Name": f"res-{index}", "Environment": rng.choice(["prod", "staging", "dev"])}
+
+    if tf_type == "aws_instance":
+        resource_id = f"i-{index:017x}"
+        instance_type = rng.choice(["t3.micro", "t3.small", "m5.large"])
+        tf_attrs = {"id": resource_id, "ami": "ami-0abcdef1234567890", "instance_type": instance_type, "tags": tags, "subnet_id": "subnet-0123456789abcdef0"}
+        actual_attrs = {"instance_type": instance_type, "tags": dict(tags), "subnet_id": "subnet-0123456789abcdef0", "security_groups": ["sg-0123456789abcdef0"]}
+    elif tf_type == "aws_s3_bucket":
+        resource_id = f"bench-bucket-{index}"
+        tf_attrs = {"id": resource_id, "bucket": resource_id, "arn": f"arn:aws:s3:::{resource_id}", "tags": tags}
+        actual_attrs = {"tags": dict(tags)}
+    elif tf_type == "aws_iam_user":
+        resource_id = f"bench-user-{index}"
+        arn = f"arn:aws:iam::123456789012:user/{resource_id}"
+        tf_attrs = {"id": resource_id, "name": resource_id, "arn": arn, "path": "/", "tags": tags}
+        actual_attrs = {"arn": arn, "path": "/"}
+    else:
+        # AWS provider v5 state: id is the DbiResourceId, identifier the name the inventory uses
+        resource_id = f"bench-db-{index}"
+        dbi_resource_id = f"db-{index:026X}"
+        arn = f"arn:aws:rds:{fake_aws.DEFAULT_REGION}:{fake_aws.ACCOUNT_ID}:db:{resource_id}"
+        tf_attrs = {"id": dbi_resource_id, "identifier": resource_id, "resource_id": dbi_resource_id, "arn": arn, "engine": "mysql", "instance_class": "db.t3.micro", "allocated_storage": 20, "multi_az": False, "tags": tags}
+        actual_attrs = {"engine": "mysql", "instance_class": "db.t3.micro", "storage_size": 20, "multi_az": False, "tags": dict(tags), "arn": arn, "resource_id": dbi_resource_id}
+
+    tf_attrs.update((k, v) for k, v in provider_attributes(tf_type, resource_id, index, tags).items() if k not in tf_attrs)
+    return resource_id, tf_attrs, actual_attrs
+
+
+def generate_estate(size, drift_rate, seed=42):
+    """
+    Generate a synthetic tfstate and matching inventory with drift applied.
+
+    The drift rate is split evenly between unmanaged, deleted and modified resources.
+    """
+    rng = random.Random(seed)
+    tfstate = {"version": 4, "terraform_version": "1.5.7", "serial": 1, "resources": []}
+    inventory = {}
+
+    for index in range(size):
+        tf_type, aws_type = pick_type(rng)
+        resource_id, tf_attrs, actual_attrs = make_resource(rng, index, tf_type)
+        roll = rng.random()
+
+        if roll < drift_rate / 3:
+            # Unmanaged: exists in AWS only
+            inventory[resource_id] = {"type": aws_type, "attributes": actual_attrs}
+            continue
+
+        tfstate["resources"].append({
+            "mode": "managed",
+            "type": tf_type,
+            "name": f"r{index}",
+            "provider": "provider[\"registry.terraform.io/hashicorp/aws\"]",
+            "instances": [{"schema_version": 1, "attributes": tf_attrs}]
+        })
+
+        if roll < 2 * drift_rate / 3:
+            # Deleted: exists in Terraform only
+            continue
+
+        if roll < drift_rate and "tags" in actual_attrs:
+            # Modified: tag changed outside Terraform
+            actual_attrs["tags"]["ManualChange"] = "true"
+
+        inventory[resource_id] = {"type": aws_type, "attributes": actual_attrs}
+
+    return tfstate, inventory
+
+
+def mutate_state(tfstate, change_rate, seed=7):
+    """Return a copy of tfstate with resources added, removed and modified"""
+    rng = random.Random(seed)
+    resources = []
+    for resource in tfstate["resources"]:
+        roll = rng.random()
+        if roll < change_rate / 3:
+            continue
+        if roll < change_rate:
+            attrs = dict(resource["instances"][0]["attributes"])
+            attrs["tags"] = dict(attrs.get("tags") or {}, Revision="2")
+            resource = dict(resource, instances=[{"schema_version": 1, "attributes": attrs}])
+        resources.append(resource)
+
+    for index in range(int(len(tfstate["resources"]) * change_rate / 3)):
+        tf_type, _ = pick_type(rng)
+        _, tf_attrs, _ = make_resource(rng, 10_000_000 + index, tf_type)
+        resources.append({"mode": "managed", "type": tf_type, "name": f"new{index}", "instances": [{"schema_version": 1, "attributes": tf_attrs}]})
+
+    return dict(tfstate, serial=tfstate["serial"] + 1, resources=resources)
+
+
+def generate_history(count, seed=11):
+    """Generate Config history items and CloudTrail events in the shape config_history produces"""
+    rng = random.Random(seed)
+    history, events = [], []
+    for index in range(count):
+        capture = BASE_TIME + timedelta(minutes=index * 7)
+        history.append({
+            "version": "1.3",
+            "configurationItemStatus": "OK",
+            "configurationStateId": str(index),
+            "captureTime": capture.strftime("%Y-%m-%d %H:%M:%S"),
+            "configuration": {"instanceType": "t3.micro"}
+        })
+        event_time = capture + timedelta(seconds=rng.randint(-600, 600))
+        events.append({
+            "eventName": "ModifyInstanceAttribute",
+            "eventTime": event_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "username": "bench-user",
+            "resources": [],
+            "userIdentity": {"arn": "arn:aws:iam::123456789012:user/bench-user"}
+        })
+    return history, events
+
+
+def measure(stage, func, aws, repeat):
+    """
+    Run a stage, returning its result and timing, memory and API call stats.
+
+    peak_memory_bytes is the high-water mark while the stage runs, retained_memory_bytes
+    what is still allocated once it returns and only its result is kept.
+    """
+    timings = []
+    for _ in range(repeat):
+        aws.reset_calls()
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    api_calls = dict(aws.calls)
+
+    tracemalloc.start()
+    traced = func()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del traced
+
+    return result, {
+        "stage": stage,
+        "wall_time_s": round(min(timings), 6),
+        "peak_memory_bytes": peak,
+        "retained_memory_bytes": retained,
+        "api_calls": api_calls,
+        "api_call_total": sum(api_calls.values())
+    }
+
+
+def run_benchmark(size, drift_rate, repeat, history_size=None, workers=None, latency=None):
+    """Benchmark every pipeline stage for one estate size"""
+    tfstate, inventory = generate_estate(size, drift_rate)
+    next_state = mutate_state(tfstate, drift_rate)
+    history, events = generate_history(history_size or max(10, size // 100))
+    aws = build_fake_aws(inventory, latency)
+    stages = []
+
+    previous = aws_backend.set_backend(aws)
+    try:
+        managed, stats = measure("extract_managed_resources", lambda: drift_checker.extract_managed_resources(tfstate), aws, repeat)
+        stages.append(stats)
+
+        # The state index as a handler keeps it: parsed from the raw object, state released
+        state_body = json.dumps(tfstate).encode("utf-8")
+        _, stats = measure("load_state_index", lambda: drift_checker.extract_managed_resources(json.loads(state_body)), aws, repeat)
+        stages.append(stats)
+
+        actual, stats = measure("get_actual_resources", drift_checker.get_actual_resources, aws, repeat)
+        stages.append(stats)
+
+        if workers:
+            aws.register_pipeline_functions()
+            aws.add_bucket("bench-shards")
+        for count in workers or []:
+            _, stats = measure(
+                f"sharded_scan[workers={count}]",
+                lambda: scan_shards.coordinate("iac-drift-checker", "bench-shards", drift_checker.INVENTORY_PAGES, count),
+                aws, repeat
+            )
+            stages.append(stats)
+
+        drift, stats = measure("find_drift", lambda: drift_checker.find_drift(managed, actual), aws, repeat)
+        stages.append(stats)
+        unmanaged, deleted, modified = drift
+
+        changes, stats = measure("compare_terraform_states", lambda: drift_checker.compare_terraform_states(tfstate, next_state), aws, repeat)
+        stages.append(stats)
+
+        drift_report = {
+            "unmanaged_resources": unmanaged,
+            "deleted_resources": deleted,
+            "modified_resources": modified,
+            "timestamp": BASE_TIME.strftime("%Y-%m-%d %H:%M:%S UTC")
+        }
+        report, stats = measure("format_drift_report", lambda: bedrock_analyzer.format_drift_report(drift_report), aws, repeat)
+        stages.append(stats)
+
+        (prompt, prompt_stats), stats = measure("build_prompt", lambda: drift_prompt.build_prompt(drift_report), aws, repeat)
+        stages.append(stats)
+
+        _, stats = measure("render_json", lambda: drift_render.render_string(drift_report, "json"), aws, repeat)
+        stages.append(stats)
+
+        # The checker -> analyzer handoff: compressed report written to S3, read back by pointer
+        s3 = aws_backend.client("s3")
+        aws.add_bucket("bench-reports")
+        pointer, stats = measure("report_handoff_write", lambda: report_handoff.write_report(s3, "bench-reports", drift_report), aws, repeat)
+        stages.append(stats)
+        _, stats = measure("report_handoff_read", lambda: report_handoff.read_report(s3, pointer), aws, repeat)
+        stages.append(stats)
+
+        correlated, stats = measure("correlate_changes", lambda: config_history.correlate_changes(history, events), aws, repeat)
+        stages.append(stats)
+    finally:
+        aws_backend.set_backend(previous)
+
+    return {
+        "size": size,
+        "drift_rate": drift_rate,
+        "managed_resources": len(managed),
+        "actual_resources": len(actual),
+        "drift": {"unmanaged": len(unmanaged), "deleted": len(deleted), "modified": len(modified)},
+        "state_changes": len(changes),
+        "report_chars": len(report),
+        "report_tokens": drift_prompt.estimate_tokens(report),
+        "prompt_tokens": prompt_stats["estimated_tokens"],
+        "report_inline_bytes": len(json.dumps({"drift_report": drift_report})),
+        "report_handoff_bytes": pointer["size"],
+        "history_items": len(history),
+        "stages": stages
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline drift pipeline benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Estate sizes to benchmark")
+    parser.add_argument("--drift-rate", type=float, default=0.05, help="Fraction of resources with drift")
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per stage, best is reported")
+    parser.add_argument("--history-size", type=int, help="Config history items for correlate_changes (default size/100)")
+    parser.add_argument("--workers", type=int, nargs="+", help="Also time the sharded scan coordinator with these worker counts")
+    parser.add_argument("--latency", type=json.loads, help='Per-call latency for the fake backend, e.g. \'{"*": 0.001}\'')
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    results = {
+        "generated_at": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "python": sys.version.split()[0],
+        "runs": []
+    }
+    for size in args.sizes:
+        print(f"Benchmarking {size} resources...", file=sys.stderr)
+        results["runs"].append(run_benchmark(size, args.drift_rate, args.repeat, args.history_size, args.workers, args.latency))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the JSON codec on the payloads the handlers serialize.
+
+Times stdlib json against drift_json (orjson when installed) on Terraform
+state bodies, CloudTrail records, drift reports and handler events, and
+prints per-operation times and speedups as JSON.
+
+    python bench_json.py --sizes 1000 10000 --repeat 5 --output bench_json.txt
+
+Run with JSON_CODEC=json to check the stdlib fallback of the codec itself.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "terraform", "modules", "lambda", "code")
+sys.path.insert(0, CODE_DIR)
+
+import bench_drift
+import drift_checker
+import drift_json
+import fake_aws
+import resource_records
+
+DEFAULT_SIZES = [1000, 10000]
+
+# Records per lookup_events page the CloudTrail benchmarks scan
+CLOUDTRAIL_RECORDS = 100
+
+
+def best_time(func, number, repeat):
+    """Best per-call time of func over repeat runs of number calls"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    return min(timings)
+
+
+def cloudtrail_records(count, seed=3):
+    """lookup_events entries with CloudTrailEvent strings the size of real EC2 and S3 calls"""
+    rng = random.Random(seed)
+    records = []
+    for index in range(count):
+        instances = [{"instanceId": f"i-{index:09x}{n:08x}", "instanceType": rng.choice(["t3.micro", "m5.large"]), "privateIpAddress": f"10.0.{index % 256}.{n}"} for n in range(rng.randint(1, 4))]
+        detail = {
+            "eventVersion": "1.08",
+            "userIdentity": {"type": "AssumedRole", "principalId": f"AROA{index:016d}:session", "arn": f"arn:aws:sts::{fake_aws.ACCOUNT_ID}:assumed-role/deployer/session-{index}", "accountId": fake_aws.ACCOUNT_ID, "sessionContext": {"attributes": {"creationDate": "2025-07-01T00:00:00Z", "mfaAuthenticated": "false"}}},
+            "eventTime": "2025-07-01T00:00:00Z",
+            "eventSource": "ec2.amazonaws.com",
+            "eventName": "RunInstances",
+            "awsRegion": fake_aws.DEFAULT_REGION,
+            "sourceIPAddress": "203.0.113.10",
+            "userAgent": "APN/1.0 HashiCorp/1.0 Terraform/1.5.7 (+https://www.terraform.io) terraform-provider-aws/5.31.0",
+            "requestParameters": {"instanceType": instances[0]["instanceType"], "imageId": "ami-0abcdef1234567890", "minCount": len(instances), "maxCount": len(instances), "tagSpecificationSet": {"items": [{"resourceType": "instance", "tags": [{"key": "Name", "value": f"res-{index}"}]}]}},
+            "responseElements": {"reservationId": f"r-{index:017x}", "instancesSet": {"items": instances}},
+            "requestID": str(uuid.UUID(int=rng.getrandbits(128))),
+            "eventID": str(uuid.UUID(int=rng.getrandbits(128))),
+            "readOnly": False,
+            "eventType": "AwsApiCall",
+            "recipientAccountId": fake_aws.ACCOUNT_ID
+        }
+        records.append({"EventId": detail["eventID"], "EventName": "RunInstances", "CloudTrailEvent": json.dumps(detail)})
+    return records
+
+
+def handler_event(instances):
+    """A CloudTrail RunInstances envelope as the checker logs it on entry"""
+    return {
+        "version": "0",
+        "id": str(uuid.uuid4()),
+        "detail-type": "AWS API Call via CloudTrail",
+        "source": "aws.ec2",
+        "account": fake_aws.ACCOUNT_ID,
+        "time": "2025-07-01T00:00:00Z",
+        "region": fake_aws.DEFAULT_REGION,
+        "detail": json.loads(cloudtrail_records(1)[0]["CloudTrailEvent"]) | {
+            "responseElements": {"instancesSet": {"items": [{"instanceId": f"i-{n:017x}", "instanceType": "t3.micro"} for n in range(instances)]}}
+        }
+    }
+
+
+def stdlib_filter(records, needle):
+    """The scan get_change_author did: parse every record, then search its repr"""
+    return [r for r in records if needle in str(json.loads(r["CloudTrailEvent"]))]
+
+
+def codec_filter(records, needle):
+    """The same scan with lazy documents: only records whose text matches are parsed"""
+    found = []
+    for record in records:
+        document = drift_json.LazyDocument(record["CloudTrailEvent"])
+        if needle in document:
+            document.get("userIdentity")
+            found.append(record)
+    return found
+
+
+def compare(name, payload_bytes, stdlib, codec, number, repeat):
+    stdlib_s = best_time(stdlib, number, repeat)
+    codec_s = best_time(codec, number, repeat)
+    return {
+        "operation": name,
+        "payload_bytes": payload_bytes,
+        "stdlib_s": round(stdlib_s, 9),
+        "codec_s": round(codec_s, 9),
+        "speedup": round(stdlib_s / codec_s, 2) if codec_s else None
+    }
+
+
+def run_benchmark(size, repeat):
+    """Benchmark each operation for one estate size"""
+    tfstate, inventory = bench_drift.generate_estate(size, 0.05)
+    state_body = json.dumps(tfstate).encode("utf-8")
+    managed = drift_checker.extract_managed_resources(tfstate)
+    actual = {rid: resource_records.ResourceRecord(d["type"], d["attributes"]) for rid, d in inventory.items()}
+    unmanaged, deleted, modified = drift_checker.find_drift(managed, actual)
+    report = {
+        "unmanaged_resources": unmanaged,
+        "deleted_resources": deleted,
+        "modified_resources": modified,
+        "timestamp": datetime(2025, 7, 1)
+    }
+    report_bytes = len(json.dumps(report, default=str))
+    records = cloudtrail_records(CLOUDTRAIL_RECORDS)
+    # A resource the last record mentions, so the scan reads the whole page
+    needle = json.loads(records[-1]["CloudTrailEvent"])["responseElements"]["instancesSet"]["items"][0]["instanceId"]
+    event = handler_event(max(1, size // 100))
+    # Fewer calls per run for larger payloads, so each run takes a similar time
+    number = max(1, 20000 // size)
+
+    return {
+        "size": size,
+        "codec": drift_json.CODEC,
+        "operations": [
+            compare("state_loads", len(state_body), lambda: json.loads(state_body), lambda: drift_json.loads(state_body), number, repeat),
+            compare("report_dumps", report_bytes, lambda: json.dumps(report, default=str).encode("utf-8"), lambda: drift_json.dumpb(report, default=str), number, repeat),
+            compare("event_log_dumps", len(json.dumps(event)), lambda: json.dumps(event), lambda: drift_json.dumps(event), number * 10, repeat),
+            compare("cloudtrail_parse_page", sum(len(r["CloudTrailEvent"]) for r in records), lambda: [json.loads(r["CloudTrailEvent"]) for r in records], lambda: [drift_json.loads(r["CloudTrailEvent"]) for r in records], number, repeat),
+            compare("cloudtrail_filter_page", sum(len(r["CloudTrailEvent"]) for r in records), lambda: stdlib_filter(records, needle), lambda: codec_filter(records, needle), number, repeat)
+        ]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON codec microbenchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Estate sizes for the state and report payloads")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per operation, best is reported")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    results = {
+        "generated_at": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "python": sys.version.split()[0],
+        "codec": drift_json.CODEC,
+        "runs": []
+    }
+    for size in args.sizes:
+        print(f"Benchmarking {size} resources...", file=sys.stderr)
+        results["runs"].append(run_benchmark(size, args.repeat))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Event-stream load test for the iac-drift-checker handler.
+
+Replays EventBridge envelopes against drift_checker.lambda_handler in-process,
+backed by the fake AWS backend, at a fixed offered rate and concurrency. The
+events are synthetic Config item changes, RunInstances calls with many
+instances and tfstate Object Created events, or recorded ones from a file.
+Reports throughput, p50/p95/p99 latency and API calls per event kind as JSON.
+
+    python load_test.py --rate 50 --count 2000 --concurrency 8 --mix config=0.6,cloudtrail=0.3,tfstate=0.1
+    python load_test.py --events-file recorded.jsonl --rate 0 --concurrency 16 --latency '{"*": 0.002}'
+
+Latency is measured from when an event was due, so it includes time spent
+queued behind earlier events. If the handler cannot keep up with the offered
+rate, that time grows over the run and the achieved rate falls short.
+--duplicate-rate re-sends earlier events, as at-least-once delivery does.
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "terraform", "modules", "lambda", "code")
+sys.path.insert(0, CODE_DIR)
+
+import aws_backend
+import drift_checker
+import drift_metrics
+import fake_aws
+
+STATE_BUCKET = "loadtest-state"
+STATE_KEY = "terraform.tfstate"
+TOPIC_ARN = f"arn:aws:sns:{fake_aws.DEFAULT_REGION}:{fake_aws.ACCOUNT_ID}:drift-alerts"
+
+DEFAULT_MIX = "config=0.6,cloudtrail=0.3,tfstate=0.1"
+
+
+class LoadTestAWS(fake_aws.FakeAWS):
+    """Fake backend that also counts API calls per event kind of the calling thread"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.kind_calls = {}
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def before_call(self, service, op):
+        kind = getattr(self.local, "kind", None)
+        if kind:
+            with self.lock:
+                self.kind_calls.setdefault(kind, Counter())[f"{service}.{op}"] += 1
+        super().before_call(service, op)
+
+
+def instance_id(index):
+    return f"i-{index:017x}"
+
+
+def seed_estate(aws, instances, state_versions):
+    """Managed instances, a versioned state with one change per version, and CloudTrail history"""
+    now = datetime.utcnow()
+    ids = [instance_id(n) for n in range(instances)]
+    attributes = []
+    for n, resource_id in enumerate(ids):
+        aws.add_instance(resource_id, "t3.micro", {"Name": f"app-{n}", "Environment": "prod"})
+        attributes.append({"id": resource_id, "instance_type": "t3.micro", "tags": {"Name": f"app-{n}", "Environment": "prod"}})
+        if n % 10 == 0:
+            aws.add_cloudtrail_event("ModifyInstanceAttribute", [resource_id], user="ops", event_time=now - timedelta(hours=1))
+
+    versions = []
+    for serial in range(1, state_versions + 1):
+        changed = attributes[serial % len(attributes)]
+        changed["instance_type"] = "t3.large" if changed["instance_type"] == "t3.micro" else "t3.micro"
+        state = {"version": 4, "serial": serial, "resources": [{
+            "mode": "managed",
+            "type": "aws_instance",
+            "name": "app",
+            "provider": "provider[\"registry.terraform.io/hashicorp/aws\"]",
+            "instances": [{"index_key": n, "schema_version": 1, "attributes": dict(a)} for n, a in enumerate(attributes)]
+        }]}
+        stored = aws.put_object(STATE_BUCKET, STATE_KEY, json.dumps(state))
+        versions.append((stored["VersionId"], stored["ETag"]))
+    return ids, versions
+
+
+def envelope(detail_type, source, detail):
+    return {
+        "version": "0",
+        "id": str(uuid.uuid4()),
+        "detail-type": detail_type,
+        "source": source,
+        "account": fake_aws.ACCOUNT_ID,
+        "time": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "region": fake_aws.DEFAULT_REGION,
+        "resources": [],
+        "detail": detail
+    }
+
+
+def config_event(rng, sequence, ids, versions, run_instances):
+    resource_id = rng.choice(ids)
+    return envelope("Config Configuration Item Change", "aws.config", {
+        "messageType": "ConfigurationItemChangeNotification",
+        "configurationItem": {
+            "resourceType": "AWS::EC2::Instance",
+            "resourceId": resource_id,
+            "configurationItemStatus": "OK",
+            "configurationStateId": str(1000 + sequence),
+            "configurationItemCaptureTime": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            "configuration": {"instanceId": resource_id, "instanceType": "t3.large"}
+        },
+        "configurationItemDiff": {
+            "changeType": "UPDATE",
+            "changedProperties": {"Configuration.InstanceType": {"previousValue": "t3.micro", "updatedValue": "t3.large", "changeType": "UPDATE"}}
+        }
+    })
+
+
+def cloudtrail_event(rng, sequence, ids, versions, run_instances):
+    items = [{"instanceId": f"i-{sequence:09x}{n:08x}", "instanceType": "t3.micro"} for n in range(run_instances)]
+    return envelope("AWS API Call via CloudTrail", "aws.ec2", {
+        "eventVersion": "1.08",
+        "eventID": str(uuid.uuid4()),
+        "eventTime": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "eventSource": "ec2.amazonaws.com",
+        "eventName": "RunInstances",
+        "awsRegion": fake_aws.DEFAULT_REGION,
+        "userIdentity": {"type": "IAMUser", "arn": f"arn:aws:iam::{fake_aws.ACCOUNT_ID}:user/loadtest"},
+        "responseElements": {"instancesSet": {"items": items}}
+    })
+
+
+def tfstate_event(rng, sequence, ids, versions, run_instances):
+    version_id, etag = versions[sequence % len(versions)]
+    return envelope("Object Created", "aws.s3", {
+        "version": "0",
+        "bucket": {"name": STATE_BUCKET},
+        "object": {"key": STATE_KEY, "version-id": version_id, "etag": etag.strip("\""), "size": 0},
+        "reason": "PutObject"
+    })
+
+
+GENERATORS = {
+    "config": config_event,
+    "cloudtrail": cloudtrail_event,
+    "tfstate": tfstate_event
+}
+
+
+def event_kind(event):
+    """Which handler an event is routed to"""
+    detail_type = event.get("detail-type")
+    if detail_type == "Config Configuration Item Change" or (event.get("detail") or {}).get("configurationItem"):
+        return "config"
+    if detail_type == "AWS API Call via CloudTrail":
+        return "cloudtrail"
+    if detail_type == "Object Created" or event.get("Records"):
+        return "tfstate"
+    return "other"
+
+
+def parse_mix(text):
+    mix = []
+    for part in text.split(","):
+        kind, weight = part.split("=")
+        if kind.strip() not in GENERATORS:
+            raise ValueError(f"Unknown event kind {kind!r}, expected one of {sorted(GENERATORS)}")
+        mix.append((kind.strip(), float(weight)))
+    return mix
+
+
+def synthetic_events(rng, count, mix, ids, versions, run_instances, duplicate_rate):
+    kinds = [kind for kind, _ in mix]
+    weights = [weight for _, weight in mix]
+    events = []
+    for sequence in range(count):
+        if events and rng.random() < duplicate_rate:
+            events.append(rng.choice(events))
+            continue
+        kind = rng.choices(kinds, weights)[0]
+        events.append((kind, GENERATORS[kind](rng, sequence, ids, versions, run_instances)))
+    return events
+
+
+def recorded_events(path, rng, count, duplicate_rate):
+    """Events from a JSON list or a JSON-lines file, cycled until count is reached"""
+    with open(path) as f:
+        text = f.read()
+    loaded = json.loads(text) if text.lstrip().startswith("[") else [json.loads(line) for line in text.splitlines() if line.strip()]
+    events = []
+    for sequence in range(count):
+        if events and rng.random() < duplicate_rate:
+            events.append(rng.choice(events))
+            continue
+        event = loaded[sequence % len(loaded)]
+        events.append((event_kind(event), event))
+    return events
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def latency_stats(values):
+    values = sorted(values)
+    return {
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3)
+    }
+
+
+def run_load(aws, events, rate, concurrency):
+    """
+    Feed events to the handler on a thread pool, each one submitted at its due time.
+
+    With rate 0 every event is due at the start. Returns one
+    (kind, service time, time since due, error, duplicate) tuple per event and
+    the wall time of the run.
+    """
+    def handle(kind, event, due):
+        aws.local.kind = kind
+        begin = time.perf_counter()
+        try:
+            response = drift_checker.lambda_handler(event, None)
+            error = isinstance(response, dict) and "error" in response
+            duplicate = isinstance(response, dict) and bool(response.get("duplicate"))
+        except Exception:
+            error, duplicate = True, False
+        end = time.perf_counter()
+        aws.local.kind = None
+        return kind, end - begin, end - due, error, duplicate
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = []
+        for index, (kind, event) in enumerate(events):
+            due = start + index / rate if rate else start
+            wait = due - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            futures.append(drift_metrics.submit(pool, handle, kind, event, due))
+        results = [future.result() for future in futures]
+    return results, time.perf_counter() - start
+
+
+def summarize(aws, results, wall_time, rate, concurrency):
+    report = {
+        "events": len(results),
+        "offered_rate": rate or None,
+        "concurrency": concurrency,
+        "wall_time_s": round(wall_time, 3),
+        "throughput_per_s": round(len(results) / wall_time, 2) if wall_time else None,
+        "errors": sum(1 for r in results if r[3]),
+        "duplicates": sum(1 for r in results if r[4]),
+        "latency": latency_stats([r[2] for r in results]) if results else None,
+        "handlers": {}
+    }
+    for kind in sorted({r[0] for r in results}):
+        rows = [r for r in results if r[0] == kind]
+        calls = aws.kind_calls.get(kind, Counter())
+        report["handlers"][kind] = {
+            "events": len(rows),
+            "errors": sum(1 for r in rows if r[3]),
+            "duplicates": sum(1 for r in rows if r[4]),
+            "service_time": latency_stats([r[1] for r in rows]),
+            "latency": latency_stats([r[2] for r in rows]),
+            "api_calls_per_event": round(sum(calls.values()) / len(rows), 2),
+            "api_calls": dict(sorted(calls.items()))
+        }
+    return report
+
+
+def configure_environment():
+    os.environ.update({
+        "TFSTATE_BUCKET": STATE_BUCKET,
+        "TFSTATE_KEY": STATE_KEY,
+        "SNS_TOPIC_ARN": TOPIC_ARN,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event-stream load test for the drift checker handler")
+    parser.add_argument("--rate", type=float, default=20, help="Offered events per second, 0 for as fast as possible")
+    parser.add_argument("--count", type=int, default=500, help="Events to send")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent handler invocations")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Synthetic event mix as kind=weight pairs (config, cloudtrail, tfstate)")
+    parser.add_argument("--events-file", help="Replay recorded EventBridge envelopes (JSON list or JSON lines) instead")
+    parser.add_argument("--instances", type=int, default=500, help="Managed EC2 instances in the seeded state")
+    parser.add_argument("--state-versions", type=int, default=20, help="State versions tfstate events refer to")
+    parser.add_argument("--run-instances", type=int, default=50, help="Instances per synthetic RunInstances call")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="Fraction of events re-sent as duplicates")
+    parser.add_argument("--latency", type=json.loads, help='Per-call latency for the fake backend, e.g. \'{"*": 0.001}\'')
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the event stream")
+    parser.add_argument("--verbose", action="store_true", help="Keep the handler's own output")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    aws = LoadTestAWS(latency=args.latency, seed=args.seed)
+    configure_environment()
+    previous = aws_backend.set_backend(aws)
+    try:
+        ids, versions = seed_estate(aws, args.instances, args.state_versions)
+        if args.events_file:
+            events = recorded_events(args.events_file, rng, args.count, args.duplicate_rate)
+        else:
+            events = synthetic_events(rng, args.count, parse_mix(args.mix), ids, versions, args.run_instances, args.duplicate_rate)
+        aws.reset_calls()
+
+        print(f"Sending {len(events)} events at {args.rate or 'max'}/s with concurrency {args.concurrency}...", file=sys.stderr)
+        with contextlib.ExitStack() as stack:
+            if not args.verbose:
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+            results, wall_time = run_load(aws, events, args.rate, args.concurrency)
+    finally:
+        aws_backend.set_backend(previous)
+
+    report = summarize(aws, results, wall_time, args.rate, args.concurrency)
+    report["generated_at"] = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    report["published"] = len(aws.published)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Run the full drift pipeline locally against the in-process fake AWS backend.
+
+Seeds a small estate with drift, then runs detection -> Bedrock analysis ->
+history -> config history -> RAG exactly as the deployed Lambdas would, with
+optional latency/throttle injection and profiling.
+
+    python local_pipeline.py --latency '{"cloudtrail": 0.02}' --throttle '{"cloudtrail.lookup_events": 0.1}' --profile
+"""
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import sys
+from datetime import datetime, timedelta
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "terraform", "modules", "lambda", "code")
+sys.path.insert(0, CODE_DIR)
+
+import aws_backend
+import fake_aws
+
+STATE_BUCKET = "statetf-bucket"
+HISTORY_BUCKET = "drift-history-local"
+TOPIC_ARN = f"arn:aws:sns:{fake_aws.DEFAULT_REGION}:{fake_aws.ACCOUNT_ID}:drift-alerts"
+
+
+def tf_resource(tf_type, name, attributes):
+    return {
+        "mode": "managed",
+        "type": tf_type,
+        "name": name,
+        "provider": "provider[\"registry.terraform.io/hashicorp/aws\"]",
+        "instances": [{"schema_version": 1, "attributes": attributes}]
+    }
+
+
+def seed_estate(aws):
+    """A few managed resources, one modified, one deleted and one unmanaged"""
+    yesterday = datetime.utcnow() - timedelta(days=1)
+
+    previous_state = {"version": 4, "serial": 1, "resources": [
+        tf_resource("aws_instance", "web", {"id": "i-0web00000000000001", "instance_type": "t3.micro", "tags": {"Name": "web", "Environment": "prod"}}),
+        tf_resource("aws_s3_bucket", "logs", {"id": "bank-app-logs", "bucket": "bank-app-logs", "tags": {"Environment": "prod"}}),
+    ]}
+    current_state = {"version": 4, "serial": 2, "resources": previous_state["resources"] + [
+        tf_resource("aws_db_instance", "ledger", {"id": "ledger-db", "identifier": "ledger-db", "instance_class": "db.t3.medium", "allocated_storage": 100, "multi_az": True, "tags": {"Environment": "prod"}}),
+        tf_resource("aws_iam_user", "deployer", {"id": "deployer", "name": "deployer", "arn": f"arn:aws:iam::{fake_aws.ACCOUNT_ID}:user/deployer"}),
+    ]}
+    aws.add_bucket(STATE_BUCKET)
+    aws.put_object(STATE_BUCKET, "terraform.tfstate", json.dumps(previous_state))
+    aws.put_object(STATE_BUCKET, "terraform.tfstate", json.dumps(current_state))
+    aws.add_bucket(HISTORY_BUCKET)
+
+    # Modified: instance resized and retagged in the console
+    aws.add_instance("i-0web00000000000001", "t3.large", {"Name": "web", "Environment": "prod", "Owner": "alice"})
+    aws.add_cloudtrail_event("ModifyInstanceAttribute", ["i-0web00000000000001"], user="alice", event_time=yesterday)
+    aws.add_config_item("AWS::EC2::Instance", "i-0web00000000000001", {"instanceType": "t3.micro"}, capture_time=yesterday - timedelta(days=2))
+    aws.add_config_item("AWS::EC2::Instance", "i-0web00000000000001", {"instanceType": "t3.large"}, capture_time=yesterday)
+
+    aws.add_bucket("bank-app-logs", {"Environment": "prod"})
+
+    # Unmanaged: database created by hand
+    aws.add_db_instance("ledger-db", "db.t3.medium", allocated_storage=100, multi_az=True, tags={"Environment": "prod"})
+    aws.add_db_instance("adhoc-reporting", "db.r5.large", tags={"Owner": "bob"})
+    aws.add_cloudtrail_event("CreateDBInstance", ["adhoc-reporting"], user="bob", event_time=yesterday)
+
+    # Deleted: the deployer user was removed outside Terraform
+    aws.add_cloudtrail_event("DeleteUser", ["deployer"], user="root-admin", event_time=yesterday, region="us-east-1")
+
+
+def configure_environment():
+    os.environ.update({
+        "TFSTATE_BUCKET": STATE_BUCKET,
+        "TFSTATE_KEY": "terraform.tfstate",
+        "SNS_TOPIC_ARN": TOPIC_ARN,
+        "BEDROCK_ANALYZER_ARN": f"arn:aws:lambda:{fake_aws.DEFAULT_REGION}:{fake_aws.ACCOUNT_ID}:function:bedrock-drift-analyzer",
+        "HISTORY_BUCKET": HISTORY_BUCKET,
+        "KNOWLEDGE_BASE_ID": "local-kb",
+        "RETRIEVER_ID": "local-retriever",
+    })
+
+
+def invoke(aws, function_name, event):
+    response = aws.client("lambda").invoke(FunctionName=function_name, Payload=json.dumps(event))
+    return json.loads(response["Payload"].read())
+
+
+def run_pipeline(aws):
+    """Run every stage through fake Lambda invokes and collect the results"""
+    results = {}
+    results["full_scan"] = invoke(aws, "iac-drift-checker", {"source": "local"})
+    results["state_change"] = invoke(aws, "iac-drift-checker", {
+        "Records": [{"s3": {"bucket": {"name": STATE_BUCKET}, "object": {"key": "terraform.tfstate"}}}]
+    })
+    results["config_history"] = invoke(aws, "config-history-analyzer", {
+        "resourceId": "i-0web00000000000001",
+        "resourceType": "AWS::EC2::Instance"
+    })
+    results["rag"] = invoke(aws, "drift-rag-query", {"question": "Which resources drifted and who changed them?"})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the drift pipeline against the fake AWS backend")
+    parser.add_argument("--latency", default="{}", help="JSON map of service[.operation] -> seconds of added latency")
+    parser.add_argument("--throttle", default="{}", help="JSON map of service[.operation] -> throttle probability")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for throttle injection")
+    parser.add_argument("--metrics", action="store_true", help="Enable drift_metrics in every handler")
+    parser.add_argument("--profile", action="store_true", help="Profile the run with cProfile")
+    args = parser.parse_args()
+
+    configure_environment()
+    if args.metrics:
+        os.environ["DRIFT_METRICS"] = "true"
+
+    aws = fake_aws.FakeAWS(latency=json.loads(args.latency), throttle_rate=json.loads(args.throttle), seed=args.seed)
+    aws.register_pipeline_functions()
+    seed_estate(aws)
+    aws_backend.set_backend(aws)
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    results = run_pipeline(aws)
+    if profiler:
+        profiler.disable()
+
+    print("\n=== LOCAL PIPELINE RESULTS ===")
+    print(json.dumps({
+        "results": results,
+        "notifications": [{"Subject": m["Subject"], "Length": len(m["Message"])} for m in aws.published],
+        "history_objects": sorted(aws.buckets[HISTORY_BUCKET]["objects"]),
+        "model_calls": len(aws.model_calls),
+        "api_calls": dict(aws.calls),
+        "throttled": dict(aws.throttled)
+    }, indent=2, default=str))
+
+    if profiler:
+        print("\n=== PROFILE (top 25 by cumulative time) ===")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,11 @@
 # This file is maintained automatically by "terraform init".
 # Manual edits may be lost in future updates.
 
+provider "registry.terraform.io/hashicorp/archive" {
+  version     = "2.7.1"
+  constraints = "2.7.1"
+}
+
 provider "registry.terraform.io/hashicorp/aws" {
   version     = "6.3.0"
   constraints = "6.3.0"
@@ -17,6 +17,7 @@ module "lambda" {
   source = "./modules/lambda"
   sns_topic_arn = module.sns.topic_arn
   s3_bucket = module.s3.bucket_name
+  snapshot_bucket = module.s3.snapshot_bucket_name
   # knowledge_base_id = module.knowledge_base.knowledge_base_id
   # retriever_id = module.knowledge_base.retriever_id
 }
@@ -0,0 +1,49 @@
+import os
+import threading
+import boto3
+
+import drift_metrics
+
+
+class Boto3Backend:
+    """Real AWS through boto3"""
+
+    def __init__(self):
+        # The default boto3 session is not safe for concurrent client creation
+        self._lock = threading.Lock()
+
+    def client(self, service_name, **kwargs):
+        with self._lock:
+            return boto3.client(service_name, **kwargs)
+
+
+_backend = None
+
+
+def get_backend():
+    """
+    Backend all handlers create their clients from.
+
+    DRIFT_BACKEND=fake selects the in-process fake from fake_aws, seeded from the
+    JSON file in DRIFT_FAKE_STATE if set. Anything else uses boto3.
+    """
+    global _backend
+    if _backend is None:
+        if os.environ.get("DRIFT_BACKEND", "aws").lower() == "fake":
+            import fake_aws
+            _backend = fake_aws.FakeAWS.from_env()
+        else:
+            _backend = Boto3Backend()
+    return _backend
+
+
+def set_backend(backend):
+    """Swap the backend, returning the previous one"""
+    global _backend
+    previous, _backend = _backend, backend
+    return previous
+
+
+def client(service_name, **kwargs):
+    """Create a client from the active backend that reports to drift_metrics"""
+    return drift_metrics.instrument(get_backend().client(service_name, **kwargs), service_name)
@@ -0,0 +1,315 @@
+"""
+Batch analysis of drift reports that do not need an answer right away.
+
+Reports from scheduled scans are queued in S3 instead of being analyzed one
+synchronous model call at a time. A scheduled run writes the queued prompts as
+JSONL records, submits them as one Bedrock batch inference job and, once the
+job has finished, hands each answer back to the analyzer for the usual history
+and notification delivery. BATCH_PROCESSOR=local replaces the batch job with
+an in-process stand-in that calls the model record by record and writes the
+same output layout.
+
+    manifest = batch_analysis.submit(s3, bucket, batch_analysis.queued(s3, bucket))
+    batch_analysis.poll(s3, bucket, deliver, deadline)
+"""
+import os
+import time
+import uuid
+from datetime import datetime
+
+import aws_backend
+import drift_json
+import drift_prompt
+import drift_severity
+import model_router
+import report_handoff
+
+QUEUE_PREFIX = "drift-snapshots/analysis-queue/"
+BATCH_PREFIX = "drift-snapshots/analysis-batches/"
+
+DEFAULT_POLL_INTERVAL_S = 30
+
+# Batch job statuses after which the job produces no more output
+FINISHED_STATUSES = ("Completed", "PartiallyCompleted", "Failed", "Stopped", "Expired")
+
+
+def batch_bucket():
+    """BATCH_BUCKET, else the history bucket; None when neither is configured"""
+    bucket = os.environ.get("BATCH_BUCKET") or os.environ.get("HISTORY_BUCKET")
+    return bucket if bucket and bucket != "drift-history-bucket" else None
+
+
+def batch_tier():
+    """Model tier for batch jobs; the deep tier by default, batch pricing makes it affordable"""
+    return os.environ.get("BATCH_MODEL_TIER", "deep")
+
+
+def stamp():
+    return datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+
+
+def enqueue(s3, bucket, event):
+    """Queue the report an analyzer event carries, storing inline reports first; returns the queue key"""
+    pointer = event.get("drift_report_ref") or report_handoff.write_report(s3, bucket, event["drift_report"])
+    key = f"{QUEUE_PREFIX}{stamp()}-{uuid.uuid4().hex[:8]}.json"
+    s3.put_object(
+        Bucket=bucket, Key=key, ContentType="application/json",
+        Body=drift_json.dumpb({"drift_report_ref": pointer, "queued_at": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")})
+    )
+    return key
+
+
+def list_keys(s3, bucket, prefix):
+    keys = []
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        keys.extend(obj["Key"] for obj in page.get("Contents", []))
+    return keys
+
+
+def queued(s3, bucket):
+    """Queue keys in the order they were queued, to the second"""
+    return list_keys(s3, bucket, QUEUE_PREFIX)
+
+
+def queued_pointer(s3, bucket, key):
+    """Report pointer held by one queue entry"""
+    return drift_json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read())["drift_report_ref"]
+
+
+def dequeue(s3, bucket, key):
+    """Remove one queue entry once its report has been delivered"""
+    s3.delete_object(Bucket=bucket, Key=key)
+
+
+class BedrockBatchProcessor:
+    """Bedrock batch inference jobs, run by the service role in BATCH_ROLE_ARN"""
+
+    name = "bedrock"
+
+    # Bedrock rejects batch jobs with fewer records
+    min_records = 100
+
+    def __init__(self):
+        self.bedrock = aws_backend.client("bedrock")
+
+    def submit(self, s3, job_name, model_id, input_uri, output_uri):
+        response = self.bedrock.create_model_invocation_job(
+            jobName=job_name,
+            roleArn=os.environ.get("BATCH_ROLE_ARN"),
+            modelId=model_id,
+            inputDataConfig={"s3InputDataConfig": {"s3Uri": input_uri, "s3InputFormat": "JSONL"}},
+            outputDataConfig={"s3OutputDataConfig": {"s3Uri": output_uri}}
+        )
+        return response["jobArn"]
+
+    def status(self, job):
+        return self.bedrock.get_model_invocation_job(jobIdentifier=job)["status"]
+
+
+class LocalBatchProcessor:
+    """
+    Stand-in for a batch job that runs every record through invoke_model when
+    submitted, writing the same .jsonl.out records a Bedrock job would.
+    """
+
+    name = "local"
+    min_records = 1
+
+    def submit(self, s3, job_name, model_id, input_uri, output_uri):
+        bucket, key = input_uri[len("s3://"):].split("/", 1)
+        records = s3.get_object(Bucket=bucket, Key=key)["Body"].read().splitlines()
+        config = dict(model_router.tier_config(batch_tier()), model_id=model_id)
+        lines = []
+        for line in records:
+            record = drift_json.loads(line)
+            result = {"recordId": record["recordId"], "modelInput": record["modelInput"]}
+            try:
+                text = model_router.invoke(config, record["modelInput"]["messages"][0]["content"], 60)
+                result["modelOutput"] = {"content": [{"type": "text", "text": text}]}
+            except Exception as e:
+                result["error"] = {"errorMessage": str(e)}
+            lines.append(drift_json.dumpb(result))
+        out_bucket, out_prefix = output_uri[len("s3://"):].split("/", 1)
+        s3.put_object(Bucket=out_bucket, Key=f"{out_prefix}{job_name}/{key.rsplit('/', 1)[-1]}.out", Body=b"\n".join(lines) + b"\n")
+        return job_name
+
+    def status(self, job):
+        return "Completed"
+
+
+PROCESSORS = {
+    "bedrock": BedrockBatchProcessor,
+    "local": LocalBatchProcessor
+}
+
+
+def processor(name=None):
+    """BATCH_PROCESSOR selects bedrock (the default) or local"""
+    return PROCESSORS[(name or os.environ.get("BATCH_PROCESSOR", "bedrock")).lower()]()
+
+
+def manifest_key(batch_id):
+    return f"{BATCH_PREFIX}{batch_id}/manifest.json"
+
+
+def save_manifest(s3, bucket, manifest):
+    s3.put_object(Bucket=bucket, Key=manifest_key(manifest["batch_id"]), Body=drift_json.dumpb(manifest), ContentType="application/json")
+
+
+def delivered_prefix(batch_id):
+    return f"{BATCH_PREFIX}{batch_id}/delivered/"
+
+
+def delivered(s3, bucket, manifest):
+    """Record ids of a batch already delivered, by an earlier poll that did not finish the batch"""
+    prefix = delivered_prefix(manifest["batch_id"])
+    return {key[len(prefix):] for key in list_keys(s3, bucket, prefix)}
+
+
+def mark_delivered(s3, bucket, manifest, record_id):
+    """One empty marker per record, so progress costs one small write instead of a manifest rewrite"""
+    s3.put_object(Bucket=bucket, Key=f"{delivered_prefix(manifest['batch_id'])}{record_id}", Body=b"")
+
+
+def submit(s3, bucket, keys, batch_processor=None):
+    """
+    Submit the queued reports under keys as one batch job and return its manifest.
+
+    Each report becomes one JSONL record with the same prompt a synchronous
+    analysis would send. The manifest maps record ids back to report pointers;
+    queue entries are only removed once the job and manifest exist, and entries
+    whose report cannot be read stay queued.
+    """
+    batch_processor = batch_processor or processor()
+    batch_id = f"{stamp()}-{uuid.uuid4().hex[:8]}"
+    config = model_router.tier_config(batch_tier())
+    records = {}
+    lines = []
+    submitted = []
+    for key in keys:
+        try:
+            pointer = queued_pointer(s3, bucket, key)
+            drift_report = report_handoff.read_report(s3, pointer)
+            assessment = drift_report.get("severity") or drift_severity.assess(drift_report)
+            prompt, _ = drift_prompt.build_prompt(drift_report, assessment)
+        except Exception as e:
+            # Left in the queue for the next run rather than holding back the whole batch
+            print(f"Error reading queued drift report {key}: {e}")
+            continue
+        submitted.append(key)
+        record_id = f"{len(records):08d}"
+        records[record_id] = pointer
+        lines.append(drift_json.dumpb({"recordId": record_id, "modelInput": model_router.request_body(config, prompt)}))
+
+    if len(records) < batch_processor.min_records:
+        raise ValueError(f"Only {len(records)} of {len(keys)} queued drift reports could be read, a batch job needs {batch_processor.min_records}")
+
+    input_key = f"{BATCH_PREFIX}{batch_id}/input.jsonl"
+    output_prefix = f"{BATCH_PREFIX}{batch_id}/output/"
+    s3.put_object(Bucket=bucket, Key=input_key, Body=b"\n".join(lines) + b"\n", ContentType="application/jsonl")
+    job = batch_processor.submit(s3, f"drift-analysis-{batch_id}", config["model_id"], f"s3://{bucket}/{input_key}", f"s3://{bucket}/{output_prefix}")
+
+    manifest = {
+        "batch_id": batch_id,
+        "job": job,
+        "processor": batch_processor.name,
+        "model_id": config["model_id"],
+        "status": "submitted",
+        "submitted_at": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "output_prefix": output_prefix,
+        "records": records
+    }
+    save_manifest(s3, bucket, manifest)
+    for key in submitted:
+        dequeue(s3, bucket, key)
+    print(f"Submitted {len(records)} drift reports as batch {batch_id} ({job})")
+    return manifest
+
+
+def pending(s3, bucket):
+    """Manifests of batches submitted but not yet delivered"""
+    manifests = []
+    for key in list_keys(s3, bucket, BATCH_PREFIX):
+        if key.endswith("/manifest.json"):
+            manifest = drift_json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+            if manifest["status"] == "submitted":
+                manifests.append(manifest)
+    return manifests
+
+
+def read_outputs(s3, bucket, manifest):
+    """Answer text by record id; records that failed are left out"""
+    answers = {}
+    for key in list_keys(s3, bucket, manifest["output_prefix"]):
+        if not key.endswith(".jsonl.out"):
+            continue
+        for line in s3.get_object(Bucket=bucket, Key=key)["Body"].read().splitlines():
+            if not line.strip():
+                continue
+            record = drift_json.loads(line)
+            if record.get("modelOutput"):
+                answers[record["recordId"]] = record["modelOutput"]["content"][0]["text"]
+            else:
+                print(f"Batch {manifest['batch_id']} record {record.get('recordId')} failed: {record.get('error')}")
+    return answers
+
+
+def collect(s3, bucket, manifest, deliver, batch_processor=None):
+    """
+    Deliver a finished batch through deliver(record_id, pointer, analysis, model_id).
+
+    Records without an answer, and every record of a failed job, are delivered
+    with analysis None so the caller sends its template report. Each delivered
+    record is marked as it goes, so a run that stops partway through (a Lambda
+    timeout) is picked up by the next poll without sending anything twice.
+    Returns the job status, or None while the job is still running.
+    """
+    batch_processor = batch_processor or processor(manifest["processor"])
+    status = batch_processor.status(manifest["job"])
+    if status not in FINISHED_STATUSES:
+        return None
+
+    answers = read_outputs(s3, bucket, manifest) if status in ("Completed", "PartiallyCompleted") else {}
+    done = delivered(s3, bucket, manifest)
+    if done:
+        print(f"Batch {manifest['batch_id']}: {len(done)} records were already delivered")
+    for record_id, pointer in manifest["records"].items():
+        if record_id in done:
+            continue
+        try:
+            deliver(record_id, pointer, answers.get(record_id), manifest["model_id"] if record_id in answers else None)
+        except Exception as e:
+            print(f"Error delivering batch {manifest['batch_id']} record {record_id}: {e}")
+            continue
+        mark_delivered(s3, bucket, manifest, record_id)
+    manifest["status"] = "delivered" if status in ("Completed", "PartiallyCompleted") else "failed"
+    manifest["job_status"] = status
+    save_manifest(s3, bucket, manifest)
+    print(f"Batch {manifest['batch_id']} {status}: {len(answers)} of {len(manifest['records'])} records answered")
+    return status
+
+
+def poll(s3, bucket, deliver, deadline=None):
+    """
+    Deliver pending batches as their jobs finish, checking every
+    BATCH_POLL_INTERVAL_S until none are left or the deadline passes.
+
+    Returns {"delivered": [batch ids], "pending": [batch ids]}.
+    """
+    interval = float(os.environ.get("BATCH_POLL_INTERVAL_S", DEFAULT_POLL_INTERVAL_S))
+    manifests = pending(s3, bucket)
+    delivered = []
+    while manifests:
+        for manifest in list(manifests):
+            try:
+                finished = collect(s3, bucket, manifest, deliver)
+            except Exception as e:
+                print(f"Error checking batch {manifest['batch_id']}: {e}")
+                finished = None
+            if finished:
+                manifests.remove(manifest)
+                delivered.append(manifest["batch_id"])
+        if not manifests or deadline is None or time.monotonic() + interval >= deadline:
+            break
+        time.sleep(interval)
+    return {"delivered": delivered, "pending": [m["batch_id"] for m in manifests]}
@@ -1,8 +1,13 @@
-import json
-import boto3
 import os
 from datetime import datetime, timedelta
 
+import aws_backend
+import drift_json
+import drift_metrics
+import drift_profiler
+
+@drift_profiler.profiled("config-history-analyzer")
+@drift_metrics.instrumented("config-history-analyzer")
 def lambda_handler(event, context):
     """Get configuration history for a resource"""
     
@@ -17,18 +22,21 @@ def lambda_handler(event, context):
         }
     
     # Initialize AWS Config client
-    config = boto3.client('config')
-    cloudtrail = boto3.client('cloudtrail')
+    config = aws_backend.client('config')
+    cloudtrail = aws_backend.client('cloudtrail')
     
     try:
         # Get configuration history
-        history = get_config_history(config, resource_type, resource_id)
+        with drift_metrics.span("config_history"):
+            history = get_config_history(config, resource_type, resource_id)
         
         # Get CloudTrail events for the resource
-        events = get_cloudtrail_events(cloudtrail, resource_id)
+        with drift_metrics.span("cloudtrail_events"):
+            events = get_cloudtrail_events(cloudtrail, resource_id)
         
         # Correlate Config changes with CloudTrail events
-        correlated_changes = correlate_changes(history, events)
+        with drift_metrics.span("correlate"):
+            correlated_changes = correlate_changes(history, events)
         
         return {
             'statusCode': 200,
@@ -62,7 +70,7 @@ def get_config_history(config_client, resource_type, resource_id):
                 'version': item.get('version'),
                 'configurationItemStatus': item.get('configurationItemStatus'),
                 'configurationStateId': item.get('configurationStateId'),
-                'captureTime': item.get('captureTime').strftime('%Y-%m-%d %H:%M:%S') if item.get('captureTime') else None,
+                'captureTime': item.get('configurationItemCaptureTime').strftime('%Y-%m-%d %H:%M:%S') if item.get('configurationItemCaptureTime') else None,
                 'configuration': item.get('configuration')
             })
         
@@ -90,7 +98,7 @@ def get_cloudtrail_events(cloudtrail_client, resource_id):
         
         events = []
         for event in response.get('Events', []):
-            event_detail = json.loads(event.get('CloudTrailEvent', '{}'))
+            event_detail = drift_json.loads(event.get('CloudTrailEvent') or '{}')
             events.append({
                 'eventName': event.get('EventName'),
                 'eventTime': event.get('EventTime').strftime('%Y-%m-%d %H:%M:%S') if event.get('EventTime') else None,
@@ -1,12 +1,41 @@
-import json
-import boto3
 import os
 from datetime import datetime, timedelta
+from urllib.parse import unquote_plus
 
+import aws_backend
+import drift_json
+import drift_metrics
+import drift_profiler
+import drift_render
+import drift_replay
+import drift_severity
+import drift_triage
+import idempotency
+import ignore_rules
+import inventory_snapshot
+import report_handoff
+import resource_identity
+import resource_records
+import scan_checkpoint
+import scan_shards
+import state_history
+import tag_index
+import terraform_codegen
+
+@drift_profiler.profiled("iac-drift-checker")
+@drift_metrics.instrumented("iac-drift-checker")
 def lambda_handler(event, context):
     """Main handler for drift detection"""
-    print(f"Received event: {json.dumps(event)}")
+    print(f"Received event: {drift_json.dumps(event)}")
     
+    # The same upload or change can arrive more than once (S3 notification and EventBridge)
+    identity = idempotency.event_identity(event)
+    if identity:
+        return idempotency.run_once(identity, lambda: route_event(event, context))
+    return route_event(event, context)
+
+def route_event(event, context):
+    """Dispatch an event to its handler"""
     # Check if this is a Config event from EventBridge
     if event.get("detail-type") == "Config Configuration Item Change" and event.get("detail") and event["detail"].get("configurationItem"):
         print("Processing AWS Config change event from EventBridge")
@@ -45,215 +74,494 @@ def lambda_handler(event, context):
             }
         return {"state_changed": False}
     
-    # If it's a scheduled event or manual invocation, run full drift detection
-    print("Running full drift detection")
-    return run_full_drift_detection()
+    # Check if this replays drift at past points in time
+    if event.get("replay_at"):
+        print("Replaying drift from state versions and Config history")
+        return replay_drift(event["replay_at"])
+    
+    # Check if this is a worker invocation for one shard of a sharded scan
+    if event.get("scan_shard"):
+        print(f"Collecting scan shard {event['scan_shard']['shard_id']}")
+        return scan_shards.run_worker(event, INVENTORY_PAGES)
+    
+    # Check if this continues a checkpointed inventory scan
+    if event.get("scan_id"):
+        print(f"Continuing checkpointed scan {event['scan_id']}")
+        return run_full_drift_detection(context, scan_id=event["scan_id"], analysis_mode=scan_analysis_mode(event))
+    
+    # Check if this continues a scan that ran out of time
+    if event.get("continuation_token"):
+        print("Resuming drift detection from continuation token")
+        return run_full_drift_detection(context, event["continuation_token"], analysis_mode=scan_analysis_mode(event))
     
     # If it's a scheduled event or manual invocation, run full drift detection
     print("Running full drift detection")
-    return run_full_drift_detection()
+    return run_full_drift_detection(context, analysis_mode=scan_analysis_mode(event))
 
-def run_full_drift_detection():
-    """Run comprehensive drift detection"""
-    s3 = boto3.client("s3")
-    sns = boto3.client("sns")
-    lambda_client = boto3.client("lambda")
+def scan_analysis_mode(event):
+    """
+    "batch" for scheduled scans when ANALYSIS_MODE=batch, else "realtime".
     
-    bucket = os.environ.get("TFSTATE_BUCKET")
-    key = os.environ.get("TFSTATE_KEY", "terraform.tfstate")
-    sns_topic = os.environ.get("SNS_TOPIC_ARN")
-    bedrock_analyzer_arn = os.environ.get("BEDROCK_ANALYZER_ARN")
+    An "analysis_mode" in the event wins, so {"analysis_mode": "realtime"} forces an
+    immediate analysis and continuations keep the mode of the scan they continue.
+    """
+    if event.get("analysis_mode") in ("realtime", "batch"):
+        return event["analysis_mode"]
+    scheduled = event.get("source") == "aws.events" or event.get("detail-type") == "Scheduled Event"
+    return "batch" if scheduled and os.environ.get("ANALYSIS_MODE") == "batch" else "realtime"
+
+def run_full_drift_detection(context=None, continuation_token=None, scan_id=None, analysis_mode="realtime"):
+    """
+    Run comprehensive drift detection.
+    
+    Inside Lambda the inventory is either fanned out over SCAN_WORKERS parallel
+    worker invocations, or collected page by page with a checkpoint after each
+    page so that a scan that does not fit in one invocation continues in the next.
+    Drift is attributed in priority order until the invocation is close to its
+    deadline; anything left over is returned as a continuation token. With
+    analysis_mode "batch", drift below the urgent severity joins the next batch job.
+    
+    Each of these modes lives in its own helper below; this function only
+    sequences them.
+    """
+    s3 = aws_backend.client("s3")
     
     try:
-        # Load Terraform state
-        state_obj = s3.get_object(Bucket=bucket, Key=key)
-        tfstate = json.loads(state_obj["Body"].read())
-        
-        # Extract managed resources
-        managed_resources = extract_managed_resources(tfstate)
-        
-        # Get actual resources
-        actual_resources = get_actual_resources()
-        
-        # Find drift
-        unmanaged_resources = []
-        deleted_resources = []
-        modified_resources = []
-        
-        # 1. Unmanaged resources (not in Terraform)
-        for resource_id, details in actual_resources.items():
-            if resource_id not in managed_resources:
-                # Get who created this resource
-                creator_info = get_change_author(resource_id, details["type"])
-                unmanaged_resources.append({
-                    "id": resource_id,
-                    "type": details["type"],
-                    "created_by": creator_info
-                })
+        # A resumed triage works on the inventory its first invocation saved in the snapshot
+        token_payload = drift_triage.decode_token(continuation_token) if continuation_token else None
+        snapshot_bucket = inventory_snapshot.snapshot_bucket()
         
-        # 2. Deleted resources (in Terraform but not in AWS)
-        for resource_id, details in managed_resources.items():
-            if resource_id not in actual_resources:
-                # Get who deleted this resource
-                deleter_info = get_change_author(resource_id, details["type"])
-                deleted_resources.append({
-                    "id": resource_id,
-                    "type": details["type"],
-                    "deleted_by": deleter_info
-                })
+        actual_resources, scan, store, sharded_scan = scan_inventory(context, scan_id, token_payload, snapshot_bucket)
+        if actual_resources is None:
+            # Out of time: hand the rest of the scan to the next invocation
+            if os.environ.get("SCAN_SELF_INVOKE", "true").lower() == "true":
+                continue_scan(context, scan["scan_id"], analysis_mode)
+            return {"scan_in_progress": True, "scan_id": scan["scan_id"], "progress": scan_checkpoint.progress(scan)}
         
-        # 3. Modified resources (attributes differ between Terraform and actual)
-        for resource_id, tf_details in managed_resources.items():
-            if resource_id in actual_resources:
-                actual_details = actual_resources[resource_id]
-                
-                # Compare attributes
-                changes = []
-                
-                # For EC2 instances
-                if tf_details["type"] == "aws_instance" and actual_details["type"] == "EC2":
-                    tf_attrs = tf_details["attributes"]
-                    actual_attrs = actual_details["attributes"]
-                    
-                    # Check instance type
-                    if tf_attrs.get("instance_type") != actual_attrs.get("instance_type"):
-                        changes.append({
-                            "attribute": "instance_type",
-                            "expected": tf_attrs.get("instance_type"),
-                            "actual": actual_attrs.get("instance_type")
-                        })
-                    
-                    # Check tags
-                    if tf_attrs.get("tags") != actual_attrs.get("tags"):
-                        changes.append({
-                            "attribute": "tags",
-                            "expected": tf_attrs.get("tags"),
-                            "actual": actual_attrs.get("tags")
-                        })
-                
-                # For S3 buckets
-                elif tf_details["type"] == "aws_s3_bucket" and actual_details["type"] == "S3":
-                    tf_attrs = tf_details["attributes"]
-                    actual_attrs = actual_details["attributes"]
-                    
-                    # Check tags
-                    if tf_attrs.get("tags") != actual_attrs.get("tags"):
-                        changes.append({
-                            "attribute": "tags",
-                            "expected": tf_attrs.get("tags"),
-                            "actual": actual_attrs.get("tags")
-                        })
-                
-                # For RDS instances
-                elif tf_details["type"] == "aws_db_instance" and actual_details["type"] == "RDS":
-                    tf_attrs = tf_details["attributes"]
-                    actual_attrs = actual_details["attributes"]
-                    
-                    # Check instance class
-                    if tf_attrs.get("instance_class") != actual_attrs.get("instance_class"):
-                        changes.append({
-                            "attribute": "instance_class",
-                            "expected": tf_attrs.get("instance_class"),
-                            "actual": actual_attrs.get("instance_class")
-                        })
-                    
-                    # Check storage size
-                    if tf_attrs.get("allocated_storage") != actual_attrs.get("storage_size"):
-                        changes.append({
-                            "attribute": "allocated_storage",
-                            "expected": tf_attrs.get("allocated_storage"),
-                            "actual": actual_attrs.get("storage_size")
-                        })
-                    
-                    # Check Multi-AZ
-                    if tf_attrs.get("multi_az") != actual_attrs.get("multi_az"):
-                        changes.append({
-                            "attribute": "multi_az",
-                            "expected": tf_attrs.get("multi_az"),
-                            "actual": actual_attrs.get("multi_az")
-                        })
-                    
-                    # Check tags
-                    if tf_attrs.get("tags") != actual_attrs.get("tags"):
-                        changes.append({
-                            "attribute": "tags",
-                            "expected": tf_attrs.get("tags"),
-                            "actual": actual_attrs.get("tags")
-                        })
-                
-                if changes:
-                    # Get who made the change
-                    modifier_info = get_change_author(resource_id, actual_details["type"])
-                    
-                    modified_resources.append({
-                        "id": resource_id,
-                        "type": tf_details["type"],
-                        "changes": changes,
-                        "modified_by": modifier_info
-                    })
+        managed_resources, unmanaged_resources, deleted_resources, modified_resources, ignored = detect_drift(s3, actual_resources)
+        
+        # Compare with the previous inventory snapshot so only new drift is attributed and analyzed.
+        # A resumed scan already did this and carries its remaining work in the token.
+        if token_payload:
+            scan_time = token_payload["scan_time"]
+        else:
+            scan_time = scan["scan_time"] if scan else datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+        new_unmanaged, new_deleted, new_modified = unmanaged_resources, deleted_resources, modified_resources
+        delta = None
+        if snapshot_bucket and token_payload is None:
+            new_unmanaged, new_deleted, new_modified, delta = new_drift_since_snapshot(
+                snapshot_bucket, actual_resources, unmanaged_resources, deleted_resources, modified_resources
+            )
+        
+        # Find out who caused the new drift, most critical resources first
+        frequency = drift_triage.load_frequency(snapshot_bucket) if snapshot_bucket else {}
+        processed, remaining = triage_drift(
+            context, token_payload, frequency, new_unmanaged, new_deleted, new_modified, managed_resources, actual_resources
+        )
+        new_unmanaged, new_deleted, new_modified = drift_triage.split_by_kind(processed)
         
-        # Generate report
+        result = {"drift_detected": False}
+        
+        # Report and route the new drift
         drift_found = unmanaged_resources or deleted_resources or modified_resources
+        if new_unmanaged or new_deleted or new_modified:
+            result.update(report_new_drift(
+                s3, snapshot_bucket, scan, analysis_mode, new_unmanaged, new_deleted, new_modified, unmanaged_resources, actual_resources
+            ))
+        elif drift_found:
+            print("All drift was already reported by a previous scan")
+        
         if drift_found:
-            # Generate technical summary for logging
-            summary = generate_summary(unmanaged_resources, deleted_resources, modified_resources)
-            
-            # Call Bedrock analyzer for human-readable analysis
-            if bedrock_analyzer_arn:
-                try:
-                    # Prepare detailed drift report for Bedrock
-                    drift_report = {
-                        "unmanaged_resources": unmanaged_resources,
-                        "deleted_resources": deleted_resources,
-                        "modified_resources": modified_resources,
-                        "summary": summary,
-                        "timestamp": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
-                    }
-                    
-                    print(f"Invoking Bedrock analyzer: {bedrock_analyzer_arn}")
-                    # Invoke Bedrock analyzer asynchronously
-                    response = lambda_client.invoke(
-                        FunctionName=bedrock_analyzer_arn,
-                        InvocationType='Event',  # Asynchronous
-                        Payload=json.dumps({
-                            "drift_report": drift_report
-                        })
-                    )
-                    print(f"Bedrock analyzer invoked: {response}")
-                except Exception as e:
-                    print(f"Error invoking Bedrock analyzer: {e}")
-                    # Fallback to direct SNS notification if Bedrock fails
-                    sns.publish(TopicArn=sns_topic, Subject="Infrastructure Drift Detected (Bedrock Failed)", Message=summary)
-            else:
-                # Fallback if Bedrock analyzer ARN is not configured
-                sns.publish(TopicArn=sns_topic, Subject="Infrastructure Drift Detected", Message=summary)
-            
-            return {
+            result.update({
                 "drift_detected": True,
                 "unmanaged_count": len(unmanaged_resources),
                 "deleted_count": len(deleted_resources),
                 "modified_count": len(modified_resources),
-                "summary": summary
-            }
+                "new_drift_count": len(new_unmanaged) + len(new_deleted) + len(new_modified)
+            })
+        
+        if ignored:
+            result["ignored"] = ignored
+        
+        if remaining:
+            result.update({
+                "partial": True,
+                "remaining_count": len(remaining),
+                "continuation_token": drift_triage.encode_token(remaining, scan_time)
+            })
         
-        return {"drift_detected": False}
+        if snapshot_bucket:
+            record_scan(
+                snapshot_bucket, token_payload, scan_time, frequency, processed, remaining, actual_resources,
+                (unmanaged_resources, deleted_resources, modified_resources), (new_unmanaged, new_deleted, new_modified)
+            )
+            if delta is not None:
+                result["inventory_delta"] = {kind: len(ids) for kind, ids in delta.items()}
+        
+        if sharded_scan:
+            result["scan"] = sharded_scan
+        
+        if scan:
+            result["scan"] = scan_checkpoint.progress(scan)
+            try:
+                scan_checkpoint.finish_scan(store, scan)
+            except Exception as e:
+                print(f"Error removing scan checkpoint: {e}")
+        
+        # Hand the rest of the triage to the next invocation once the snapshot it resumes from is saved,
+        # unless this one made no progress
+        if remaining and processed and context is not None and os.environ.get("SCAN_SELF_INVOKE", "true").lower() == "true":
+            continue_triage(context, result["continuation_token"], analysis_mode)
+        
+        return result
         
     except Exception as e:
         return {"error": str(e)}
 
+def scan_inventory(context, scan_id, token_payload, snapshot_bucket):
+    """
+    Actual resources for this invocation: (actual_resources, scan, store, sharded_scan).
+    
+    A resumed triage reuses the inventory saved in the snapshot by its first
+    invocation. Otherwise the scan is sharded over worker invocations (SCAN_WORKERS),
+    checkpointed page by page under Lambda, or collected in one go.
+    actual_resources is None when a checkpointed scan ran out of time; scan
+    then holds its state for the next invocation.
+    """
+    saved_snapshot = None
+    if token_payload and snapshot_bucket:
+        saved_snapshot = inventory_snapshot.load_latest_snapshot(snapshot_bucket)
+        if saved_snapshot and saved_snapshot["scan_time"] != token_payload["scan_time"]:
+            saved_snapshot = None
+    
+    scan = None
+    sharded_scan = None
+    workers = int(os.environ.get("SCAN_WORKERS", 0))
+    store = scan_checkpoint.checkpoint_store() if (context is not None or scan_id) and token_payload is None else None
+    with drift_metrics.span("inventory"):
+        if saved_snapshot:
+            actual_resources = saved_snapshot["resources"]
+        elif workers > 0 and context is not None and not scan_id and not token_payload and snapshot_bucket:
+            actual_resources, sharded_scan = scan_shards.coordinate(
+                own_function_name(context), snapshot_bucket, INVENTORY_PAGES, workers
+            )
+        elif store is None:
+            actual_resources = get_actual_resources()
+        else:
+            scan = scan_checkpoint.load_scan(store, scan_id) if scan_id else scan_checkpoint.new_scan(INVENTORY_PAGES)
+            actual_resources = scan_checkpoint.run_slice(store, scan, INVENTORY_PAGES, scan_checkpoint.deadline_from_context(context))
+    return actual_resources, scan, store, sharded_scan
+
+def detect_drift(s3, actual_resources):
+    """
+    Diff the Terraform state against the inventory and drop known, benign drift:
+    (managed_resources, unmanaged, deleted, modified, ignored).
+    """
+    bucket = os.environ.get("TFSTATE_BUCKET")
+    key = os.environ.get("TFSTATE_KEY", "terraform.tfstate")
+    
+    # Load Terraform state
+    with drift_metrics.span("state_load"):
+        state_obj = s3.get_object(Bucket=bucket, Key=key)
+        
+        # Extract managed resources; the parsed state is released right after
+        managed_resources = extract_managed_resources(drift_json.loads(state_obj["Body"].read()))
+    
+    # Find drift
+    with drift_metrics.span("drift_diff"):
+        unmanaged_resources, deleted_resources, modified_resources = diff_resources(managed_resources, actual_resources)
+    
+    # Drop known, benign drift before anything is spent on it
+    unmanaged_resources, deleted_resources, modified_resources, ignored = ignore_rules.apply(
+        ignore_rules.load_rules(), unmanaged_resources, deleted_resources, modified_resources, managed_resources, actual_resources
+    )
+    return managed_resources, unmanaged_resources, deleted_resources, modified_resources, ignored
+
+def new_drift_since_snapshot(snapshot_bucket, actual_resources, unmanaged_resources, deleted_resources, modified_resources):
+    """
+    Drift that is new since the last inventory snapshot: (unmanaged, deleted, modified, delta).
+    
+    If the snapshot cannot be read, all drift counts as new and delta is None.
+    """
+    with drift_metrics.span("snapshot_delta"):
+        try:
+            previous_snapshot = inventory_snapshot.load_latest_snapshot(snapshot_bucket)
+            delta = inventory_snapshot.compute_delta(previous_snapshot["resources"] if previous_snapshot else {}, actual_resources)
+            new_unmanaged, new_deleted, new_modified = inventory_snapshot.select_new_drift(
+                previous_snapshot, delta, unmanaged_resources, deleted_resources, modified_resources
+            )
+            return new_unmanaged, new_deleted, new_modified, delta
+        except Exception as e:
+            print(f"Error comparing with inventory snapshot, reporting all drift: {e}")
+            return unmanaged_resources, deleted_resources, modified_resources, None
+
+def triage_drift(context, token_payload, frequency, new_unmanaged, new_deleted, new_modified, managed_resources, actual_resources):
+    """Attribute new drift in priority order until the deadline: (processed, remaining)"""
+    queue = drift_triage.build_queue(new_unmanaged, new_deleted, new_modified, managed_resources, actual_resources, frequency)
+    if token_payload:
+        queue = drift_triage.resume_queue(queue, token_payload)
+    with drift_metrics.span("triage"):
+        return drift_triage.run_queue(queue, attribute_resource, drift_triage.deadline_from_context(context))
+
+def write_remediation_file(s3, snapshot_bucket, scan, unmanaged_resources, actual_resources):
+    """Terraform that adopts every unmanaged resource, written from its live attributes; its S3 URI or None"""
+    with drift_metrics.span("codegen"):
+        try:
+            remediation_key = terraform_codegen.remediation_key(scan["scan_time"] if scan else None)
+            drift_render.stream_to_s3(
+                s3, snapshot_bucket, remediation_key,
+                terraform_codegen.generate_import_file(unmanaged_resources, actual_resources),
+                content_type="text/plain"
+            )
+            return f"s3://{snapshot_bucket}/{remediation_key}"
+        except Exception as e:
+            print(f"Error generating import blocks: {e}")
+            return None
+
+def report_new_drift(s3, snapshot_bucket, scan, analysis_mode, new_unmanaged, new_deleted, new_modified, unmanaged_resources, actual_resources):
+    """Build the drift report for new drift and send it on by severity; returns the result fields it adds"""
+    result = {}
+    
+    # Generate technical summary for logging
+    summary = generate_summary(new_unmanaged, new_deleted, new_modified)
+    
+    drift_report = {
+        "unmanaged_resources": new_unmanaged,
+        "deleted_resources": new_deleted,
+        "modified_resources": new_modified,
+        "summary": summary,
+        "timestamp": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
+    }
+    
+    if new_unmanaged and snapshot_bucket:
+        remediation_file = write_remediation_file(s3, snapshot_bucket, scan, unmanaged_resources, actual_resources)
+        if remediation_file:
+            drift_report["remediation_file"] = result["remediation_file"] = remediation_file
+    
+    assessment = drift_severity.assess(drift_report)
+    drift_report["severity"] = assessment
+    severity = assessment["severity"]
+    print(f"Drift severity: {severity} (score {assessment['score']})")
+    
+    notify_drift(s3, snapshot_bucket, scan, analysis_mode, drift_report, severity)
+    
+    result["severity"] = severity
+    result["summary"] = summary
+    return result
+
+def notify_drift(s3, snapshot_bucket, scan, analysis_mode, drift_report, severity):
+    """
+    Send a drift report on: severe drift to the Bedrock analyzer (queued for the
+    next batch job in batch mode unless urgent), the rest as a plain SNS digest.
+    """
+    sns = aws_backend.client("sns")
+    sns_topic = os.environ.get("SNS_TOPIC_ARN")
+    bedrock_analyzer_arn = os.environ.get("BEDROCK_ANALYZER_ARN")
+    summary = drift_report["summary"]
+    
+    # Only severe drift is worth a Bedrock analysis and an immediate alert
+    if bedrock_analyzer_arn and drift_severity.at_least(severity, drift_severity.analysis_threshold()):
+        try:
+            print(f"Invoking Bedrock analyzer: {bedrock_analyzer_arn}")
+            # Pass the report by reference; an async invoke payload is capped at 256 KB
+            payload = {"drift_report": drift_report}
+            if snapshot_bucket:
+                with drift_metrics.span("report_handoff"):
+                    payload = {"drift_report_ref": report_handoff.write_report(s3, snapshot_bucket, drift_report, scan["scan_time"] if scan else None)}
+            # In batch mode only urgent drift is analyzed now, the rest joins the next batch job
+            if analysis_mode == "batch" and not drift_severity.at_least(severity, drift_severity.urgent_threshold()):
+                payload["analysis_mode"] = "batch"
+            # Invoke Bedrock analyzer asynchronously
+            with drift_metrics.span("analyzer_invoke"):
+                response = aws_backend.client("lambda").invoke(
+                    FunctionName=bedrock_analyzer_arn,
+                    InvocationType='Event',  # Asynchronous
+                    Payload=drift_json.dumpb(payload)
+                )
+            print(f"Bedrock analyzer invoked: {response}")
+        except Exception as e:
+            print(f"Error invoking Bedrock analyzer: {e}")
+            # Fallback to direct SNS notification if Bedrock fails
+            sns.publish(TopicArn=sns_topic, Subject=f"[{severity}] Infrastructure Drift Detected (Bedrock Failed)", Message=summary)
+    elif bedrock_analyzer_arn:
+        # Lower severity drift goes out as a plain digest without a model call
+        total = len(drift_report["unmanaged_resources"]) + len(drift_report["deleted_resources"]) + len(drift_report["modified_resources"])
+        sns.publish(TopicArn=sns_topic, Subject=f"{drift_severity.ICONS[severity]} [{severity}] DriftGuard Digest: {total} drifted resources", Message=summary)
+    else:
+        # Fallback if Bedrock analyzer ARN is not configured
+        sns.publish(TopicArn=sns_topic, Subject=f"[{severity}] Infrastructure Drift Detected", Message=summary)
+
+def record_scan(snapshot_bucket, token_payload, scan_time, frequency, processed, remaining, actual_resources, drift, new_drift):
+    """
+    Persist what the next scan compares against: drift frequencies, and this
+    scan's inventory snapshot or, for a resumed triage, what it reported.
+    
+    Drift still waiting in the triage queue is left out of the snapshot, so it
+    counts as new until it has been reported. Failures are logged, not raised.
+    """
+    if processed:
+        try:
+            drift_triage.save_frequency(snapshot_bucket, frequency, processed)
+        except Exception as e:
+            print(f"Error saving drift frequency: {e}")
+    
+    if token_payload is None:
+        pending = {f"{kind}:{resource['id']}" for kind, resource in remaining}
+        with drift_metrics.span("snapshot_save"):
+            try:
+                inventory_snapshot.save_snapshot(
+                    snapshot_bucket, actual_resources,
+                    [k for k in inventory_snapshot.drift_keys(*drift) if k not in pending],
+                    scan_time
+                )
+            except Exception as e:
+                print(f"Error saving inventory snapshot: {e}")
+    elif processed:
+        # A resumed triage records what it reported in the snapshot the first invocation saved
+        try:
+            inventory_snapshot.mark_reported(snapshot_bucket, inventory_snapshot.drift_keys(*new_drift))
+        except Exception as e:
+            print(f"Error marking drift as reported: {e}")
+
+def own_function_name(context):
+    """Name or ARN to invoke this function again"""
+    return getattr(context, "invoked_function_arn", None) or os.environ.get("AWS_LAMBDA_FUNCTION_NAME")
+
+def continue_scan(context, scan_id, analysis_mode="realtime"):
+    """Invoke this function again asynchronously to continue a checkpointed scan"""
+    response = aws_backend.client("lambda").invoke(
+        FunctionName=own_function_name(context),
+        InvocationType="Event",
+        Payload=drift_json.dumpb({"scan_id": scan_id, "analysis_mode": analysis_mode})
+    )
+    print(f"Scan {scan_id} continues in a new invocation: {response.get('StatusCode')}")
+
+def continue_triage(context, continuation_token, analysis_mode="realtime"):
+    """Invoke this function again asynchronously to attribute the drift triage left over"""
+    response = aws_backend.client("lambda").invoke(
+        FunctionName=own_function_name(context),
+        InvocationType="Event",
+        Payload=drift_json.dumpb({"continuation_token": continuation_token, "analysis_mode": analysis_mode})
+    )
+    print(f"Drift triage continues in a new invocation: {response.get('StatusCode')}")
+
+def find_drift(managed_resources, actual_resources):
+    """Diff Terraform-managed resources against actual AWS resources and attribute each change"""
+    unmanaged_resources, deleted_resources, modified_resources = diff_resources(managed_resources, actual_resources)
+    attribute_drift(unmanaged_resources, deleted_resources, modified_resources)
+    return unmanaged_resources, deleted_resources, modified_resources
+
+# Terraform type -> (inventory type, [(Terraform attribute, inventory attribute)]) compared for drift
+COMPARED_ATTRIBUTES = {
+    "aws_instance": ("EC2", [("instance_type", "instance_type"), ("tags", "tags")]),
+    "aws_s3_bucket": ("S3", [("tags", "tags")]),
+    "aws_db_instance": ("RDS", [
+        ("instance_class", "instance_class"),
+        ("allocated_storage", "storage_size"),
+        ("multi_az", "multi_az"),
+        ("tags", "tags")
+    ])
+}
+
+# State attributes kept for every type: identity lookups and the environment tag triage reads
+COMMON_STATE_ATTRIBUTES = frozenset(resource_identity.TERRAFORM_IDENTITY_ATTRIBUTES) | {"tags"}
+
+def state_attributes(resource_type):
+    """State attributes a managed resource of this type keeps in memory"""
+    _, compared = COMPARED_ATTRIBUTES.get(resource_type, (None, ()))
+    return COMMON_STATE_ATTRIBUTES | {tf_name for tf_name, _ in compared}
+
+def diff_resources(managed_resources, actual_resources):
+    """
+    Diff Terraform-managed resources against actual AWS resources without attribution.
+    
+    Resources are paired by resource_identity, so a Terraform id that differs from
+    the inventory key (RDS resource id vs identifier, ARNs) is not reported as an
+    unmanaged/deleted pair. Modified resources carry the AWS id, plus terraform_id
+    when the state knows the resource by another id.
+    """
+    unmanaged_resources = []
+    deleted_resources = []
+    modified_resources = []
+    
+    matches = resource_identity.match_resources(managed_resources, actual_resources)
+    matched_actual = set(matches.values())
+    
+    # 1. Unmanaged resources (not in Terraform)
+    for resource_id, details in actual_resources.items():
+        if resource_id not in matched_actual:
+            unmanaged_resources.append({
+                "id": resource_id,
+                "type": details.type
+            })
+    
+    # 2. Deleted resources (in Terraform but not in AWS)
+    for resource_id, details in managed_resources.items():
+        if resource_id not in matches:
+            deleted_resources.append({
+                "id": resource_id,
+                "type": details.type
+            })
+    
+    # 3. Modified resources (attributes differ between Terraform and actual)
+    for resource_id, actual_id in matches.items():
+        tf_details = managed_resources[resource_id]
+        actual_details = actual_resources[actual_id]
+        
+        # Compare the attributes listed for this resource type
+        changes = []
+        inventory_type, compared = COMPARED_ATTRIBUTES.get(tf_details.type, (None, ()))
+        if actual_details.type == inventory_type:
+            tf_attrs = tf_details.attributes
+            actual_attrs = actual_details.attributes
+            for tf_name, actual_name in compared:
+                if tf_attrs.get(tf_name) != actual_attrs.get(actual_name):
+                    changes.append({
+                        "attribute": tf_name,
+                        "expected": tf_attrs.get(tf_name),
+                        "actual": actual_attrs.get(actual_name)
+                    })
+        
+        if changes:
+            modified = {
+                "id": actual_id,
+                "type": tf_details.type,
+                "changes": changes
+            }
+            if actual_id != resource_id:
+                modified["terraform_id"] = resource_id
+            modified_resources.append(modified)
+    
+    return unmanaged_resources, deleted_resources, modified_resources
+
+# Drift kind -> key holding who caused it
+AUTHOR_KEYS = {"unmanaged": "created_by", "deleted": "deleted_by", "modified": "modified_by"}
+
+def attribute_drift(unmanaged_resources, deleted_resources, modified_resources):
+    """Look up who created, deleted or modified each drifted resource"""
+    for kind, resources in (("unmanaged", unmanaged_resources), ("deleted", deleted_resources), ("modified", modified_resources)):
+        for resource in resources:
+            attribute_resource(kind, resource)
+
+def attribute_resource(kind, resource):
+    """Look up who caused one drifted resource"""
+    resource[AUTHOR_KEYS[kind]] = get_change_author(resource["id"], resource["type"])
+
 def extract_managed_resources(tfstate):
     """Extract resources managed by Terraform"""
     managed_resources = {}
+    projections = {}
     
     for resource in tfstate.get("resources", []):
         for instance in resource.get("instances", []):
             attrs = instance.get("attributes", {})
             resource_id = attrs.get("id") or attrs.get("name")
             if resource_id:
-                managed_resources[resource_id] = {
-                    "type": resource["type"],
-                    "attributes": attrs
-                }
+                # Keep only what drift detection uses; the rest is reduced to a digest
+                resource_type = resource["type"]
+                if resource_type not in projections:
+                    projections[resource_type] = state_attributes(resource_type)
+                managed_resources[resource_id] = resource_records.project(resource_type, attrs, projections[resource_type])
     
     return managed_resources
 
@@ -261,89 +569,175 @@ def get_actual_resources():
     """Get actual AWS resources with detailed attributes for drift detection"""
     actual_resources = {}
     
-    # EC2 instances
-    try:
-        ec2 = boto3.client("ec2")
-        for reservation in ec2.describe_instances()["Reservations"]:
-            for instance in reservation["Instances"]:
-                if instance["State"]["Name"] != "terminated":
-                    actual_resources[instance["InstanceId"]] = {
-                        "type": "EC2",
-                        "attributes": {
-                            "instance_type": instance.get("InstanceType"),
-                            "tags": {tag["Key"]: tag["Value"] for tag in instance.get("Tags", [])},
-                            "subnet_id": instance.get("SubnetId"),
-                            "security_groups": [sg["GroupId"] for sg in instance.get("SecurityGroups", [])]
-                        }
-                    }
-    except Exception as e:
-        print(f"Error getting EC2 instances: {e}")
+    for collector in INVENTORY_COLLECTORS.values():
+        actual_resources.update(collector())
     
-    # S3 buckets
+    return actual_resources
+
+def ec2_instances_page(ec2, token=None, **query):
+    """One page of EC2 instances that are not terminated: (resources, next_token)"""
+    kwargs = dict(query, MaxResults=1000)
+    if token:
+        kwargs["NextToken"] = token
+    response = ec2.describe_instances(**kwargs)
+    resources = {}
+    for reservation in response["Reservations"]:
+        for instance in reservation["Instances"]:
+            if instance["State"]["Name"] != "terminated":
+                resources[instance["InstanceId"]] = resource_records.ResourceRecord("EC2", {
+                    "instance_type": instance.get("InstanceType"),
+                    "ami": instance.get("ImageId"),
+                    "tags": {tag["Key"]: tag["Value"] for tag in instance.get("Tags", [])},
+                    "subnet_id": instance.get("SubnetId"),
+                    "security_groups": [sg["GroupId"] for sg in instance.get("SecurityGroups", [])]
+                })
+    return resources, response.get("NextToken")
+
+def bucket_tags(s3, bucket_name):
+    """Tags of one bucket through the S3 API, for buckets the tag index does not cover"""
     try:
-        s3 = boto3.client("s3")
-        for bucket in s3.list_buckets()["Buckets"]:
-            try:
-                tags_response = s3.get_bucket_tagging(Bucket=bucket["Name"])
-                tags = {tag["Key"]: tag["Value"] for tag in tags_response.get("TagSet", [])}
-            except:
-                tags = {}
-                
-            actual_resources[bucket["Name"]] = {
-                "type": "S3",
-                "attributes": {
-                    "tags": tags
-                }
-            }
+        return {tag["Key"]: tag["Value"] for tag in s3.get_bucket_tagging(Bucket=bucket_name).get("TagSet", [])}
     except Exception as e:
-        print(f"Error getting S3 buckets: {e}")
+        if drift_metrics.error_code(e) != "NoSuchTagSet":
+            print(f"Error getting tags of bucket {bucket_name}: {e}")
+        return {}
+
+def s3_buckets_page(s3, token=None, **query):
+    """
+    One page of S3 buckets with their tags: (resources, next_token).
     
-    # IAM users
+    Tags come from the bulk tag index of the client's region; buckets in other
+    regions, or every bucket if the tagging API fails, fall back to get_bucket_tagging.
+    """
+    kwargs = dict(query, MaxBuckets=1000)
+    if token:
+        kwargs["ContinuationToken"] = token
+    response = s3.list_buckets(**kwargs)
+    region = tag_index.client_region(s3)
+    index = tag_index.tags_for("S3", region, refresh=token is None)
+    resources = {}
+    for bucket in response["Buckets"]:
+        if index is not None and bucket.get("BucketRegion") == region:
+            tags = index.get(f"arn:aws:s3:::{bucket['Name']}", {})
+        else:
+            tags = bucket_tags(s3, bucket["Name"])
+            
+        resources[bucket["Name"]] = resource_records.ResourceRecord("S3", {
+            "tags": tags
+        })
+    return resources, response.get("ContinuationToken")
+
+def iam_users_page(iam, token=None, **query):
+    """One page of IAM users: (resources, next_token)"""
+    kwargs = dict(query, MaxItems=1000)
+    if token:
+        kwargs["Marker"] = token
+    response = iam.list_users(**kwargs)
+    resources = {}
+    for user in response["Users"]:
+        resources[user["UserName"]] = resource_records.ResourceRecord("IAM", {
+            "arn": user.get("Arn"),
+            "path": user.get("Path")
+        })
+    return resources, response.get("Marker") if response.get("IsTruncated") else None
+
+def db_instance_tags(rds, arn):
+    """Tags of one DB instance through the RDS API, when the tag index is unavailable"""
     try:
-        iam = boto3.client("iam")
-        for user in iam.list_users()["Users"]:
-            actual_resources[user["UserName"]] = {
-                "type": "IAM",
-                "attributes": {
-                    "arn": user.get("Arn"),
-                    "path": user.get("Path")
-                }
-            }
+        return {tag["Key"]: tag["Value"] for tag in rds.list_tags_for_resource(ResourceName=arn).get("TagList", [])}
     except Exception as e:
-        print(f"Error getting IAM users: {e}")
+        print(f"Error getting tags of DB instance {arn}: {e}")
+        return {}
+
+def rds_instances_page(rds, token=None, **query):
+    """
+    One page of RDS instances with their tags: (resources, next_token).
     
-    # RDS instances
+    Tags come from the bulk tag index of the client's region.
+    """
+    kwargs = dict(query, MaxRecords=100)
+    if token:
+        kwargs["Marker"] = token
+    response = rds.describe_db_instances(**kwargs)
+    index = tag_index.tags_for("RDS", tag_index.client_region(rds), refresh=token is None)
+    resources = {}
+    for db in response["DBInstances"]:
+        if index is not None:
+            tags = index.get(db["DBInstanceArn"], {})
+        else:
+            tags = db_instance_tags(rds, db["DBInstanceArn"])
+            
+        resources[db["DBInstanceIdentifier"]] = resource_records.ResourceRecord("RDS", {
+            "engine": db.get("Engine"),
+            "engine_version": db.get("EngineVersion"),
+            "instance_class": db.get("DBInstanceClass"),
+            "storage_size": db.get("AllocatedStorage"),
+            "multi_az": db.get("MultiAZ"),
+            "tags": tags,
+            "arn": db.get("DBInstanceArn"),
+            "resource_id": db.get("DbiResourceId")
+        })
+    return resources, response.get("Marker")
+
+# Inventory type -> (client, page function), in the order scans collect them
+INVENTORY_PAGES = {
+    "EC2": ("ec2", ec2_instances_page),
+    "S3": ("s3", s3_buckets_page),
+    "IAM": ("iam", iam_users_page),
+    "RDS": ("rds", rds_instances_page)
+}
+
+def collect_inventory(inventory_type):
+    """Every page of one inventory type"""
+    resources = {}
+    client_name, page = INVENTORY_PAGES[inventory_type]
     try:
-        rds = boto3.client("rds")
-        for db in rds.describe_db_instances()["DBInstances"]:
-            # Get tags
-            try:
-                tags = {tag["Key"]: tag["Value"] for tag in rds.list_tags_for_resource(
-                    ResourceName=db["DBInstanceArn"]
-                ).get("TagList", [])}
-            except:
-                tags = {}
-                
-            actual_resources[db["DBInstanceIdentifier"]] = {
-                "type": "RDS",
-                "attributes": {
-                    "engine": db.get("Engine"),
-                    "instance_class": db.get("DBInstanceClass"),
-                    "storage_size": db.get("AllocatedStorage"),
-                    "multi_az": db.get("MultiAZ"),
-                    "tags": tags
-                }
-            }
+        client = aws_backend.client(client_name)
+        token = None
+        while True:
+            batch, token = page(client, token)
+            resources.update(batch)
+            if not token:
+                break
     except Exception as e:
-        print(f"Error getting RDS instances: {e}")
+        print(f"Error getting {inventory_type} resources: {e}")
     
-    return actual_resources
+    return resources
+
+def get_ec2_instances():
+    """Get EC2 instances that are not terminated"""
+    return collect_inventory("EC2")
+
+def get_s3_buckets():
+    """Get S3 buckets with their tags"""
+    return collect_inventory("S3")
+
+def get_iam_users():
+    """Get IAM users"""
+    return collect_inventory("IAM")
+
+def get_rds_instances():
+    """Get RDS instances with their tags"""
+    return collect_inventory("RDS")
+
+# Inventory type -> collector, in the order get_actual_resources runs them
+INVENTORY_COLLECTORS = {
+    "EC2": get_ec2_instances,
+    "S3": get_s3_buckets,
+    "IAM": get_iam_users,
+    "RDS": get_rds_instances
+}
 
 def get_change_author(resource_id, resource_type):
     """Get who made changes to a resource"""
+    with drift_metrics.span("attribution"):
+        return lookup_change_author(resource_id, resource_type)
+
+def lookup_change_author(resource_id, resource_type):
+    """Search CloudTrail for the latest event touching a resource"""
     # Determine which region to check based on resource type
     regions = ["ap-southeast-1"]
-    if resource_type == "IAM":
+    if resource_type in ("IAM", "aws_iam_user"):
         regions = ["us-east-1"]
     
     # For deleted resources, we need to check a longer time period
@@ -353,7 +747,7 @@ def get_change_author(resource_id, resource_type):
     # First try resource-specific lookup
     for region in regions:
         try:
-            ct = boto3.client("cloudtrail", region_name=region)
+            ct = aws_backend.client("cloudtrail", region_name=region)
             
             # Determine relevant event names based on resource type
             event_names = []
@@ -383,7 +777,7 @@ def get_change_author(resource_id, resource_type):
                 
                 if events.get("Events"):
                     latest_event = events["Events"][0]
-                    event_detail = json.loads(latest_event["CloudTrailEvent"])
+                    event_detail = drift_json.LazyDocument(latest_event["CloudTrailEvent"])
                     user_identity = event_detail.get("userIdentity", {})
                     
                     return {
@@ -409,8 +803,9 @@ def get_change_author(resource_id, resource_type):
                     
                     # Search through events for our resource ID
                     for event in events.get("Events", []):
-                        event_detail = json.loads(event["CloudTrailEvent"])
-                        if resource_id in str(event_detail):
+                        # Only records that mention the resource are parsed
+                        event_detail = drift_json.LazyDocument(event["CloudTrailEvent"])
+                        if resource_id in event_detail:
                             user_identity = event_detail.get("userIdentity", {})
                             return {
                                 "user": user_identity.get("arn", "unknown").split("/")[-1] if user_identity.get("arn") else "unknown",
@@ -426,7 +821,7 @@ def get_change_author(resource_id, resource_type):
     
     # For deleted resources, check for terraform apply events
     try:
-        ct = boto3.client("cloudtrail", region_name=regions[0])
+        ct = aws_backend.client("cloudtrail", region_name=regions[0])
         events = ct.lookup_events(
             LookupAttributes=[
                 {"AttributeKey": "EventName", "AttributeValue": "ApplyProviderChanges"}
@@ -437,8 +832,8 @@ def get_change_author(resource_id, resource_type):
         )
         
         for event in events.get("Events", []):
-            event_detail = json.loads(event["CloudTrailEvent"])
-            if "terraform" in str(event_detail).lower():
+            event_detail = drift_json.LazyDocument(event["CloudTrailEvent"])
+            if "terraform" in event_detail.text.lower():
                 user_identity = event_detail.get("userIdentity", {})
                 return {
                     "user": user_identity.get("arn", "unknown").split("/")[-1] if user_identity.get("arn") else "unknown",
@@ -459,7 +854,7 @@ def get_change_author(resource_id, resource_type):
 
 def handle_config_change(event):
     """Handle AWS Config change events"""
-    sns = boto3.client("sns")
+    sns = aws_backend.client("sns")
     sns_topic = os.environ.get("SNS_TOPIC_ARN")
     
     try:
@@ -510,7 +905,7 @@ def handle_config_change(event):
 
 def handle_cloudtrail_event(event):
     """Handle CloudTrail API call events from EventBridge"""
-    sns = boto3.client("sns")
+    sns = aws_backend.client("sns")
     sns_topic = os.environ.get("SNS_TOPIC_ARN")
     
     try:
@@ -576,71 +971,73 @@ def handle_cloudtrail_event(event):
 
 def handle_state_change_eventbridge(event):
     """Handle S3 state file changes from EventBridge"""
-    s3 = boto3.client("s3")
-    sns = boto3.client("sns")
-    sns_topic = os.environ.get("SNS_TOPIC_ARN")
-    
     try:
-        # Get bucket and key from event
+        # Get bucket, key and uploaded version from event
         bucket = event["detail"]["bucket"]["name"]
         key = event["detail"]["object"]["key"]
-        
-        # Get current state file
-        current_state_obj = s3.get_object(Bucket=bucket, Key=key)
-        current_state = json.loads(current_state_obj["Body"].read())
-        
-        # Get previous state file version if available
-        try:
-            versions = s3.list_object_versions(Bucket=bucket, Prefix=key)["Versions"]
-            if len(versions) > 1:
-                prev_version_id = versions[1]["VersionId"]
-                prev_state_obj = s3.get_object(Bucket=bucket, Key=key, VersionId=prev_version_id)
-                prev_state = json.loads(prev_state_obj["Body"].read())
-            else:
-                return {"message": "No previous state version found"}
-        except Exception as e:
-            print(f"Error getting previous state: {e}")
-            return {"message": "No previous state available"}
-        
-        # Compare states to find changes
-        changes = compare_terraform_states(prev_state, current_state)
-        
-        if changes:
-            # Generate summary
-            summary = generate_state_change_summary(changes)
-            
-            # Send notification
-            sns.publish(TopicArn=sns_topic, Subject="Terraform State Change Detected", Message=summary)
-            
-            return {
-                "state_changed": True,
-                "changes": changes,
-                "summary": summary
-            }
-        
-        return {"state_changed": False}
-        
+        version_id = event["detail"]["object"].get("version-id")
+        return handle_state_upload(bucket, key, version_id)
     except Exception as e:
         print(f"Error handling state change from EventBridge: {e}")
         return {"error": str(e)}
 
+def handle_state_upload(bucket, key, version_id=None):
+    """
+    Diff an uploaded state version against the version before it.
+    
+    Parsed versions are cached by version id across invocations, so the
+    previous version is normally the one parsed as current on the last upload
+    and only the new version is downloaded.
+    """
+    s3 = aws_backend.client("s3")
+    sns = aws_backend.client("sns")
+    sns_topic = os.environ.get("SNS_TOPIC_ARN")
+    history = state_history.handler_history(s3, bucket, key, index_state)
+    
+    # Get the uploaded version and the one before it, for this exact key
+    try:
+        current_version_id, prev_version_id = history.version_pair(version_id)
+        if prev_version_id is None:
+            return {"message": "No previous state version found"}
+        prev_resources = history.parsed(prev_version_id)
+    except Exception as e:
+        print(f"Error getting previous state: {e}")
+        return {"message": "No previous state available"}
+    current_resources = history.parsed(current_version_id)
+    
+    # Compare states to find changes
+    changes = compare_state_indexes(prev_resources, current_resources)
+    
+    if changes:
+        # Generate summary
+        summary = generate_state_change_summary(changes)
+        
+        # Send notification
+        sns.publish(TopicArn=sns_topic, Subject="Terraform State Change Detected", Message=summary)
+        
+        return {
+            "state_changed": True,
+            "changes": changes,
+            "summary": summary
+        }
+    
+    return {"state_changed": False}
+
 def is_terraform_managed(resource_id):
     """Check if a resource is managed by Terraform"""
     try:
-        s3 = boto3.client("s3")
+        s3 = aws_backend.client("s3")
         bucket = os.environ.get("TFSTATE_BUCKET")
         key = os.environ.get("TFSTATE_KEY", "terraform.tfstate")
         
         # Load Terraform state
         state_obj = s3.get_object(Bucket=bucket, Key=key)
-        tfstate = json.loads(state_obj["Body"].read())
+        tfstate = drift_json.loads(state_obj["Body"].read())
         
-        # Check if resource is in state
+        # Check if resource is in state under any of its ids (id, identifier, ARN, ...)
         for resource in tfstate.get("resources", []):
             for instance in resource.get("instances", []):
-                attrs = instance.get("attributes", {})
-                tf_resource_id = attrs.get("id") or attrs.get("name")
-                if tf_resource_id == resource_id:
+                if resource_id in resource_identity.terraform_keys(instance.get("attributes", {})):
                     return True
         
         return False
@@ -650,191 +1047,103 @@ def is_terraform_managed(resource_id):
 
 def handle_state_change(event):
     """Handle Terraform state file changes"""
-    s3 = boto3.client("s3")
-    sns = boto3.client("sns")
-    sns_topic = os.environ.get("SNS_TOPIC_ARN")
-    
     try:
-        # Get bucket and key from event
+        # Get bucket, key and uploaded version from event
         bucket = event["Records"][0]["s3"]["bucket"]["name"]
-        key = event["Records"][0]["s3"]["object"]["key"]
-        
-        # Get current state file
-        current_state_obj = s3.get_object(Bucket=bucket, Key=key)
-        current_state = json.loads(current_state_obj["Body"].read())
-        
-        # Get previous state file version if available
-        try:
-            versions = s3.list_object_versions(Bucket=bucket, Prefix=key)["Versions"]
-            if len(versions) > 1:
-                prev_version_id = versions[1]["VersionId"]
-                prev_state_obj = s3.get_object(Bucket=bucket, Key=key, VersionId=prev_version_id)
-                prev_state = json.loads(prev_state_obj["Body"].read())
-            else:
-                return {"message": "No previous state version found"}
-        except Exception as e:
-            print(f"Error getting previous state: {e}")
-            return {"message": "No previous state available"}
-        
-        # Compare states to find changes
-        changes = compare_terraform_states(prev_state, current_state)
-        
-        if changes:
-            # Generate summary
-            summary = generate_state_change_summary(changes)
-            
-            # Send notification
-            sns.publish(TopicArn=sns_topic, Subject="Terraform State Change Detected", Message=summary)
-            
-            return {
-                "state_changed": True,
-                "changes": changes,
-                "summary": summary
-            }
-        
-        return {"state_changed": False}
-        
+        key = unquote_plus(event["Records"][0]["s3"]["object"]["key"])
+        version_id = event["Records"][0]["s3"]["object"].get("versionId")
+        return handle_state_upload(bucket, key, version_id)
     except Exception as e:
         return {"error": str(e)}
 
-def compare_terraform_states(prev_state, current_state):
-    """Compare two Terraform states to find changes"""
-    changes = []
-    
-    # Extract resources from both states
-    prev_resources = {}
-    current_resources = {}
-    
-    # Process previous state
-    for resource in prev_state.get("resources", []):
-        for instance in resource.get("instances", []):
-            attrs = instance.get("attributes", {})
-            resource_id = attrs.get("id") or attrs.get("name")
-            if resource_id:
-                prev_resources[resource_id] = {
-                    "type": resource["type"],
-                    "attributes": attrs
-                }
+def replay_drift(times):
+    """Drift at one or more past times, from the state version and Config items current at each"""
+    bucket = os.environ.get("TFSTATE_BUCKET")
+    key = os.environ.get("TFSTATE_KEY", "terraform.tfstate")
     
-    # Process current state
-    for resource in current_state.get("resources", []):
+    try:
+        replay = drift_replay.DriftReplay(bucket, key)
+        points = replay.timeline(times if isinstance(times, list) else [times])
+        return {"replay": points, "stats": replay.stats()}
+    except Exception as e:
+        print(f"Error replaying drift: {e}")
+        return {"error": str(e)}
+
+def index_state(tfstate):
+    """Instance attributes of a state keyed by (id, type), the form state versions are cached and compared in"""
+    resources = {}
+    for resource in tfstate.get("resources", []):
         for instance in resource.get("instances", []):
             attrs = instance.get("attributes", {})
             resource_id = attrs.get("id") or attrs.get("name")
             if resource_id:
-                current_resources[resource_id] = {
-                    "type": resource["type"],
-                    "attributes": attrs
-                }
+                resources[(resource_id, resource["type"])] = attrs
+    return resources
+
+def compare_terraform_states(prev_state, current_state):
+    """Compare two Terraform states to find changes"""
+    return compare_state_indexes(index_state(prev_state), index_state(current_state))
+
+def compare_state_indexes(prev_resources, current_resources):
+    """
+    Compare two indexed Terraform states to find changes.
     
-    # Find added resources
-    for resource_id, details in current_resources.items():
-        if resource_id not in prev_resources:
-            changes.append({
+    Instances whose attributes are equal as a whole are skipped without a
+    per-attribute comparison. Instances are keyed by id and type, so resources
+    sharing an id (a bucket and its versioning config) are compared separately.
+    """
+    added = []
+    modified = []
+    for key, attrs in current_resources.items():
+        resource_id, resource_type = key
+        
+        # Find added resources
+        if key not in prev_resources:
+            added.append({
                 "action": "added",
                 "id": resource_id,
-                "type": details["type"]
+                "type": resource_type
             })
-    
-    # Find removed resources
-    for resource_id, details in prev_resources.items():
-        if resource_id not in current_resources:
-            changes.append({
-                "action": "removed",
+            continue
+        
+        # Find modified resources
+        prev_attrs = prev_resources[key]
+        if prev_attrs == attrs:
+            continue
+        modified_attrs = []
+        for name, value in attrs.items():
+            if name in prev_attrs and prev_attrs[name] != value:
+                modified_attrs.append({
+                    "name": name,
+                    "old": prev_attrs[name],
+                    "new": value
+                })
+        
+        if modified_attrs:
+            modified.append({
+                "action": "modified",
                 "id": resource_id,
-                "type": details["type"]
+                "type": resource_type,
+                "changes": modified_attrs
             })
     
-    # Find modified resources
-    for resource_id, current_details in current_resources.items():
-        if resource_id in prev_resources:
-            prev_details = prev_resources[resource_id]
-            
-            # Compare attributes
-            modified_attrs = []
-            for key, value in current_details["attributes"].items():
-                if key in prev_details["attributes"] and prev_details["attributes"][key] != value:
-                    modified_attrs.append({
-                        "name": key,
-                        "old": prev_details["attributes"][key],
-                        "new": value
-                    })
-            
-            if modified_attrs:
-                changes.append({
-                    "action": "modified",
-                    "id": resource_id,
-                    "type": current_details["type"],
-                    "changes": modified_attrs
-                })
+    # Find removed resources
+    removed = [
+        {"action": "removed", "id": resource_id, "type": resource_type}
+        for (resource_id, resource_type) in prev_resources
+        if (resource_id, resource_type) not in current_resources
+    ]
     
-    return changes
+    return added + removed + modified
 
 def generate_state_change_summary(changes):
     """Generate summary of Terraform state changes"""
-    summary = "TERRAFORM STATE CHANGES\n\n"
-    
-    # Group changes by action
-    added = [c for c in changes if c["action"] == "added"]
-    removed = [c for c in changes if c["action"] == "removed"]
-    modified = [c for c in changes if c["action"] == "modified"]
-    
-    if added:
-        summary += f"ADDED RESOURCES ({len(added)}):\n"
-        for resource in added:
-            summary += f"+ {resource['type']} {resource['id']}\n"
-        summary += "\n"
-    
-    if removed:
-        summary += f"REMOVED RESOURCES ({len(removed)}):\n"
-        for resource in removed:
-            summary += f"- {resource['type']} {resource['id']}\n"
-        summary += "\n"
-    
-    if modified:
-        summary += f"MODIFIED TERRAFORM RESOURCES ({len(modified)}):\n"
-        for resource in modified:
-            summary += f"~ {resource['type']} {resource['id']}\n"
-            for change in resource["changes"]:
-                summary += f"  ~ {change['name']}: {change['old']} -> {change['new']}\n"
-            summary += "\n"
-    
-    return summary
+    return drift_render.state_change_summary(changes)
 
 def generate_summary(unmanaged_resources, deleted_resources, modified_resources):
     """Generate a simple drift summary"""
-    summary = "INFRASTRUCTURE DRIFT SUMMARY\n\n"
-    
-    if unmanaged_resources:
-        summary += f"UNMANAGED RESOURCES ({len(unmanaged_resources)}):\n"
-        for resource in unmanaged_resources:
-            summary += f"- {resource['type']} {resource['id']}\n"
-            user_info = resource.get('created_by', {})
-            summary += f"  Created by: {user_info.get('user', 'unknown')} at {user_info.get('time', 'unknown')}\n"
-            summary += f"  Region: {user_info.get('region', 'unknown')}\n"
-            summary += f"  Event: {user_info.get('event', 'unknown')}\n"
-        summary += "\n"
-    
-    if deleted_resources:
-        summary += f"DELETED RESOURCES ({len(deleted_resources)}):\n"
-        for resource in deleted_resources:
-            summary += f"- {resource['type']} {resource['id']}\n"
-            user_info = resource.get('deleted_by', {})
-            summary += f"  Deleted by: {user_info.get('user', 'unknown')} at {user_info.get('time', 'unknown')}\n"
-            summary += f"  Region: {user_info.get('region', 'unknown')}\n"
-            summary += f"  Event: {user_info.get('event', 'unknown')}\n"
-        summary += "\n"
-    
-    if modified_resources:
-        summary += f"MODIFIED RESOURCES ({len(modified_resources)}):\n"
-        for resource in modified_resources:
-            summary += f"- {resource['type']} {resource['id']}\n"
-            user_info = resource.get('modified_by', {})
-            summary += f"  Modified by: {user_info.get('user', 'unknown')} at {user_info.get('time', 'unknown')}\n"
-            summary += f"  Region: {user_info.get('region', 'unknown')}\n"
-            summary += f"  Event: {user_info.get('event', 'unknown')}\n"
-            for change in resource.get('changes', []):
-                summary += f"  • {change.get('attribute', '')}: {change.get('expected', '')} -> {change.get('actual', '')}\n"
-        summary += "\n"
-    
-    return summary
\ No newline at end of file
+    return drift_render.render_string({
+        "unmanaged_resources": unmanaged_resources,
+        "deleted_resources": deleted_resources,
+        "modified_resources": modified_resources
+    }, "text")
\ No newline at end of file
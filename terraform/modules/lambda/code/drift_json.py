@@ -0,0 +1,109 @@
+"""
+JSON codec for the hot paths: state bodies, CloudTrail records, reports and payloads.
+
+orjson is used when it is in the deployment package and stdlib json otherwise;
+JSON_CODEC=json forces the stdlib. Both produce the same compact output, and
+documents the accelerated codec cannot handle (integers beyond 64 bits, lone
+surrogates) are retried with the stdlib rather than failing.
+
+    state = drift_json.loads(s3.get_object(...)["Body"].read())
+    body = drift_json.dumpb(report, default=str)
+"""
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if os.environ.get("JSON_CODEC", "auto").lower() in ("json", "stdlib"):
+    orjson = None
+
+CODEC = "orjson" if orjson else "json"
+
+# Datetimes go to default like they do with the stdlib, so default=str keeps its format
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+
+def loads(data):
+    """Parse str, bytes or bytearray; bytes are decoded by the parser without a str copy"""
+    if orjson:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+
+def _stdlib_dumps(obj, default, sort_keys, indent):
+    return json.dumps(
+        obj, default=default, sort_keys=sort_keys,
+        indent=2 if indent else None, separators=(",", ": ") if indent else (",", ":")
+    )
+
+
+def dumpb(obj, default=None, sort_keys=False, indent=False):
+    """Compact JSON as UTF-8 bytes, or indented by two spaces with indent=True"""
+    if orjson:
+        options = _ORJSON_OPTIONS
+        if sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=default, option=options)
+        except orjson.JSONEncodeError:
+            pass
+    return _stdlib_dumps(obj, default, sort_keys, indent).encode("utf-8")
+
+
+def dumps(obj, default=None, sort_keys=False, indent=False):
+    """Compact JSON as str, for logs and APIs that take text"""
+    if orjson:
+        return dumpb(obj, default, sort_keys, indent).decode("utf-8")
+    return _stdlib_dumps(obj, default, sort_keys, indent)
+
+
+def iter_encode(obj, default=None):
+    """
+    Compact JSON as UTF-8 byte chunks, for writers that compress as they go.
+
+    The stdlib encodes piece by piece; orjson encodes the whole document at
+    once, which is still faster than the stdlib's first piece for large ones.
+    """
+    if orjson:
+        try:
+            yield orjson.dumps(obj, default=default, option=_ORJSON_OPTIONS)
+            return
+        except orjson.JSONEncodeError:
+            pass
+    for chunk in json.JSONEncoder(separators=(",", ":"), default=default).iterencode(obj):
+        yield chunk.encode("utf-8")
+
+
+class LazyDocument:
+    """
+    A JSON document kept as text until a value is read from it.
+
+    "needle" in document searches the text, so records that a substring filter
+    rules out are never parsed. The parsed value is kept for later reads.
+    """
+
+    __slots__ = ("text", "_value")
+
+    def __init__(self, text):
+        self.text = text or "{}"
+        self._value = None
+
+    def __contains__(self, needle):
+        return needle in self.text
+
+    @property
+    def value(self):
+        if self._value is None:
+            self._value = loads(self.text)
+        return self._value
+
+    def get(self, key, default=None):
+        return self.value.get(key, default)
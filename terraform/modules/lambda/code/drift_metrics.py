@@ -0,0 +1,258 @@
+import os
+import time
+import functools
+import contextvars
+import threading
+from contextlib import nullcontext
+
+import drift_json
+
+# Error codes AWS returns when a call is rate limited
+THROTTLE_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestThrottled",
+    "RequestThrottledException",
+    "TooManyRequestsException",
+    "ProvisionedThroughputExceededException",
+    "RequestLimitExceeded",
+    "SlowDown",
+    "BandwidthLimitExceeded",
+}
+
+_NULL_SPAN = nullcontext()
+
+
+class Metrics:
+    """Per-invocation spans, API call counters and bytes read; updated from any thread"""
+
+    def __init__(self, function_name):
+        self.function_name = function_name
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.api = {}
+        self.bytes_read = {}
+        self.lock = threading.Lock()
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def add_span(self, name, duration):
+        duration_ms = duration * 1000
+        with self.lock:
+            span = self.spans.get(name)
+            if span is None:
+                span = self.spans[name] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0}
+            span["count"] += 1
+            span["total_ms"] += duration_ms
+            span["max_ms"] = max(span["max_ms"], duration_ms)
+
+    def record_call(self, service, operation, duration, error_code=None):
+        latency_ms = duration * 1000
+        with self.lock:
+            stats = self.api.get(service)
+            if stats is None:
+                stats = self.api[service] = {"calls": 0, "errors": 0, "throttles": 0, "total_latency_ms": 0.0, "max_latency_ms": 0.0, "operations": {}}
+            stats["calls"] += 1
+            stats["total_latency_ms"] += latency_ms
+            stats["max_latency_ms"] = max(stats["max_latency_ms"], latency_ms)
+            stats["operations"][operation] = stats["operations"].get(operation, 0) + 1
+            if error_code:
+                stats["errors"] += 1
+                if error_code in THROTTLE_CODES:
+                    stats["throttles"] += 1
+
+    def add_bytes_read(self, service, count):
+        with self.lock:
+            self.bytes_read[service] = self.bytes_read.get(service, 0) + (count or 0)
+
+    def to_dict(self):
+        """Metrics block returned in handler responses"""
+        with self.lock:
+            return {
+                "function_name": self.function_name,
+                "duration_ms": round((time.perf_counter() - self.started) * 1000, 3),
+                "spans": {
+                    name: {"count": s["count"], "total_ms": round(s["total_ms"], 3), "max_ms": round(s["max_ms"], 3)}
+                    for name, s in self.spans.items()
+                },
+                "api": {
+                    service: dict(s, operations=dict(s["operations"]), total_latency_ms=round(s["total_latency_ms"], 3), max_latency_ms=round(s["max_latency_ms"], 3))
+                    for service, s in self.api.items()
+                },
+                "bytes_read": dict(self.bytes_read)
+            }
+
+    def to_emf(self, namespace):
+        """Render the metrics as a CloudWatch Embedded Metric Format record"""
+        data = self.to_dict()
+        record = {"FunctionName": self.function_name}
+        definitions = []
+
+        def put(name, value, unit):
+            record[name] = value
+            definitions.append({"Name": name, "Unit": unit})
+
+        put("Duration", data["duration_ms"], "Milliseconds")
+        for name, span in data["spans"].items():
+            put(f"{name}.Duration", span["total_ms"], "Milliseconds")
+        for service, stats in data["api"].items():
+            put(f"{service}.ApiCalls", stats["calls"], "Count")
+            put(f"{service}.ApiLatency", stats["total_latency_ms"], "Milliseconds")
+            put(f"{service}.Throttles", stats["throttles"], "Count")
+            put(f"{service}.Errors", stats["errors"], "Count")
+        for service, count in data["bytes_read"].items():
+            put(f"{service}.BytesRead", count, "Bytes")
+
+        record["_aws"] = {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": namespace,
+                "Dimensions": [["FunctionName"]],
+                "Metrics": definitions
+            }]
+        }
+        return record
+
+
+class _Span:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.add_span(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class InstrumentedClient:
+    """Wraps a boto3 client and records every API call on the active Metrics"""
+
+    def __init__(self, client, service, metrics):
+        self._client = client
+        self._service = service
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name == "get_paginator":
+            return lambda operation: InstrumentedPaginator(attr(operation), self._service, operation, self._metrics)
+        if not callable(attr) or name.startswith("_") or name in ("can_paginate", "get_waiter", "close"):
+            return attr
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                response = attr(*args, **kwargs)
+            except Exception as e:
+                self._metrics.record_call(self._service, name, time.perf_counter() - start, error_code(e))
+                raise
+            self._metrics.record_call(self._service, name, time.perf_counter() - start)
+            if self._service == "s3" and name == "get_object" and isinstance(response, dict):
+                self._metrics.add_bytes_read("s3", response.get("ContentLength"))
+            return response
+
+        return call
+
+
+class InstrumentedPaginator:
+    """Counts each page fetched by a paginator as one API call"""
+
+    def __init__(self, paginator, service, operation, metrics):
+        self._paginator = paginator
+        self._service = service
+        self._operation = operation
+        self._metrics = metrics
+
+    def paginate(self, **kwargs):
+        pages = iter(self._paginator.paginate(**kwargs))
+        while True:
+            start = time.perf_counter()
+            try:
+                page = next(pages)
+            except StopIteration:
+                return
+            except Exception as e:
+                self._metrics.record_call(self._service, self._operation, time.perf_counter() - start, error_code(e))
+                raise
+            self._metrics.record_call(self._service, self._operation, time.perf_counter() - start)
+            yield page
+
+
+def error_code(exc):
+    """Extract the AWS error code from a botocore ClientError"""
+    response = getattr(exc, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code") or type(exc).__name__
+    return type(exc).__name__
+
+
+# Metrics of the invocation running in this thread or task. Concurrent handlers
+# each see their own; thread pools do not carry it over, see submit().
+_current = contextvars.ContextVar("drift_metrics", default=None)
+
+
+def current():
+    """Metrics for the running invocation, or None when disabled"""
+    return _current.get()
+
+
+def span(name):
+    """Time a pipeline stage; a shared no-op context when metrics are disabled"""
+    metrics = _current.get()
+    if metrics is None:
+        return _NULL_SPAN
+    return metrics.span(name)
+
+
+def instrument(client, service):
+    """Wrap a client so its calls are counted, or return it as-is when disabled"""
+    metrics = _current.get()
+    if metrics is None:
+        return client
+    return InstrumentedClient(client, service, metrics)
+
+
+def submit(executor, fn, *args, **kwargs):
+    """executor.submit(fn, ...) that runs fn with the caller's metrics"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def is_enabled(event):
+    if isinstance(event, dict) and event.get("metrics") is True:
+        return True
+    return os.environ.get("DRIFT_METRICS", "").lower() in ("1", "true", "yes")
+
+
+def instrumented(function_name):
+    """
+    Decorator for Lambda handlers that collects metrics for the invocation.
+
+    Enabled by DRIFT_METRICS=true or {"metrics": true} in the event. The metrics
+    are logged as an EMF line and returned in a "metrics" block of the response.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            if not is_enabled(event):
+                return handler(event, context)
+
+            name = getattr(context, "function_name", None) or function_name
+            metrics = Metrics(name)
+            token = _current.set(metrics)
+            try:
+                result = handler(event, context)
+            finally:
+                _current.reset(token)
+
+            print(drift_json.dumps(metrics.to_emf(os.environ.get("METRICS_NAMESPACE", "DriftGuard"))))
+            if isinstance(result, dict):
+                result["metrics"] = metrics.to_dict()
+            return result
+        return wrapper
+    return decorator
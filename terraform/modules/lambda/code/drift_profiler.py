@@ -0,0 +1,138 @@
+import cProfile
+import functools
+import marshal
+import os
+import pstats
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+import aws_backend
+import drift_json
+
+PROFILE_PREFIX = "drift-profiles/"
+
+# Functions and allocation sites in the response summary; the stored files keep more
+SUMMARY_FUNCTIONS = 10
+SUMMARY_ALLOCATIONS = 5
+STORED_ALLOCATIONS = 50
+
+# Only one profiler can run at a time, so an in-process nested invocation is not profiled
+_active = False
+
+
+def is_enabled(event):
+    if isinstance(event, dict) and event.get("profile") is True:
+        return True
+    return os.environ.get("DRIFT_PROFILE", "").lower() in ("1", "true", "yes")
+
+
+def function_label(key):
+    filename, line, name = key
+    return f"{os.path.basename(filename)}:{line}({name})" if line else name
+
+
+def hot_functions(stats, limit):
+    """Functions with the most time spent in their own code"""
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+    return [
+        {"function": function_label(key), "calls": calls, "own_s": round(tottime, 6), "cumulative_s": round(cumtime, 6)}
+        for key, (_, calls, tottime, cumtime, _) in rows
+    ]
+
+
+def allocation_sites(snapshot, limit):
+    return [
+        {"site": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}", "size_bytes": stat.size, "count": stat.count}
+        for stat in snapshot.statistics("lineno")[:limit]
+    ]
+
+
+def write_profile(function_name, files):
+    """
+    Store the profile files under PROFILE_DIR, or in the history bucket.
+
+    PROFILE_BUCKET, HISTORY_BUCKET and the snapshot bucket are tried in that
+    order. Returns the location, or None if there is nowhere to write.
+    """
+    stamp = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}-{uuid.uuid4().hex[:8]}"
+    directory = os.environ.get("PROFILE_DIR")
+    if directory:
+        path = os.path.join(directory, function_name, stamp)
+        os.makedirs(path, exist_ok=True)
+        for name, data in files.items():
+            with open(os.path.join(path, name), "wb") as f:
+                f.write(data)
+        return path
+    bucket = os.environ.get("PROFILE_BUCKET") or os.environ.get("HISTORY_BUCKET") or os.environ.get("SNAPSHOT_BUCKET") or os.environ.get("TFSTATE_BUCKET")
+    if not bucket:
+        return None
+    prefix = f"{PROFILE_PREFIX}{function_name}/{stamp}/"
+    s3 = aws_backend.client("s3")
+    for name, data in files.items():
+        s3.put_object(Bucket=bucket, Key=prefix + name, Body=data)
+    return f"s3://{bucket}/{prefix}"
+
+
+def profiled(function_name):
+    """
+    Decorator for Lambda handlers that profiles one invocation on request.
+
+    Enabled by DRIFT_PROFILE=true or {"profile": true} in the event; otherwise
+    the handler is called directly. The run is traced with cProfile and
+    tracemalloc. profile.pstats (for pstats or snakeviz) and the top
+    allocation sites are stored, and a short summary is returned in a
+    "profile" block of the response.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            global _active
+            if _active or not is_enabled(event):
+                return handler(event, context)
+
+            name = getattr(context, "function_name", None) or function_name
+            tracing = not tracemalloc.is_tracing()
+            if tracing:
+                tracemalloc.start(int(os.environ.get("PROFILE_TRACE_FRAMES", 1)))
+            profiler = cProfile.Profile()
+            _active = True
+            start = time.perf_counter()
+            try:
+                profiler.enable()
+                try:
+                    result = handler(event, context)
+                finally:
+                    profiler.disable()
+            finally:
+                _active = False
+                wall_time = time.perf_counter() - start
+                snapshot = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+                if tracing:
+                    tracemalloc.stop()
+
+            stats = pstats.Stats(profiler)
+            summary = {
+                "wall_time_s": round(wall_time, 6),
+                "peak_memory_bytes": peak,
+                "hot_functions": hot_functions(stats, SUMMARY_FUNCTIONS),
+                "top_allocations": allocation_sites(snapshot, SUMMARY_ALLOCATIONS)
+            }
+            allocations = "\n".join(f"{a['size_bytes']:>12} B {a['count']:>8} blocks  {a['site']}" for a in allocation_sites(snapshot, STORED_ALLOCATIONS))
+            try:
+                summary["location"] = write_profile(name, {
+                    "profile.pstats": marshal.dumps(stats.stats),
+                    "allocations.txt": (allocations + "\n").encode("utf-8"),
+                    "summary.json": drift_json.dumpb(summary, indent=True)
+                })
+            except Exception as e:
+                print(f"Error writing profile: {e}")
+
+            print(f"Profile: {drift_json.dumps(summary)}")
+            if isinstance(result, dict):
+                result["profile"] = summary
+            return result
+        return wrapper
+    return decorator
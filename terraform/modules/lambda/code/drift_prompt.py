@@ -0,0 +1,184 @@
+"""
+Bedrock analysis prompt built from raw drift data within a token budget.
+
+Drifted resources are grouped by kind, type and the exact change (a tag
+removed, an instance type changed from one value to another), so forty
+instances that lost the same tag become one line with a few example ids.
+Groups go in by severity until the budget is used; the rest are summarized by
+count. Tokens are estimated offline, without a tokenizer.
+
+    prompt, stats = drift_prompt.build_prompt(drift_report, assessment)
+"""
+import math
+import os
+import re
+
+import drift_json
+import drift_severity
+
+DEFAULT_TOKEN_BUDGET = 4000
+
+# Example resources listed per group; groups are cut down to one before being dropped
+EXAMPLES_PER_GROUP = 3
+
+# Longest attribute value quoted in a change description
+VALUE_CHARS = 80
+
+# Drift kind -> report key and who caused it
+DRIFT_KINDS = (
+    ("deleted", "deleted_resources", "deleted_by"),
+    ("modified", "modified_resources", "modified_by"),
+    ("unmanaged", "unmanaged_resources", "created_by")
+)
+
+# Kept free for the line summarizing groups that did not fit
+OMITTED_LINE_TOKENS = 20
+
+# Word pieces, digit runs and single symbols, roughly how a BPE tokenizer splits text
+_TOKEN_PIECES = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+PROMPT_HEADER = """You are an Infrastructure Drift Analyzer for AWS resources in a banking environment. Below is a summary of drift between infrastructure defined in Terraform and the actual AWS resources. Identical changes on several resources are grouped into one line with example resource ids; the full per-resource report with remediation snippets is kept with the drift history.
+
+Write the drift email with these sections:
+
+1. DRIFT EXPLANATION - why these changes matter in a banking environment, impacts on related systems, and patterns that point to broader issues
+2. RISK ASSESSMENT - security, compliance (PCI-DSS, GDPR, etc.), operational and cost risks
+3. REMEDIATION OPTIONS - detailed steps with banking-specific considerations, and the order to address the groups in
+4. IMMEDIATE ACTIONS - AWS Config rules, IAM or Service Control Policies and monitoring improvements to put in place
+
+Refer to groups rather than repeating every resource. Use plain language that both technical and non-technical stakeholders can understand.
+"""
+
+
+def token_budget():
+    return int(os.environ.get("PROMPT_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET))
+
+
+def estimate_tokens(text):
+    """Token count estimate: one per symbol or short word, one per four characters of longer ones"""
+    return sum(math.ceil(len(piece) / 4) for piece in _TOKEN_PIECES.findall(text))
+
+
+def short_value(value):
+    text = value if isinstance(value, str) else drift_json.dumps(value, default=str)
+    return text if len(text) <= VALUE_CHARS else text[:VALUE_CHARS - 3] + "..."
+
+
+def tag_delta(expected, actual):
+    """Tag edits from expected to actual, without the tags both sides share"""
+    expected = expected if isinstance(expected, dict) else {}
+    actual = actual if isinstance(actual, dict) else {}
+    edits = []
+    for key in sorted(expected.keys() - actual.keys()):
+        edits.append(f"removed {key}")
+    for key in sorted(actual.keys() - expected.keys()):
+        edits.append(f"added {key}={short_value(actual[key])}")
+    for key in sorted(k for k in expected.keys() & actual.keys() if expected[k] != actual[k]):
+        edits.append(f"{key} {short_value(expected[key])} -> {short_value(actual[key])}")
+    return "tags: " + ", ".join(edits) if edits else "tags: reordered"
+
+
+def change_signature(changes):
+    """What was changed, without which resource it was changed on"""
+    parts = []
+    for change in changes or ():
+        if change.get("attribute") == "tags":
+            parts.append(tag_delta(change.get("expected"), change.get("actual")))
+        else:
+            parts.append(f"{change.get('attribute')}: {short_value(change.get('expected'))} -> {short_value(change.get('actual'))}")
+    return "; ".join(parts)
+
+
+def group_drift(drift_report):
+    """
+    Drifted resources grouped by kind, type and change, most severe group first.
+
+    Each group has kind, type, change, count, score (its worst resource),
+    actors (distinct "user via event" attributions) and resources.
+    """
+    groups = {}
+    for kind, report_key, actor_key in DRIFT_KINDS:
+        for resource in drift_report.get(report_key, []):
+            change = change_signature(resource.get("changes")) if kind == "modified" else ""
+            key = (kind, resource.get("type", "Unknown"), change)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {"kind": kind, "type": key[1], "change": change, "count": 0, "score": 0, "actors": {}, "resources": []}
+            group["count"] += 1
+            group["score"] = max(group["score"], drift_severity.score_resource(kind, resource))
+            actor = resource.get(actor_key) or {}
+            if actor.get("user") not in (None, "unknown"):
+                label = f"{actor['user']} via {actor.get('event', 'unknown')}"
+                group["actors"][label] = group["actors"].get(label, 0) + 1
+            if len(group["resources"]) < EXAMPLES_PER_GROUP:
+                group["resources"].append(resource)
+    return sorted(groups.values(), key=lambda g: (g["score"], g["count"]), reverse=True)
+
+
+def render_group(group, examples):
+    line = f"- [{group['kind'].upper()}] {group['type']} x{group['count']}"
+    if group["change"]:
+        line += f" | {group['change']}"
+    if group["actors"]:
+        actors = sorted(group["actors"].items(), key=lambda item: item[1], reverse=True)
+        line += " | by " + ", ".join(label for label, _ in actors[:2])
+        if len(actors) > 2:
+            line += f" and {len(actors) - 2} others"
+    ids = [str(resource.get("id", "Unknown")) for resource in group["resources"][:examples]]
+    line += " | e.g. " + ", ".join(ids)
+    if group["count"] > len(ids):
+        line += f" (+{group['count'] - len(ids)} more)"
+    return line + "\n"
+
+
+def build_prompt(drift_report, assessment=None, budget=None):
+    """
+    Prompt for one drift report and its stats: chars, estimated_tokens, budget,
+    groups, groups_included and resources.
+
+    Groups that do not fit the budget with their examples are tried with one
+    example, and once one does not fit at all it and every later group are
+    summarized in a single line.
+    """
+    budget = token_budget() if budget is None else budget
+    assessment = assessment or drift_severity.assess(drift_report)
+    groups = group_drift(drift_report)
+    counts = {kind: len(drift_report.get(key, [])) for kind, key, _ in DRIFT_KINDS}
+
+    summary = (
+        f"\nDrift summary: severity {assessment['severity']} (score {assessment['score']}), "
+        f"{counts['unmanaged']} unmanaged, {counts['deleted']} deleted, {counts['modified']} modified resources "
+        f"in {len(groups)} groups, detected {drift_report.get('timestamp', 'unknown')}.\n\nDrift groups:\n"
+    )
+    parts = [PROMPT_HEADER, summary]
+    used = estimate_tokens(PROMPT_HEADER) + estimate_tokens(summary)
+
+    included = 0
+    for index, group in enumerate(groups):
+        reserve = OMITTED_LINE_TOKENS if index < len(groups) - 1 else 0
+        for examples in (EXAMPLES_PER_GROUP, 1):
+            line = render_group(group, examples)
+            tokens = estimate_tokens(line)
+            if used + tokens + reserve <= budget:
+                parts.append(line)
+                used += tokens
+                included += 1
+                break
+        else:
+            break
+
+    if included < len(groups):
+        rest = groups[included:]
+        line = f"- {len(rest)} further groups covering {sum(g['count'] for g in rest)} resources, omitted for length\n"
+        parts.append(line)
+        used += estimate_tokens(line)
+
+    prompt = "".join(parts)
+    return prompt, {
+        "chars": len(prompt),
+        "estimated_tokens": used,
+        "budget": budget,
+        "groups": len(groups),
+        "groups_included": included,
+        "resources": sum(counts.values())
+    }
@@ -1,8 +1,13 @@
-import json
-import boto3
 import os
 from datetime import datetime, timedelta
 
+import aws_backend
+import drift_metrics
+import drift_profiler
+import model_router
+
+@drift_profiler.profiled("drift-rag-query")
+@drift_metrics.instrumented("drift-rag-query")
 def lambda_handler(event, context):
     """
     Use Bedrock knowledge base to answer questions about drift history
@@ -14,13 +19,11 @@ def lambda_handler(event, context):
     """
     
     # Initialize clients
-    bedrock_agent = boto3.client('bedrock-agent-runtime')
-    bedrock = boto3.client('bedrock-runtime')
+    bedrock_agent = aws_backend.client('bedrock-agent-runtime')
     
     # Get knowledge base ID from environment variables
     knowledge_base_id = os.environ.get('KNOWLEDGE_BASE_ID')
     retriever_id = os.environ.get('RETRIEVER_ID')
-    model_id = os.environ.get('MODEL_ID', 'anthropic.claude-3-haiku-20240307-v1:0')
     
     # Extract question from event
     question = event.get('question', '')
@@ -30,16 +33,20 @@ def lambda_handler(event, context):
             'body': 'No question provided'
         }
     
+    # Model calls have to finish before this, leaving time to answer without them
+    deadline = model_router.deadline_from_context(context)
+    
     try:
         # Query the knowledge base
-        retrieve_response = bedrock_agent.retrieve(
-            knowledgeBaseId=knowledge_base_id,
-            retrieverId=retriever_id,
-            retrievalQuery={
-                'text': question
-            },
-            numberOfResults=5
-        )
+        with drift_metrics.span("retrieve"):
+            retrieve_response = bedrock_agent.retrieve(
+                knowledgeBaseId=knowledge_base_id,
+                retrieverId=retriever_id,
+                retrievalQuery={
+                    'text': question
+                },
+                numberOfResults=5
+            )
         
         # Extract retrieved passages
         retrieved_results = retrieve_response.get('retrievalResults', [])
@@ -91,31 +98,20 @@ For predictions about future drift, base your analysis on:
 Format your answer in a clear, structured way with sections and bullet points where appropriate.
 """
         
-        # Call Bedrock
-        response = bedrock.invoke_model(
-            modelId=model_id,
-            body=json.dumps({
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 2000,
-                "temperature": 0.2,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            })
-        )
+        # Call Bedrock, hedging to the fast tier if the standard one is slow
+        with drift_metrics.span("bedrock_invoke"):
+            answer, routing = model_router.complete(prompt, 'standard', deadline)
         
-        # Parse response
-        result = json.loads(response['body'].read())
-        answer = result['content'][0]['text']
+        # No model answered by the deadline, return the retrieved reports themselves
+        if answer is None:
+            answer = retrieved_answer(retrieved_results)
         
         return {
             'statusCode': 200,
             'body': {
                 'answer': answer,
-                'sources': sources
+                'sources': sources,
+                'model_used': routing['model_id'] or 'retrieval only'
             }
         }
     except Exception as e:
@@ -127,4 +123,13 @@ Format your answer in a clear, structured way with sections and bullet points wh
             'body': {
                 'error': str(e)
             }
-        }
\ No newline at end of file
+        }
+
+def retrieved_answer(retrieved_results):
+    """Answer made of the retrieved passages, for when no model responds in time"""
+    answer = "The analysis model did not respond in time. These past drift reports are the most relevant to your question:\n\n"
+    for result in retrieved_results:
+        uri = result.get('location', {}).get('s3Location', {}).get('uri', '')
+        content = result.get('content', {}).get('text', '')
+        answer += f"- {uri or 'Drift report'}\n  {content[:500]}\n\n"
+    return answer
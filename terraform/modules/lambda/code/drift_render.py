@@ -0,0 +1,405 @@
+import io
+import json
+import string
+from datetime import datetime
+
+import drift_severity
+
+# Drift kind -> report key, attribution key, status label and verb
+DRIFT_KINDS = (
+    ("unmanaged", "unmanaged_resources", "created_by", "UNMANAGED", "Created"),
+    ("deleted", "deleted_resources", "deleted_by", "DELETED", "Deleted"),
+    ("modified", "modified_resources", "modified_by", "MODIFIED", "Modified"),
+)
+
+SEVERITY_BADGES = {
+    "CRITICAL": "🔴🔴🔴 CRITICAL 🔴🔴🔴",
+    "HIGH": "🟠🟠 HIGH 🟠🟠",
+    "MEDIUM": "🟡 MEDIUM 🟡",
+    "LOW": "🟢 LOW 🟢"
+}
+
+TERRAFORM_RESOURCE_TYPES = {
+    "EC2": "aws_instance",
+    "S3": "aws_s3_bucket",
+    "IAM": "aws_iam_user",
+    "RDS": "aws_db_instance",
+    "aws_instance": "aws_instance",
+    "aws_s3_bucket": "aws_s3_bucket",
+    "aws_iam_user": "aws_iam_user",
+    "aws_db_instance": "aws_db_instance",
+    "aws_vpc": "aws_vpc",
+    "aws_subnet": "aws_subnet"
+}
+
+# S3 rejects multipart parts below 5 MiB, except the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+def compile_template(template):
+    """
+    Check a "{field}" template once and return its format_map as a function
+    of one field dict. Only plain fields are allowed, so a value's own braces
+    or quotes are never interpreted.
+    """
+    for _, field, spec, conversion in string.Formatter().parse(template):
+        if field is not None and (spec or conversion or not field.isidentifier()):
+            raise ValueError(f"Unsupported field format in template: {field}")
+    return template.format_map
+
+
+MD_HEADER = (
+    "Dear DevOps/SRE Team,\n\n"
+    "DriftGuard has detected infrastructure drift that requires immediate attention.\n\n"
+    "---\n"
+)
+MD_SUMMARY_HEADING = compile_template("## {badge} **Drift Event Summary**\n\n")
+MD_SUMMARY_SECTIONS = {
+    "unmanaged": "### 🆕 **UNMANAGED RESOURCES:**\n\n",
+    "deleted": "### 🗑️ **DELETED RESOURCES:**\n\n",
+    "modified": "### 🔄 **MODIFIED RESOURCES:**\n\n"
+}
+MD_SUMMARY_ITEM = compile_template(
+    "- **Resource Name: `{type}`**\n"
+    "  **Resource ID: `{id}`**\n"
+    "  **Status: `{status}`**\n"
+    "  Region: {region}\n"
+    "  Event: {event}\n"
+    "  {verb} by: {user}\n"
+    "  Timestamp: {time}\n\n"
+)
+MD_SUMMARY_FOOTER = compile_template(
+    "\n**Drift ID:** `{drift_id}`\n"
+    "**Account:** `123456789012`\n"  # Placeholder account ID
+    "**Detected:** `{timestamp}` UTC\n\n"
+    "---\n"
+)
+
+MD_EXPLANATION_HEADING = (
+    "## 🔍 **AI Analysis & Remediation**\n\n\n"
+    "Here is a detailed drift analysis for the detected infrastructure changes:\n\n"
+    "## 1. Drift Explanation\n\n"
+)
+MD_EXPLANATION_SECTIONS = {
+    "unmanaged": "- **Unmanaged Resources:** The following resources exist in AWS but are not managed by Terraform:\n",
+    "deleted": "- **Deleted Resources:** The following resources are defined in Terraform but have been deleted from AWS:\n",
+    "modified": "- **Modified Resources:** The following resources have been modified outside of Terraform:\n"
+}
+MD_EXPLANATION_ITEM = compile_template("  - {type} `{id}` was {action} via `{event}` by `{user}`\n")
+MD_EXPLANATION_CHANGE = compile_template("    - The `{attribute}` was changed from `{expected}` (desired) to `{actual}` (actual)\n")
+MD_RISKS = (
+    "This is considered drift from the desired infrastructure state defined in IaC. "
+    "The likely cause is direct manual changes through the AWS Console by a user.\n\n"
+    "For a banking environment, these changes could impact security groups, auto-scaling rules, monitoring alerts, "
+    "and other dependencies. The changes pose operational, security, and compliance risks.\n\n"
+    "## 2. Risk Assessment\n\n"
+    "- **Security**: Unauthorized changes could bypass security controls like VPC Network ACLs, IAM policies, etc. "
+    "Mismatched configurations could break security group rules.\n\n"
+    "- **Compliance**: Drift from approved configurations could violate regulatory requirements for banking environments.\n\n"
+    "- **Operations**: Dependency failures from unexpected changes. May increase costs or impact performance.\n\n"
+    "- **Cost**: Unmanaged resources or modified configurations could lead to unexpected costs.\n\n"
+    "## 3. Remediation Options\n\n"
+    "### Option A: Revert to IaC State\n\n"
+    "**AWS Console Steps:**\n\n"
+)
+MD_CONSOLE_STEPS = {
+    "modified": "1. Review the modified resources in the AWS Console\n\n2. Revert the changes manually or proceed with Terraform commands\n\n",
+    "unmanaged": "3. Consider removing unmanaged resources if they're not needed\n\n",
+    "deleted": "4. Be aware that deleted resources will be recreated\n\n"
+}
+MD_REVERT = (
+    "**Terraform Commands:**\n\n"
+    "```\n"
+    "# Review what changes will be made\n"
+    "terraform plan -out=tfplan\n\n"
+    "# Apply the changes to revert to the IaC state\n"
+    "terraform apply tfplan\n\n"
+    "# Verify resources match IaC state\n"
+    "```\n\n"
+    "### Option B: Update IaC to Match Current State\n\n"
+    "**Terraform Changes:**\n\n"
+)
+MD_REMEDIATION_SECTIONS = {
+    "unmanaged": "- For unmanaged resources, import them into Terraform:\n\n```\n",
+    "modified": "- For modified resources, update your Terraform code:\n\n```\n",
+    "deleted": "- For deleted resources, remove them from Terraform:\n\n```\n"
+}
+MD_IMPORT_FILE = compile_template("- Import and resource blocks for every unmanaged resource, written from their live attributes: `{remediation_file}`\n\n")
+MD_IMPORT = compile_template(
+    "# Import {type} {id}\n"
+    "terraform import {tf_type}.{name} {id}\n\n"
+    "# Add to your Terraform configuration:\n"
+    "{code}\n\n"
+)
+MD_UPDATE_HEADER = compile_template("# Update {type} {id} in your Terraform configuration:\nresource \"{tf_type}\" \"{name}\" {{\n")
+MD_UPDATE_STRING = compile_template("  {attribute} = \"{actual}\"\n")
+MD_UPDATE_VALUE = compile_template("  {attribute} = {actual}\n")
+MD_UPDATE_FOOTER = "  # other attributes remain the same\n}\n\n"
+MD_REMOVE = compile_template(
+    "# Remove {type} {id} from your Terraform state:\n"
+    "terraform state rm {tf_type}.{name}\n\n"
+    "# Also remove the resource block from your Terraform files\n\n"
+)
+MD_FOOTER = (
+    "**Process:**\n\n"
+    "```\n"
+    "terraform plan -out=tfplan\n\n"
+    "terraform apply tfplan\n\n"
+    "# Commit changes, raise PR, go through CI/CD process\n\n"
+    "# Update documentation to match new configuration\n"
+    "```\n\n"
+    "## 4. Immediate Actions\n\n"
+    "- Enable AWS Config Rules to detect/alert on configuration changes\n\n"
+    "- Setup drift detection to run daily and alert on any deviations\n\n"
+    "- Educate users on proper change management procedures\n\n"
+    "- Lock down IAM permissions to restrict unauthorized modifications\n\n"
+    "Please let me know if you need any clarification or have additional questions!\n\n"
+    "---\n"
+    "**This is an automated alert from DriftGuard System** \n"
+    "For technical issues, contact the DevOps team.\n"
+)
+
+TEXT_HEADER = "INFRASTRUCTURE DRIFT SUMMARY\n\n"
+TEXT_SECTION = compile_template("{status} RESOURCES ({count}):\n")
+TEXT_ITEM = compile_template("- {type} {id}\n  {verb} by: {user} at {time}\n  Region: {region}\n  Event: {event}\n")
+TEXT_CHANGE = compile_template("  • {attribute}: {expected} -> {actual}\n")
+
+STATE_HEADER = "TERRAFORM STATE CHANGES\n\n"
+STATE_SECTIONS = (
+    ("added", compile_template("ADDED RESOURCES ({count}):\n"), compile_template("+ {type} {id}\n")),
+    ("removed", compile_template("REMOVED RESOURCES ({count}):\n"), compile_template("- {type} {id}\n")),
+    ("modified", compile_template("MODIFIED TERRAFORM RESOURCES ({count}):\n"), compile_template("~ {type} {id}\n")),
+)
+STATE_CHANGE = compile_template("  ~ {name}: {old} -> {new}\n")
+
+TERRAFORM_CODE = {
+    "aws_instance": compile_template("resource \"aws_instance\" \"{name}\" {{\n  ami           = \"ami-12345678\"  # Replace with actual AMI ID\n  instance_type = \"t3.micro\"     # Replace with actual instance type\n  tags = {{\n    Name = \"{id}\"\n  }}\n}}"),
+    "aws_s3_bucket": compile_template("resource \"aws_s3_bucket\" \"{name}\" {{\n  bucket = \"{id}\"\n  tags = {{\n    Name = \"{id}\"\n  }}\n}}"),
+    "aws_iam_user": compile_template("resource \"aws_iam_user\" \"{name}\" {{\n  name = \"{id}\"\n  tags = {{\n    Name = \"{id}\"\n  }}\n}}"),
+    "aws_db_instance": compile_template("resource \"aws_db_instance\" \"{name}\" {{\n  identifier           = \"{id}\"\n  allocated_storage    = 20  # Replace with actual storage\n  engine               = \"mysql\"  # Replace with actual engine\n  instance_class       = \"db.t3.micro\"  # Replace with actual class\n  # Add other required attributes\n}}"),
+    "aws_vpc": compile_template("resource \"aws_vpc\" \"{name}\" {{\n  cidr_block = \"10.0.0.0/16\"  # Replace with actual CIDR\n  tags = {{\n    Name = \"{id}\"\n  }}\n}}"),
+    "aws_subnet": compile_template("resource \"aws_subnet\" \"{name}\" {{\n  vpc_id     = \"vpc-12345678\"  # Replace with actual VPC ID\n  cidr_block = \"10.0.1.0/24\"  # Replace with actual CIDR\n  tags = {{\n    Name = \"{id}\"\n  }}\n}}")
+}
+TERRAFORM_CODE_DEFAULT = compile_template("resource \"{tf_type}\" \"{name}\" {{\n  # Add required attributes for {type}\n  # Refer to Terraform documentation\n}}")
+
+
+def get_terraform_resource_type(aws_resource_type):
+    """Convert AWS resource type to Terraform resource type"""
+    return TERRAFORM_RESOURCE_TYPES.get(aws_resource_type, "aws_resource")
+
+
+def generate_terraform_code(resource_type, resource_id):
+    """Generate example Terraform code for a resource"""
+    tf_type = get_terraform_resource_type(resource_type)
+    template = TERRAFORM_CODE.get(tf_type, TERRAFORM_CODE_DEFAULT)
+    return template({"name": resource_id.replace("-", "_"), "id": resource_id, "tf_type": tf_type, "type": resource_type})
+
+
+def resource_item(status, verb, actor_key, resource):
+    """The fields every format renders for one drifted resource"""
+    actor = resource.get(actor_key) or {}
+    changes = resource.get("changes")
+    return {
+        "type": resource.get("type", "Unknown"),
+        "id": resource.get("id", "Unknown"),
+        "status": status,
+        "verb": verb,
+        "user": actor.get("user", "unknown"),
+        "event": actor.get("event", "unknown"),
+        "time": actor.get("time", "unknown"),
+        "region": actor.get("region", "unknown"),
+        "changes": [
+            {"attribute": c.get("attribute", ""), "expected": c.get("expected", ""), "actual": c.get("actual", "")}
+            for c in changes
+        ] if changes else []
+    }
+
+
+def markdown_item(kind, item, buffers):
+    """Summary, explanation and remediation fragments of one resource"""
+    summary, explanation, remediation = buffers
+    item["action"] = item["verb"].lower()
+    item["tf_type"] = get_terraform_resource_type(item["type"])
+    item["name"] = item["id"].replace("-", "_")
+    summary.append(MD_SUMMARY_ITEM(item))
+    explanation.append(MD_EXPLANATION_ITEM(item))
+
+    if kind == "unmanaged":
+        item["code"] = generate_terraform_code(item["type"], item["id"])
+        remediation.append(MD_IMPORT(item))
+    elif kind == "deleted":
+        remediation.append(MD_REMOVE(item))
+    elif item["changes"]:
+        remediation.append(MD_UPDATE_HEADER(item))
+        for change in item["changes"]:
+            explanation.append(MD_EXPLANATION_CHANGE(change))
+            actual = change["actual"]
+            if isinstance(actual, str) and not actual.isnumeric():
+                remediation.append(MD_UPDATE_STRING(change))
+            else:
+                remediation.append(MD_UPDATE_VALUE(change))
+        remediation.append(MD_UPDATE_FOOTER)
+
+
+def markdown_document(report, counts, sections):
+    yield MD_HEADER
+    if any(counts.values()):
+        yield MD_SUMMARY_HEADING({"badge": SEVERITY_BADGES[report["severity"]]})
+        for kind in ("unmanaged", "deleted", "modified"):
+            if counts[kind]:
+                yield MD_SUMMARY_SECTIONS[kind]
+                yield from sections[kind][0]
+        yield MD_SUMMARY_FOOTER(report)
+
+    yield MD_EXPLANATION_HEADING
+    for kind in ("unmanaged", "deleted", "modified"):
+        if counts[kind]:
+            yield MD_EXPLANATION_SECTIONS[kind]
+            yield from sections[kind][1]
+            yield "\n"
+
+    yield MD_RISKS
+    for kind in ("modified", "unmanaged", "deleted"):
+        if counts[kind]:
+            yield MD_CONSOLE_STEPS[kind]
+
+    yield MD_REVERT
+    if counts["unmanaged"] and report.get("remediation_file"):
+        yield MD_IMPORT_FILE(report)
+    for kind in ("unmanaged", "modified", "deleted"):
+        if counts[kind]:
+            yield MD_REMEDIATION_SECTIONS[kind]
+            yield from sections[kind][2]
+            yield "```\n\n"
+    yield MD_FOOTER
+
+
+def text_item(kind, item, buffers):
+    section = buffers[0]
+    section.append(TEXT_ITEM(item))
+    for change in item["changes"]:
+        section.append(TEXT_CHANGE(change))
+
+
+def text_document(report, counts, sections):
+    yield TEXT_HEADER
+    for kind, _, _, status, _ in DRIFT_KINDS:
+        if counts[kind]:
+            yield TEXT_SECTION({"status": status, "count": counts[kind]})
+            yield from sections[kind][0]
+            yield "\n"
+
+
+def json_item(kind, item, buffers):
+    del item["verb"]
+    buffers[0].append(item)
+
+
+def json_document(report, counts, sections):
+    document = dict(report, counts=counts)
+    for kind, key, _, _, _ in DRIFT_KINDS:
+        document[key] = sections[kind][0]
+    # iterencode streams the document instead of building one large string
+    yield from json.JSONEncoder(default=str).iterencode(document)
+
+
+FORMATS = {
+    "markdown": (markdown_item, markdown_document),
+    "text": (text_item, text_document),
+    "json": (json_item, json_document),
+}
+
+
+def render(drift_report, fmt="markdown", assessment=None, drift_id=None):
+    """
+    Render a drift report as a stream of text chunks.
+
+    One pass over the drifted resources fills every section's fragments, then
+    the document is emitted section by section. fmt is "markdown" (the email
+    and knowledge base report), "text" (the plain summary) or "json".
+    """
+    render_item, render_document = FORMATS[fmt]
+    counts = {}
+    # Per drift kind: summary, explanation and remediation fragments
+    sections = {}
+    for kind, key, actor_key, status, verb in DRIFT_KINDS:
+        resources = drift_report.get(key, [])
+        counts[kind] = len(resources)
+        buffers = sections[kind] = ([], [], [])
+        for resource in resources:
+            render_item(kind, resource_item(status, verb, actor_key, resource), buffers)
+
+    report = {
+        "drift_id": drift_id or f"drift-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}",
+        "timestamp": drift_report.get("timestamp", datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"))
+    }
+    if drift_report.get("remediation_file"):
+        report["remediation_file"] = drift_report["remediation_file"]
+    if fmt != "text":
+        assessment = assessment or drift_report.get("severity") or drift_severity.assess(drift_report)
+        report.update(severity=assessment["severity"], score=assessment["score"])
+    return render_document(report, counts, sections)
+
+
+def render_string(drift_report, fmt="markdown", assessment=None, drift_id=None):
+    return "".join(render(drift_report, fmt, assessment, drift_id))
+
+
+def state_change_summary(changes):
+    """Plain text summary of Terraform state changes"""
+    sections = {}
+    for change in changes:
+        sections.setdefault(change["action"], []).append(change)
+
+    chunks = [STATE_HEADER]
+    for action, heading, line in STATE_SECTIONS:
+        resources = sections.get(action)
+        if not resources:
+            continue
+        chunks.append(heading({"count": len(resources)}))
+        for resource in resources:
+            chunks.append(line(resource))
+            if action == "modified":
+                chunks.extend(STATE_CHANGE(c) for c in resource["changes"])
+                chunks.append("\n")
+        if action != "modified":
+            chunks.append("\n")
+    return "".join(chunks)
+
+
+def stream_to_s3(s3, bucket, key, chunks, content_type="text/markdown", part_size=MIN_PART_SIZE):
+    """
+    Upload rendered chunks without holding the whole document as one string.
+
+    Output that stays under part_size is a single put_object; past that the
+    upload switches to multipart and each part is sent as soon as it fills.
+    Returns the number of bytes written.
+    """
+    buffer = io.BytesIO()
+    upload_id = None
+    parts = []
+    size = 0
+    try:
+        for chunk in chunks:
+            size += buffer.write(chunk.encode("utf-8"))
+            if buffer.tell() >= part_size:
+                if upload_id is None:
+                    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type)["UploadId"]
+                part_number = len(parts) + 1
+                response = s3.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=buffer.getvalue())
+                parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+                buffer = io.BytesIO()
+
+        if upload_id is None:
+            s3.put_object(Bucket=bucket, Key=key, Body=buffer.getvalue(), ContentType=content_type)
+            return size
+        if buffer.tell():
+            part_number = len(parts) + 1
+            response = s3.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=buffer.getvalue())
+            parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+        s3.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts})
+        return size
+    except Exception:
+        if upload_id is not None:
+            s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
@@ -0,0 +1,260 @@
+"""
+Point-in-time drift replay.
+
+Rebuilds both sides of drift detection as they stood at a past time: the
+Terraform state version that was current then, and the AWS configuration that
+AWS Config had recorded then. Drift is computed with the same comparators and
+ignore rules as a live scan. Parsed state versions, Config items and drift
+results are cached by version, so scrubbing through many points of a timeline
+only fetches and diffs what changed between them.
+
+    replay = DriftReplay(bucket, key)
+    points = replay.timeline(["2024-05-01T00:00:00Z", "2024-05-02T00:00:00Z"])
+"""
+import bisect
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import aws_backend
+import drift_checker
+import drift_json
+import drift_metrics
+import ignore_rules
+import resource_records
+import state_history
+
+# Parsed state versions and drift results kept per replay, least recently used dropped first
+STATE_CACHE_SIZE = 16
+RESULT_CACHE_SIZE = 256
+
+# Config history page size (the API maximum)
+HISTORY_PAGE = 100
+
+# Config item statuses meaning the resource did not exist at that time
+ABSENT_STATUSES = frozenset({"ResourceDeleted", "ResourceDeletedNotRecorded", "ResourceNotRecorded"})
+
+
+def as_utc(value):
+    """UTC datetime from an ISO string or a naive/aware datetime"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def iso(value):
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ") if value else None
+
+
+def ec2_record(item, configuration):
+    if (configuration.get("state") or {}).get("name") == "terminated":
+        return None
+    return resource_records.ResourceRecord("EC2", {
+        "instance_type": configuration.get("instanceType"),
+        "ami": configuration.get("imageId"),
+        "tags": dict(item.get("tags") or {}),
+        "subnet_id": configuration.get("subnetId"),
+        "security_groups": [sg["groupId"] for sg in configuration.get("securityGroups", [])]
+    })
+
+
+def s3_record(item, configuration):
+    return resource_records.ResourceRecord("S3", {
+        "tags": dict(item.get("tags") or {})
+    })
+
+
+def iam_record(item, configuration):
+    return resource_records.ResourceRecord("IAM", {
+        "arn": configuration.get("arn") or item.get("arn"),
+        "path": configuration.get("path")
+    })
+
+
+def rds_record(item, configuration):
+    return resource_records.ResourceRecord("RDS", {
+        "engine": configuration.get("engine"),
+        "engine_version": configuration.get("engineVersion"),
+        "instance_class": configuration.get("dBInstanceClass"),
+        "storage_size": configuration.get("allocatedStorage"),
+        "multi_az": configuration.get("multiAZ"),
+        "tags": dict(item.get("tags") or {}),
+        "arn": configuration.get("dBInstanceArn") or item.get("arn"),
+        "resource_id": configuration.get("dbiResourceId") or item.get("resourceId")
+    })
+
+
+# Config resource type -> (identifier field the inventory is keyed by, Config item -> inventory record)
+CONFIG_TYPES = {
+    "AWS::EC2::Instance": ("resourceId", ec2_record),
+    "AWS::S3::Bucket": ("resourceName", s3_record),
+    "AWS::IAM::User": ("resourceName", iam_record),
+    "AWS::RDS::DBInstance": ("resourceName", rds_record)
+}
+
+
+class ResourceHistory:
+    """
+    Config items of one resource, newest first.
+
+    Pages are fetched from the newest item backwards, only as far as the oldest
+    time asked for so far. Each item is converted to an inventory record once.
+    """
+
+    __slots__ = ("resource_type", "resource_id", "key", "items", "times", "token", "complete", "records")
+
+    def __init__(self, resource_type, resource_id, key):
+        self.resource_type = resource_type
+        self.resource_id = resource_id
+        self.key = key
+        self.items = []
+        # Negated capture timestamps, ascending, for bisect
+        self.times = []
+        self.token = None
+        self.complete = False
+        self.records = {}
+
+    def fetch(self, config):
+        kwargs = {"resourceType": self.resource_type, "resourceId": self.resource_id, "limit": HISTORY_PAGE}
+        if self.token:
+            kwargs["nextToken"] = self.token
+        try:
+            response = config.get_resource_config_history(**kwargs)
+        except Exception as e:
+            if drift_metrics.error_code(e) != "ResourceNotDiscoveredException":
+                print(f"Error getting Config history for {self.resource_id}: {e}")
+            self.complete = True
+            return
+        for item in response.get("configurationItems", []):
+            self.items.append(item)
+            self.times.append(-as_utc(item["configurationItemCaptureTime"]).timestamp())
+        self.token = response.get("nextToken")
+        self.complete = not self.token
+
+    def item_at(self, config, when):
+        """The Config item in effect at when, or None before the first one"""
+        target = -when.timestamp()
+        while True:
+            index = bisect.bisect_left(self.times, target)
+            if index < len(self.items):
+                return self.items[index]
+            if self.complete:
+                return None
+            self.fetch(config)
+
+    def record_at(self, config, when):
+        """(configuration state id, inventory record) at when, or None if the resource did not exist"""
+        item = self.item_at(config, when)
+        if item is None or item["configurationItemStatus"] in ABSENT_STATUSES:
+            return None
+        state_id = item["configurationStateId"]
+        if state_id not in self.records:
+            configuration = item.get("configuration") or {}
+            if isinstance(configuration, str):
+                configuration = drift_json.loads(configuration)
+            self.records[state_id] = CONFIG_TYPES[self.resource_type][1](item, configuration)
+        record = self.records[state_id]
+        return (state_id, record) if record is not None else None
+
+
+class DriftReplay:
+    """Drift between one state object and AWS Config history at any past time"""
+
+    def __init__(self, bucket, key, rules=None):
+        self.s3 = aws_backend.client("s3")
+        self.config = aws_backend.client("config")
+        self.state = state_history.StateHistory(self.s3, bucket, key, drift_checker.extract_managed_resources, cache_size=STATE_CACHE_SIZE)
+        self.rules = ignore_rules.load_rules() if rules is None else rules
+        self.histories = None
+        self.results = OrderedDict()
+        self.hits = 0
+        self.lock = threading.Lock()
+
+    def discover(self):
+        """Every resource Config has recorded for the inventory types, deleted ones included"""
+        histories = []
+        for resource_type, (key_field, _) in CONFIG_TYPES.items():
+            kwargs = {"resourceType": resource_type, "includeDeletedResources": True, "limit": 100}
+            try:
+                while True:
+                    response = self.config.list_discovered_resources(**kwargs)
+                    for identifier in response.get("resourceIdentifiers", []):
+                        key = identifier.get(key_field) or identifier["resourceId"]
+                        histories.append(ResourceHistory(resource_type, identifier["resourceId"], key))
+                    if not response.get("nextToken"):
+                        break
+                    kwargs["nextToken"] = response["nextToken"]
+            except Exception as e:
+                print(f"Error listing Config resources of type {resource_type}: {e}")
+        self.histories = histories
+
+    def actual_at(self, when):
+        """Inventory records reconstructed at when, and a digest of the Config items they came from"""
+        if self.histories is None:
+            self.discover()
+        actual_resources = {}
+        state_ids = []
+        for history in self.histories:
+            found = history.record_at(self.config, when)
+            if found:
+                state_id, record = found
+                actual_resources[history.key] = record
+                state_ids.append((history.resource_id, state_id))
+        return actual_resources, resource_records.attribute_digest(state_ids)
+
+    def drift_at(self, when):
+        """Drift at one point in time, with the state version it was computed against"""
+        when = as_utc(when)
+        with self.lock:
+            version = self.state.version_at(when)
+            if version and not version[2]:
+                version_id = version[1]
+                managed_resources = self.state.parsed(version_id)
+            else:
+                version_id = None
+                managed_resources = {}
+            actual_resources, actual_digest = self.actual_at(when)
+
+            cache_key = (version_id, actual_digest)
+            result = self.results.get(cache_key)
+            if result is not None:
+                self.results.move_to_end(cache_key)
+                self.hits += 1
+            else:
+                unmanaged, deleted, modified = drift_checker.diff_resources(managed_resources, actual_resources)
+                unmanaged, deleted, modified, ignored = ignore_rules.apply(
+                    self.rules, unmanaged, deleted, modified, managed_resources, actual_resources
+                )
+                result = {
+                    "unmanaged_resources": unmanaged,
+                    "deleted_resources": deleted,
+                    "modified_resources": modified,
+                    "ignored": ignored
+                }
+                self.results[cache_key] = result
+                if len(self.results) > RESULT_CACHE_SIZE:
+                    self.results.popitem(last=False)
+
+        return dict(
+            result,
+            time=iso(when),
+            state_version=version_id,
+            state_time=iso(version[0]) if version else None,
+            managed_resources=len(managed_resources),
+            actual_resources=len(actual_resources)
+        )
+
+    def timeline(self, times):
+        """Drift at each of the given times, oldest first"""
+        return [self.drift_at(when) for when in sorted(as_utc(t) for t in times)]
+
+    def stats(self):
+        return {
+            "state_versions": len(self.state.versions or ()),
+            "state_loads": self.state.loads,
+            "config_resources": len(self.histories or ()),
+            "config_items": sum(len(h.items) for h in self.histories or ()),
+            "result_cache_hits": self.hits
+        }
@@ -0,0 +1,371 @@
+"""
+Long-running drift detection service.
+
+An alternative to the Lambda handlers that keeps the Terraform state index and
+the AWS inventory in memory. It reconciles periodically, applies EventBridge
+events as they arrive by refreshing only the affected service, and answers
+drift queries over a local HTTP endpoint from the in-memory indexes.
+
+    python drift_service.py --port 8080 --interval 300 --concurrency 4
+
+Endpoints:
+    GET  /health              service status
+    GET  /drift               current drift (?attribute=true adds CloudTrail authors)
+    GET  /drift/<resource_id> drift, Terraform and AWS details for one resource
+    GET  /replay?at=<time>    drift at past times from state versions and Config history (repeat at)
+    POST /events              enqueue one EventBridge/S3 event or a list of them
+    POST /reconcile           reload state and inventory now
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs, unquote
+
+import aws_backend
+import drift_checker
+import drift_json
+import drift_replay
+import ignore_rules
+
+# AWS Config resource type -> inventory collector key
+CONFIG_RESOURCE_SERVICES = {
+    "AWS::EC2::Instance": "EC2",
+    "AWS::S3::Bucket": "S3",
+    "AWS::IAM::User": "IAM",
+    "AWS::RDS::DBInstance": "RDS"
+}
+
+# CloudTrail event source prefix -> inventory collector key
+EVENT_SOURCE_SERVICES = {
+    "ec2": "EC2",
+    "s3": "S3",
+    "iam": "IAM",
+    "rds": "RDS"
+}
+
+HTTP_STATUS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+class DriftService:
+    """In-memory drift state kept current by reconciliation and events"""
+
+    def __init__(self, bucket, key, interval=300, concurrency=4):
+        self.bucket = bucket
+        self.key = key
+        self.interval = interval
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.events = asyncio.Queue()
+
+        self.state_etag = None
+        self.managed_resources = {}
+        self.inventory = {service: {} for service in drift_checker.INVENTORY_PAGES}
+        self.actual_resources = {}
+        self.drift = {"unmanaged_resources": [], "deleted_resources": [], "modified_resources": []}
+        self.drift_index = {}
+        self.authors = {}
+        self.ignored = {}
+        self.replay = None
+
+        self.generation = 0
+        self.last_reconcile = None
+        self.events_processed = 0
+
+    async def call(self, func, *args, **kwargs):
+        """
+        Run a blocking AWS call in a worker thread under the concurrency cap.
+
+        func should make one request (or one page of requests), so a permit is
+        never held across a whole scan.
+        """
+        async with self.semaphore:
+            return await asyncio.to_thread(func, *args, **kwargs)
+
+    async def load_state(self, force=False):
+        """Reload the Terraform state if its ETag changed"""
+        s3 = aws_backend.client("s3")
+        if not force:
+            head = await self.call(s3.head_object, Bucket=self.bucket, Key=self.key)
+            if head.get("ETag") == self.state_etag:
+                return False
+        state_obj = await self.call(s3.get_object, Bucket=self.bucket, Key=self.key)
+        body = await asyncio.to_thread(state_obj["Body"].read)
+        tfstate = drift_json.loads(body)
+        self.managed_resources = drift_checker.extract_managed_resources(tfstate)
+        self.state_etag = state_obj.get("ETag")
+        print(f"Loaded Terraform state with {len(self.managed_resources)} resources")
+        return True
+
+    async def collect(self, service):
+        """
+        All resources of one service, with each page fetched under the concurrency
+        cap, so the services of a refresh share the cap page by page.
+        """
+        client_name, page = drift_checker.INVENTORY_PAGES[service]
+        resources = {}
+        try:
+            client = aws_backend.client(client_name)
+            token = None
+            while True:
+                batch, token = await self.call(page, client, token)
+                resources.update(batch)
+                if not token:
+                    break
+        except Exception as e:
+            print(f"Error getting {service} resources: {e}")
+        return resources
+
+    async def refresh_inventory(self, services=None):
+        """Re-collect the given services (all by default) concurrently"""
+        services = list(services or drift_checker.INVENTORY_PAGES)
+        results = await asyncio.gather(*(self.collect(s) for s in services))
+        for service, resources in zip(services, results):
+            self.inventory[service] = resources
+        actual_resources = {}
+        for resources in self.inventory.values():
+            actual_resources.update(resources)
+        self.actual_resources = actual_resources
+
+    def recompute(self):
+        """Diff the in-memory state against the in-memory inventory"""
+        unmanaged, deleted, modified = drift_checker.diff_resources(self.managed_resources, self.actual_resources)
+        unmanaged, deleted, modified, self.ignored = ignore_rules.apply(
+            ignore_rules.load_rules(), unmanaged, deleted, modified, self.managed_resources, self.actual_resources
+        )
+        self.drift = {"unmanaged_resources": unmanaged, "deleted_resources": deleted, "modified_resources": modified}
+        self.drift_index = {}
+        for kind, resources in self.drift.items():
+            for resource in resources:
+                self.drift_index[resource["id"]] = (kind, resource)
+        # Authors are only valid for the drift they were looked up for
+        self.authors = {k: v for k, v in self.authors.items() if k in self.drift_index}
+        self.generation += 1
+
+    async def reconcile(self):
+        start = time.perf_counter()
+        await asyncio.gather(self.load_state(), self.refresh_inventory())
+        self.recompute()
+        # Replay caches are kept between requests, and rebuilt after reconciling to see new history
+        self.replay = None
+        self.last_reconcile = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+        print(f"Reconciled in {time.perf_counter() - start:.2f}s: {self.counts()}")
+
+    async def reconcile_loop(self):
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                print(f"Error during reconciliation: {e}")
+            await asyncio.sleep(self.interval)
+
+    def services_for_event(self, event):
+        """
+        Work an event requires: (reload_state, services_to_refresh).
+
+        services_to_refresh is None when the event cannot be narrowed down.
+        """
+        detail = event.get("detail") or {}
+        if detail.get("configurationItem"):
+            service = CONFIG_RESOURCE_SERVICES.get(detail["configurationItem"].get("resourceType"))
+            return False, {service} if service else None
+        if event.get("detail-type") == "AWS API Call via CloudTrail":
+            service = EVENT_SOURCE_SERVICES.get(detail.get("eventSource", "").split(".")[0])
+            return False, {service} if service else None
+        if detail.get("object", {}).get("key", "").endswith(".tfstate"):
+            return True, set()
+        if event.get("Records") and event["Records"][0].get("s3"):
+            return True, set()
+        return True, None
+
+    async def consume_events(self):
+        """Apply queued events, coalescing everything queued into one refresh"""
+        while True:
+            batch = [await self.events.get()]
+            while not self.events.empty():
+                batch.append(self.events.get_nowait())
+
+            reload_state, services = False, set()
+            for event in batch:
+                event_reload, event_services = self.services_for_event(event)
+                reload_state = reload_state or event_reload
+                services = None if services is None or event_services is None else services | event_services
+
+            try:
+                tasks = []
+                if reload_state:
+                    tasks.append(self.load_state(force=True))
+                if services is None or services:
+                    tasks.append(self.refresh_inventory(services))
+                await asyncio.gather(*tasks)
+                self.recompute()
+            except Exception as e:
+                print(f"Error applying {len(batch)} events: {e}")
+            self.events_processed += len(batch)
+            for _ in batch:
+                self.events.task_done()
+
+    async def attribute(self, resource_ids):
+        """Look up CloudTrail authors for drifted resources, caching the results"""
+        missing = [r for r in resource_ids if r not in self.authors and r in self.drift_index]
+        authors = await asyncio.gather(*(
+            self.call(drift_checker.get_change_author, r, self.drift_index[r][1]["type"]) for r in missing
+        ))
+        self.authors.update(zip(missing, authors))
+
+    def counts(self):
+        return {
+            "unmanaged_count": len(self.drift["unmanaged_resources"]),
+            "deleted_count": len(self.drift["deleted_resources"]),
+            "modified_count": len(self.drift["modified_resources"])
+        }
+
+    def drift_response(self, with_authors):
+        author_keys = {"unmanaged_resources": "created_by", "deleted_resources": "deleted_by", "modified_resources": "modified_by"}
+        body = {"generation": self.generation, "last_reconcile": self.last_reconcile, "drift_detected": bool(self.drift_index)}
+        body.update(self.counts())
+        body["ignored"] = self.ignored
+        for kind, resources in self.drift.items():
+            if with_authors:
+                resources = [dict(r, **{author_keys[kind]: self.authors.get(r["id"])}) for r in resources]
+            body[kind] = resources
+        return body
+
+    async def route(self, method, path, query, body):
+        """Dispatch one HTTP request, returning (status, payload)"""
+        if path == "/health" and method == "GET":
+            return 200, {
+                "status": "ok",
+                "generation": self.generation,
+                "last_reconcile": self.last_reconcile,
+                "managed_resources": len(self.managed_resources),
+                "actual_resources": len(self.actual_resources),
+                "queued_events": self.events.qsize(),
+                "events_processed": self.events_processed
+            }
+
+        if path == "/drift" and method == "GET":
+            with_authors = query.get("attribute", ["false"])[0].lower() == "true"
+            if with_authors:
+                await self.attribute(list(self.drift_index))
+            return 200, self.drift_response(with_authors)
+
+        if path.startswith("/drift/") and method == "GET":
+            resource_id = unquote(path[len("/drift/"):])
+            kind, resource = self.drift_index.get(resource_id, (None, None))
+            terraform_id = resource.get("terraform_id", resource_id) if resource else resource_id
+            managed = self.managed_resources.get(terraform_id)
+            actual = self.actual_resources.get(resource_id)
+            if resource is not None and query.get("attribute", ["false"])[0].lower() == "true":
+                await self.attribute([resource_id])
+            if resource is None and resource_id not in self.managed_resources and resource_id not in self.actual_resources:
+                return 404, {"error": f"Unknown resource {resource_id}"}
+            return 200, {
+                "id": resource_id,
+                "drift": kind,
+                "details": resource,
+                "changed_by": self.authors.get(resource_id),
+                "terraform": managed.to_dict() if managed else None,
+                "aws": actual.to_dict() if actual else None
+            }
+
+        if path == "/replay" and method == "GET":
+            if not query.get("at"):
+                return 400, {"error": "at is required"}
+            if self.replay is None:
+                self.replay = drift_replay.DriftReplay(self.bucket, self.key)
+            try:
+                points = await self.call(self.replay.timeline, query["at"])
+            except ValueError as e:
+                return 400, {"error": f"Invalid time: {e}"}
+            return 200, {"replay": points, "stats": self.replay.stats()}
+
+        if path == "/events" and method == "POST":
+            events = body if isinstance(body, list) else [body]
+            for event in events:
+                self.events.put_nowait(event)
+            return 202, {"queued": len(events)}
+
+        if path == "/reconcile" and method == "POST":
+            await self.reconcile()
+            return 200, dict(self.counts(), generation=self.generation)
+
+        if path in ("/health", "/drift", "/replay", "/events", "/reconcile") or path.startswith("/drift/"):
+            return 405, {"error": f"{method} not allowed on {path}"}
+        return 404, {"error": f"No route for {path}"}
+
+    async def handle_http(self, reader, writer):
+        """Minimal HTTP/1.1 handler, one request per connection"""
+        try:
+            request_line = (await reader.readline()).decode("latin-1").strip()
+            if not request_line:
+                return
+            method, target, _ = request_line.split(" ", 2)
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            raw = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+            url = urlsplit(target)
+            try:
+                body = drift_json.loads(raw) if raw else None
+            except ValueError:
+                status, payload = 400, {"error": "Request body is not valid JSON"}
+            else:
+                try:
+                    status, payload = await self.route(method.upper(), url.path, parse_qs(url.query), body)
+                except Exception as e:
+                    print(f"Error handling {method} {url.path}: {e}")
+                    status, payload = 500, {"error": str(e)}
+
+            data = drift_json.dumpb(payload, default=str)
+            writer.write(
+                f"HTTP/1.1 {status} {HTTP_STATUS.get(status, '')}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1") + data
+            )
+            await writer.drain()
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError) as e:
+            print(f"Malformed request: {e}")
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8080):
+        """Reconcile once, then serve HTTP while reconciling and consuming events"""
+        await self.reconcile()
+        server = await asyncio.start_server(self.handle_http, host, port)
+        print(f"Drift service listening on http://{host}:{port}")
+        async with server:
+            await asyncio.gather(
+                server.serve_forever(),
+                self.consume_events(),
+                self.delayed_reconcile_loop()
+            )
+
+    async def delayed_reconcile_loop(self):
+        await asyncio.sleep(self.interval)
+        await self.reconcile_loop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Long-running drift detection service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--interval", type=int, default=300, help="Seconds between full reconciliations")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum concurrent AWS calls")
+    parser.add_argument("--bucket", default=os.environ.get("TFSTATE_BUCKET"))
+    parser.add_argument("--key", default=os.environ.get("TFSTATE_KEY", "terraform.tfstate"))
+    args = parser.parse_args()
+
+    async def run():
+        service = DriftService(args.bucket, args.key, args.interval, args.concurrency)
+        await service.serve(args.host, args.port)
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
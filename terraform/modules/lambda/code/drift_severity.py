@@ -0,0 +1,117 @@
+import os
+
+# Base score per resource type, Terraform and inventory names alike
+TYPE_WEIGHT = {
+    "IAM": 100,
+    "aws_iam_user": 100,
+    "aws_iam_role": 100,
+    "aws_iam_policy": 100,
+    "aws_iam_user_policy_attachment": 95,
+    "aws_iam_role_policy_attachment": 95,
+    "RDS": 90,
+    "aws_db_instance": 90,
+    "aws_rds_cluster": 90,
+    "aws_security_group": 85,
+    "aws_security_group_rule": 85,
+    "aws_s3_bucket_policy": 80,
+    "aws_s3_bucket_public_access_block": 80,
+    "aws_kms_key": 80,
+    "S3": 50,
+    "aws_s3_bucket": 50,
+    "aws_vpc": 45,
+    "aws_subnet": 40,
+    "EC2": 40,
+    "aws_instance": 40,
+}
+DEFAULT_TYPE_WEIGHT = 30
+
+# A deleted resource is usually the most disruptive kind of drift
+KIND_WEIGHT = {"deleted": 40, "unmanaged": 15, "modified": 10}
+
+ENVIRONMENT_WEIGHT = {"prod": 50, "production": 50, "staging": 15, "stage": 15}
+
+# Modified attributes that matter more than e.g. a tag edit
+ATTRIBUTE_WEIGHT = {
+    "security_groups": 40,
+    "multi_az": 25,
+    "instance_class": 20,
+    "instance_type": 20,
+    "allocated_storage": 10,
+    "tags": 0
+}
+
+# Report levels, highest first, with the minimum score for each
+LEVELS = [("CRITICAL", 150), ("HIGH", 110), ("MEDIUM", 60), ("LOW", 0)]
+LEVEL_RANK = {name: rank for rank, (name, _) in enumerate(reversed(LEVELS))}
+
+ICONS = {"CRITICAL": "🔴", "HIGH": "🟠", "MEDIUM": "🟡", "LOW": "🟢"}
+
+DRIFT_KINDS = (("unmanaged", "unmanaged_resources"), ("deleted", "deleted_resources"), ("modified", "modified_resources"))
+
+
+def environment_of(tags):
+    for key, value in (tags or {}).items():
+        if key.lower() in ("environment", "env", "stage") and isinstance(value, str):
+            return value.lower()
+    return None
+
+
+def resource_environment(resource):
+    """Environment recorded on a drift item, or read from its tag change"""
+    if resource.get("environment"):
+        return resource["environment"]
+    for change in resource.get("changes", []):
+        if change.get("attribute") == "tags":
+            return environment_of(change.get("expected")) or environment_of(change.get("actual"))
+    return None
+
+
+def score_resource(kind, resource, environment=None):
+    """Score of one drifted resource from its type, drift kind, environment and changed attributes"""
+    total = TYPE_WEIGHT.get(resource.get("type"), DEFAULT_TYPE_WEIGHT) + KIND_WEIGHT.get(kind, 0)
+    total += ENVIRONMENT_WEIGHT.get(environment or resource_environment(resource), 0)
+    for change in resource.get("changes", []):
+        total += ATTRIBUTE_WEIGHT.get(change.get("attribute"), 5)
+    return total
+
+
+def level(score):
+    for name, minimum in LEVELS:
+        if score >= minimum:
+            return name
+    return "LOW"
+
+
+def at_least(severity, minimum):
+    return LEVEL_RANK.get(severity, 0) >= LEVEL_RANK.get(minimum, 0)
+
+
+def assess(drift_report):
+    """
+    Severity of a whole drift report.
+
+    The report scores as its worst resource plus a small amount for each further
+    drifted resource, capped so that volume alone (many tag edits) cannot
+    outrank one critical change. Returns {"severity", "score", "top"}.
+    """
+    scores = []
+    for kind, key in DRIFT_KINDS:
+        for resource in drift_report.get(key, []):
+            scores.append((score_resource(kind, resource), kind, resource.get("id")))
+    if not scores:
+        return {"severity": "LOW", "score": 0, "top": None}
+
+    scores.sort(key=lambda item: item[0], reverse=True)
+    top_score, top_kind, top_id = scores[0]
+    score = top_score + min(20, 2 * (len(scores) - 1))
+    return {"severity": level(score), "score": score, "top": {"id": top_id, "kind": top_kind, "score": top_score}}
+
+
+def analysis_threshold():
+    """Lowest severity sent to Bedrock analysis and immediate notification"""
+    return os.environ.get("ANALYSIS_MIN_SEVERITY", "HIGH").upper()
+
+
+def urgent_threshold():
+    """Lowest severity analyzed right away when scheduled scans batch their analysis"""
+    return os.environ.get("BATCH_URGENT_SEVERITY", "CRITICAL").upper()
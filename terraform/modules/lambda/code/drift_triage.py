@@ -0,0 +1,109 @@
+import base64
+import os
+import time
+import zlib
+
+import aws_backend
+import drift_json
+import drift_severity
+
+FREQUENCY_KEY = "drift-snapshots/drift-frequency.json"
+
+# Time kept back from the deadline for notification and bookkeeping
+DEFAULT_RESERVE_MS = 10000
+
+
+def score(kind, resource, managed_resources, actual_resources, frequency):
+    """Priority of one drifted resource; higher is checked first"""
+    resource_id = resource["id"]
+    source = managed_resources if kind == "deleted" else actual_resources
+    details = source.get(resource_id)
+    environment = drift_severity.environment_of(details.attributes.get("tags") if details else None)
+    if environment:
+        # Kept on the item so the report can be scored again without the records
+        resource["environment"] = environment
+
+    total = drift_severity.score_resource(kind, resource, environment)
+    total += min(frequency.get(resource_id, 0), 10) * 3
+    return total
+
+
+def build_queue(unmanaged_resources, deleted_resources, modified_resources, managed_resources, actual_resources, frequency=None):
+    """All drift as (kind, resource) pairs, highest priority first"""
+    frequency = frequency or {}
+    queue = []
+    for kind, resources in (("unmanaged", unmanaged_resources), ("deleted", deleted_resources), ("modified", modified_resources)):
+        for resource in resources:
+            resource["priority"] = score(kind, resource, managed_resources, actual_resources, frequency)
+            queue.append((kind, resource))
+    # Stable sort keeps discovery order between equal scores
+    queue.sort(key=lambda item: item[1]["priority"], reverse=True)
+    return queue
+
+
+def deadline_from_context(context, reserve_ms=None):
+    """Monotonic deadline for triage work, or None when there is no context"""
+    if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+        return None
+    if reserve_ms is None:
+        reserve_ms = int(os.environ.get("TRIAGE_RESERVE_MS", DEFAULT_RESERVE_MS))
+    return time.monotonic() + max(0, context.get_remaining_time_in_millis() - reserve_ms) / 1000
+
+
+def run_queue(queue, work, deadline=None):
+    """
+    Apply work(kind, resource) in priority order until the deadline.
+
+    Returns (processed, remaining), both still in priority order.
+    """
+    for index, (kind, resource) in enumerate(queue):
+        if deadline is not None and time.monotonic() >= deadline:
+            print(f"Triage deadline reached after {index} of {len(queue)} resources")
+            return queue[:index], queue[index:]
+        work(kind, resource)
+    return queue, []
+
+
+def split_by_kind(items):
+    """(kind, resource) pairs back into unmanaged, deleted and modified lists"""
+    lists = {"unmanaged": [], "deleted": [], "modified": []}
+    for kind, resource in items:
+        lists[kind].append(resource)
+    return lists["unmanaged"], lists["deleted"], lists["modified"]
+
+
+def encode_token(remaining, scan_time):
+    """Continuation token listing the drift still to be processed"""
+    payload = {"scan_time": scan_time, "remaining": [[kind, resource["id"]] for kind, resource in remaining]}
+    return base64.urlsafe_b64encode(zlib.compress(drift_json.dumpb(payload))).decode("ascii")
+
+
+def decode_token(token):
+    payload = drift_json.loads(zlib.decompress(base64.urlsafe_b64decode(token.encode("ascii"))))
+    payload["remaining"] = [tuple(item) for item in payload["remaining"]]
+    return payload
+
+
+def resume_queue(queue, token_payload):
+    """Restrict a freshly built queue to the work left by a previous invocation"""
+    wanted = set(token_payload["remaining"])
+    return [(kind, resource) for kind, resource in queue if (kind, resource["id"]) in wanted]
+
+
+def load_frequency(bucket):
+    """Past drift counts per resource id"""
+    try:
+        obj = aws_backend.client("s3").get_object(Bucket=bucket, Key=FREQUENCY_KEY)
+        return drift_json.loads(obj["Body"].read())
+    except Exception as e:
+        print(f"No drift frequency history: {e}")
+        return {}
+
+
+def save_frequency(bucket, frequency, items):
+    """Count one more drift occurrence for each resource in items"""
+    for _, resource in items:
+        frequency[resource["id"]] = frequency.get(resource["id"], 0) + 1
+    aws_backend.client("s3").put_object(
+        Bucket=bucket, Key=FREQUENCY_KEY, Body=drift_json.dumpb(frequency), ContentType="application/json"
+    )
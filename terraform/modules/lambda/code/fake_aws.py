@@ -0,0 +1,801 @@
+"""
+In-process stand-in for the AWS services the drift pipeline uses.
+
+Covers S3 (with object versions and multipart uploads), EC2, IAM, RDS,
+CloudTrail lookup_events, Config history, the Resource Groups Tagging API, SNS,
+Lambda invoke, Bedrock runtime and batch inference, and knowledge base
+retrieval. Latency and throttling can be injected per service or operation, so
+the whole detection -> analysis -> history -> RAG flow can run and be profiled
+without an AWS account.
+
+    aws = FakeAWS(latency={"cloudtrail": 0.05}, throttle_rate={"cloudtrail.lookup_events": 0.1})
+    aws_backend.set_backend(aws)
+"""
+import io
+import json
+import os
+import random
+import re
+import time
+import types
+import uuid
+import fnmatch
+import functools
+from collections import Counter
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+
+DEFAULT_REGION = "ap-southeast-1"
+ACCOUNT_ID = "123456789012"
+
+# Request/response token names used by each paginated operation
+PAGINATION = {
+    "describe_instances": ("NextToken", "NextToken"),
+    "list_buckets": ("ContinuationToken", "ContinuationToken"),
+    "list_users": ("Marker", "Marker"),
+    "describe_db_instances": ("Marker", "Marker"),
+    "lookup_events": ("NextToken", "NextToken"),
+    "list_objects_v2": ("ContinuationToken", "NextContinuationToken"),
+    "get_resource_config_history": ("nextToken", "nextToken"),
+    "list_discovered_resources": ("nextToken", "nextToken"),
+    "get_resources": ("PaginationToken", "PaginationToken"),
+}
+
+
+def utc(value):
+    """Normalize naive datetimes and ISO strings to UTC datetimes"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def now():
+    return datetime.now(timezone.utc)
+
+
+def client_error(code, message, operation, status=400):
+    return ClientError({"Error": {"Code": code, "Message": message}, "ResponseMetadata": {"HTTPStatusCode": status}}, operation)
+
+
+def operation(func):
+    """Route a fake API method through call counting and fault injection"""
+    @functools.wraps(func)
+    def wrapper(self, **kwargs):
+        self.aws.before_call(self.service, func.__name__)
+        return func(self, **kwargs)
+    return wrapper
+
+
+def page(items, token, limit):
+    """Slice items for a page, returning (page_items, next_token)"""
+    start = int(token or 0)
+    limit = limit or len(items) or 1
+    end = start + limit
+    return items[start:end], (str(end) if end < len(items) else None)
+
+
+class FakePaginator:
+    def __init__(self, client, operation_name):
+        self.client = client
+        self.operation_name = operation_name
+
+    def paginate(self, **kwargs):
+        request_token, response_token = PAGINATION[self.operation_name]
+        kwargs.pop("PaginationConfig", None)
+        method = getattr(self.client, self.operation_name)
+        while True:
+            response = method(**kwargs)
+            yield response
+            token = response.get(response_token)
+            if not token:
+                return
+            kwargs[request_token] = token
+
+
+class FakeClient:
+    service = None
+
+    def __init__(self, aws, region):
+        self.aws = aws
+        self.region = region
+        self.meta = types.SimpleNamespace(region_name=region)
+
+    def get_paginator(self, operation_name):
+        return FakePaginator(self, operation_name)
+
+    def can_paginate(self, operation_name):
+        return operation_name in PAGINATION
+
+
+class FakeS3(FakeClient):
+    service = "s3"
+
+    def _bucket(self, name, op):
+        bucket = self.aws.buckets.get(name)
+        if bucket is None:
+            raise client_error("NoSuchBucket", f"The specified bucket {name} does not exist", op, 404)
+        return bucket
+
+    def _versions(self, bucket, key, op):
+        versions = self._bucket(bucket, op)["objects"].get(key)
+        if not versions:
+            raise client_error("NoSuchKey", f"The specified key {key} does not exist", op, 404)
+        return versions
+
+    @operation
+    def list_buckets(self, ContinuationToken=None, MaxBuckets=None, Prefix="", **kwargs):
+        names, token = page([name for name in self.aws.buckets if name.startswith(Prefix)], ContinuationToken, MaxBuckets)
+        response = {"Buckets": [{"Name": name, "CreationDate": self.aws.buckets[name]["created"], "BucketRegion": self.aws.buckets[name]["region"]} for name in names]}
+        if token:
+            response["ContinuationToken"] = token
+        return response
+
+    @operation
+    def get_bucket_tagging(self, Bucket, **kwargs):
+        tags = self._bucket(Bucket, "GetBucketTagging")["tags"]
+        if not tags:
+            raise client_error("NoSuchTagSet", "The TagSet does not exist", "GetBucketTagging", 404)
+        return {"TagSet": [{"Key": k, "Value": v} for k, v in tags.items()]}
+
+    @operation
+    def put_object(self, Bucket, Key, Body=b"", IfNoneMatch=None, IfMatch=None, **kwargs):
+        bucket = self._bucket(Bucket, "PutObject")
+        current = bucket["objects"].get(Key)
+        if IfNoneMatch == "*" and current:
+            raise client_error("PreconditionFailed", "At least one of the pre-conditions you specified did not hold", "PutObject", 412)
+        if IfMatch is not None:
+            if not current:
+                raise client_error("NoSuchKey", f"The specified key {Key} does not exist", "PutObject", 404)
+            if current[0]["ETag"] != IfMatch:
+                raise client_error("PreconditionFailed", "At least one of the pre-conditions you specified did not hold", "PutObject", 412)
+        return self.aws.store_object(bucket, Key, Body, kwargs.get("ContentType"))
+
+    @operation
+    def get_object(self, Bucket, Key, VersionId=None, **kwargs):
+        versions = self._versions(Bucket, Key, "GetObject")
+        if VersionId:
+            matches = [v for v in versions if v["VersionId"] == VersionId]
+            if not matches:
+                raise client_error("NoSuchVersion", f"The specified version {VersionId} does not exist", "GetObject", 404)
+            version = matches[0]
+        else:
+            version = versions[0]
+        return {
+            "Body": io.BytesIO(version["Body"]),
+            "ContentLength": len(version["Body"]),
+            "ContentType": version["ContentType"],
+            "ETag": version["ETag"],
+            "VersionId": version["VersionId"],
+            "LastModified": version["LastModified"]
+        }
+
+    @operation
+    def create_multipart_upload(self, Bucket, Key, ContentType=None, **kwargs):
+        self._bucket(Bucket, "CreateMultipartUpload")
+        upload_id = uuid.uuid4().hex
+        self.aws.multipart_uploads[upload_id] = {"Bucket": Bucket, "Key": Key, "ContentType": ContentType, "Parts": {}}
+        return {"Bucket": Bucket, "Key": Key, "UploadId": upload_id}
+
+    def _upload(self, upload_id, op):
+        upload = self.aws.multipart_uploads.get(upload_id)
+        if upload is None:
+            raise client_error("NoSuchUpload", f"The specified upload {upload_id} does not exist", op, 404)
+        return upload
+
+    @operation
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body=b"", **kwargs):
+        upload = self._upload(UploadId, "UploadPart")
+        body = Body.encode("utf-8") if isinstance(Body, str) else bytes(Body)
+        etag = f"\"{uuid.uuid4().hex}\""
+        upload["Parts"][PartNumber] = (etag, body)
+        return {"ETag": etag}
+
+    @operation
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload=None, **kwargs):
+        upload = self._upload(UploadId, "CompleteMultipartUpload")
+        parts = (MultipartUpload or {}).get("Parts", [])
+        # Every part except the last must meet the 5 MiB minimum, as in S3
+        for part in parts[:-1]:
+            if len(upload["Parts"][part["PartNumber"]][1]) < 5 * 1024 * 1024:
+                raise client_error("EntityTooSmall", "Your proposed upload is smaller than the minimum allowed object size", "CompleteMultipartUpload")
+        body = b"".join(upload["Parts"][part["PartNumber"]][1] for part in parts)
+        del self.aws.multipart_uploads[UploadId]
+        return self.aws.store_object(self._bucket(Bucket, "CompleteMultipartUpload"), Key, body, upload["ContentType"])
+
+    @operation
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self.aws.multipart_uploads.pop(UploadId, None)
+        return {}
+
+    @operation
+    def head_object(self, Bucket, Key, VersionId=None, **kwargs):
+        versions = self._versions(Bucket, Key, "HeadObject")
+        version = next((v for v in versions if v["VersionId"] == VersionId), None) if VersionId else versions[0]
+        if version is None:
+            raise client_error("404", "Not Found", "HeadObject", 404)
+        return {"ContentLength": len(version["Body"]), "ETag": version["ETag"], "VersionId": version["VersionId"], "LastModified": version["LastModified"]}
+
+    @operation
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._bucket(Bucket, "DeleteObject")["objects"].pop(Key, None)
+        return {}
+
+    @operation
+    def list_object_versions(self, Bucket, Prefix="", KeyMarker=None, VersionIdMarker=None, MaxKeys=1000, **kwargs):
+        bucket = self._bucket(Bucket, "ListObjectVersions")
+        versions = []
+        # With a VersionIdMarker the listing resumes inside KeyMarker, after that version
+        skipping = bool(VersionIdMarker)
+        for key in sorted(k for k in bucket["objects"] if k.startswith(Prefix) and (KeyMarker is None or k > KeyMarker or (k == KeyMarker and VersionIdMarker))):
+            for index, version in enumerate(bucket["objects"][key]):
+                if key == KeyMarker and skipping:
+                    skipping = version["VersionId"] != VersionIdMarker
+                    continue
+                versions.append({
+                    "Key": key,
+                    "VersionId": version["VersionId"],
+                    "IsLatest": index == 0,
+                    "LastModified": version["LastModified"],
+                    "Size": len(version["Body"]),
+                    "ETag": version["ETag"]
+                })
+        truncated = len(versions) > MaxKeys
+        versions = versions[:MaxKeys]
+        response = {"Versions": versions, "IsTruncated": truncated, "Name": Bucket, "Prefix": Prefix}
+        if truncated:
+            response["NextKeyMarker"] = versions[-1]["Key"]
+            response["NextVersionIdMarker"] = versions[-1]["VersionId"]
+        return response
+
+    @operation
+    def list_objects_v2(self, Bucket, Prefix="", ContinuationToken=None, MaxKeys=1000, **kwargs):
+        bucket = self._bucket(Bucket, "ListObjectsV2")
+        keys = sorted(k for k in bucket["objects"] if k.startswith(Prefix))
+        keys, token = page(keys, ContinuationToken, MaxKeys)
+        contents = [{"Key": k, "Size": len(bucket["objects"][k][0]["Body"]), "LastModified": bucket["objects"][k][0]["LastModified"]} for k in keys]
+        response = {"Contents": contents, "KeyCount": len(contents), "IsTruncated": bool(token)}
+        if token:
+            response["NextContinuationToken"] = token
+        return response
+
+
+class FakeEC2(FakeClient):
+    service = "ec2"
+
+    @operation
+    def describe_instances(self, InstanceIds=None, Filters=None, NextToken=None, MaxResults=None, **kwargs):
+        instances = list(self.aws.instances.values())
+        if InstanceIds:
+            unknown = [i for i in InstanceIds if i not in self.aws.instances]
+            if unknown:
+                # Like the real API, one unknown id fails the whole call
+                raise client_error("InvalidInstanceID.NotFound", f"The instance IDs '{', '.join(unknown)}' do not exist", "DescribeInstances", 400)
+            instances = [i for i in instances if i["InstanceId"] in InstanceIds]
+        for f in Filters or []:
+            if f["Name"] == "instance-id":
+                instances = [i for i in instances if any(fnmatch.fnmatchcase(i["InstanceId"], v) for v in f["Values"])]
+        instances, token = page(instances, NextToken, MaxResults)
+        response = {"Reservations": [{"ReservationId": f"r-{i['InstanceId'][2:]}", "Instances": [i]} for i in instances]}
+        if token:
+            response["NextToken"] = token
+        return response
+
+
+class FakeIAM(FakeClient):
+    service = "iam"
+
+    @operation
+    def list_users(self, Marker=None, MaxItems=None, **kwargs):
+        users, token = page(list(self.aws.users.values()), Marker, MaxItems)
+        # Like the real API, list_users does not return tags
+        response = {"Users": [{k: v for k, v in u.items() if k != "Tags"} for u in users], "IsTruncated": bool(token)}
+        if token:
+            response["Marker"] = token
+        return response
+
+    @operation
+    def list_user_tags(self, UserName, **kwargs):
+        user = self.aws.users.get(UserName)
+        if user is None:
+            raise client_error("NoSuchEntity", f"The user with name {UserName} cannot be found.", "ListUserTags", 404)
+        return {"Tags": [{"Key": k, "Value": v} for k, v in user["Tags"].items()], "IsTruncated": False}
+
+
+class FakeRDS(FakeClient):
+    service = "rds"
+
+    @operation
+    def describe_db_instances(self, DBInstanceIdentifier=None, Filters=None, Marker=None, MaxRecords=None, **kwargs):
+        databases = list(self.aws.databases.values())
+        if DBInstanceIdentifier:
+            databases = [d for d in databases if d["DBInstanceIdentifier"] == DBInstanceIdentifier]
+        for f in Filters or []:
+            if f["Name"] == "db-instance-id":
+                databases = [d for d in databases if d["DBInstanceIdentifier"] in f["Values"] or d["DBInstanceArn"] in f["Values"]]
+        databases, token = page(databases, Marker, MaxRecords)
+        response = {"DBInstances": [{k: v for k, v in d.items() if k != "Tags"} for d in databases]}
+        if token:
+            response["Marker"] = token
+        return response
+
+    @operation
+    def list_tags_for_resource(self, ResourceName, **kwargs):
+        for db in self.aws.databases.values():
+            if db["DBInstanceArn"] == ResourceName:
+                return {"TagList": [{"Key": k, "Value": v} for k, v in db["Tags"].items()]}
+        raise client_error("DBInstanceNotFound", f"{ResourceName} not found", "ListTagsForResource", 404)
+
+
+class FakeCloudTrail(FakeClient):
+    service = "cloudtrail"
+
+    @operation
+    def lookup_events(self, LookupAttributes=None, StartTime=None, EndTime=None, MaxResults=50, NextToken=None, **kwargs):
+        start, end = utc(StartTime), utc(EndTime)
+        key = value = None
+        if LookupAttributes:
+            key = LookupAttributes[0]["AttributeKey"]
+            value = LookupAttributes[0]["AttributeValue"]
+
+        matches = []
+        for event in self.aws.trail:
+            if event["Region"] != self.region:
+                continue
+            if (start and event["EventTime"] < start) or (end and event["EventTime"] > end):
+                continue
+            if key == "EventName" and event["EventName"] != value:
+                continue
+            if key == "ResourceName" and value not in [r["ResourceName"] for r in event["Resources"]]:
+                continue
+            if key == "Username" and event["Username"] != value:
+                continue
+            matches.append(event)
+
+        matches.sort(key=lambda e: e["EventTime"], reverse=True)
+        events, token = page(matches, NextToken, MaxResults)
+        response = {"Events": [{k: v for k, v in e.items() if k != "Region"} for e in events]}
+        if token:
+            response["NextToken"] = token
+        return response
+
+
+class FakeConfig(FakeClient):
+    service = "config"
+
+    @operation
+    def get_resource_config_history(self, resourceType, resourceId, laterTime=None, earlierTime=None, limit=10, nextToken=None, **kwargs):
+        later, earlier = utc(laterTime), utc(earlierTime)
+        items = [
+            item for item in self.aws.config_items.get((resourceType, resourceId), [])
+            if (later is None or item["configurationItemCaptureTime"] <= later)
+            and (earlier is None or item["configurationItemCaptureTime"] >= earlier)
+        ]
+        if not items and (resourceType, resourceId) not in self.aws.config_items:
+            raise client_error("ResourceNotDiscoveredException", f"Resource {resourceId} is not discovered", "GetResourceConfigHistory")
+        items = sorted(items, key=lambda i: i["configurationItemCaptureTime"], reverse=True)
+        items, token = page(items, nextToken, limit)
+        response = {"configurationItems": items}
+        if token:
+            response["nextToken"] = token
+        return response
+
+    @operation
+    def list_discovered_resources(self, resourceType, includeDeletedResources=False, limit=100, nextToken=None, **kwargs):
+        identifiers = []
+        for (item_type, resource_id), items in sorted(self.aws.config_items.items()):
+            latest = max(items, key=lambda i: i["configurationItemCaptureTime"])
+            deleted = latest["configurationItemStatus"].startswith("ResourceDeleted")
+            if item_type != resourceType or (deleted and not includeDeletedResources):
+                continue
+            identifier = {"resourceType": item_type, "resourceId": resource_id, "resourceName": latest["resourceName"]}
+            if deleted:
+                identifier["resourceDeletionTime"] = latest["configurationItemCaptureTime"]
+            identifiers.append(identifier)
+        identifiers, token = page(identifiers, nextToken, limit)
+        response = {"resourceIdentifiers": identifiers}
+        if token:
+            response["nextToken"] = token
+        return response
+
+
+class FakeResourceGroupsTagging(FakeClient):
+    service = "resourcegroupstaggingapi"
+
+    @operation
+    def get_resources(self, ResourceTypeFilters=None, PaginationToken=None, ResourcesPerPage=100, **kwargs):
+        filters = set(ResourceTypeFilters or ["s3", "rds:db"])
+        mappings = []
+        if "s3" in filters:
+            for name, bucket in self.aws.buckets.items():
+                if bucket["tags"] and bucket["region"] == self.region:
+                    mappings.append({"ResourceARN": f"arn:aws:s3:::{name}", "Tags": [{"Key": k, "Value": v} for k, v in bucket["tags"].items()]})
+        if "rds" in filters or "rds:db" in filters:
+            for db in self.aws.databases.values():
+                if db["Tags"]:
+                    mappings.append({"ResourceARN": db["DBInstanceArn"], "Tags": [{"Key": k, "Value": v} for k, v in db["Tags"].items()]})
+        mappings, token = page(mappings, PaginationToken, ResourcesPerPage)
+        return {"ResourceTagMappingList": mappings, "PaginationToken": token or ""}
+
+
+class FakeSNS(FakeClient):
+    service = "sns"
+
+    @operation
+    def publish(self, TopicArn=None, Message="", Subject=None, **kwargs):
+        if not TopicArn:
+            raise client_error("InvalidParameter", "Invalid parameter: TopicArn", "Publish")
+        message_id = str(uuid.uuid4())
+        self.aws.published.append({"MessageId": message_id, "TopicArn": TopicArn, "Subject": Subject, "Message": Message})
+        return {"MessageId": message_id}
+
+
+class FakeLambda(FakeClient):
+    service = "lambda"
+
+    @operation
+    def invoke(self, FunctionName, InvocationType="RequestResponse", Payload=b"{}", **kwargs):
+        name = FunctionName.split(":function:")[-1].split(":")[0]
+        handler = self.aws.functions.get(name)
+        if handler is None:
+            raise client_error("ResourceNotFoundException", f"Function not found: {FunctionName}", "Invoke", 404)
+        if isinstance(Payload, (bytes, bytearray)):
+            Payload = Payload.decode("utf-8")
+        event = json.loads(Payload or "{}")
+        self.aws.invocations.append({"FunctionName": name, "InvocationType": InvocationType, "Event": event})
+
+        context = LambdaContext(name, self.aws.function_timeout)
+        if InvocationType == "Event":
+            try:
+                handler(event, context)
+            except Exception as e:
+                print(f"Async invocation of {name} failed: {e}")
+            return {"StatusCode": 202, "Payload": io.BytesIO(b"")}
+
+        try:
+            result = handler(event, context)
+        except Exception as e:
+            error = {"errorMessage": str(e), "errorType": type(e).__name__}
+            return {"StatusCode": 200, "FunctionError": "Unhandled", "Payload": io.BytesIO(json.dumps(error).encode())}
+        return {"StatusCode": 200, "Payload": io.BytesIO(json.dumps(result, default=str).encode())}
+
+
+def model_response(aws, model_id, request):
+    """Messages API response of the model responder to one request body"""
+    prompt = "\n".join(
+        m["content"] if isinstance(m["content"], str) else " ".join(c.get("text", "") for c in m["content"])
+        for m in request.get("messages", [])
+    )
+    aws.model_calls.append({"modelId": model_id, "prompt": prompt})
+    text = aws.model_responder(model_id, prompt)
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": model_id,
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "usage": {"input_tokens": len(prompt) // 4, "output_tokens": len(text) // 4}
+    }
+
+
+class FakeBedrockRuntime(FakeClient):
+    service = "bedrock-runtime"
+
+    @operation
+    def invoke_model(self, modelId, body, **kwargs):
+        response = model_response(self.aws, modelId, json.loads(body))
+        return {"body": io.BytesIO(json.dumps(response).encode()), "contentType": "application/json"}
+
+
+class FakeBedrock(FakeClient):
+    """Batch inference jobs, run to completion as soon as they are created"""
+
+    service = "bedrock"
+
+    # Bedrock rejects batch jobs with fewer records than this
+    MIN_RECORDS = 100
+
+    @operation
+    def create_model_invocation_job(self, jobName, roleArn, modelId, inputDataConfig, outputDataConfig, **kwargs):
+        input_uri = inputDataConfig["s3InputDataConfig"]["s3Uri"]
+        output_uri = outputDataConfig["s3OutputDataConfig"]["s3Uri"]
+        bucket_name, key = input_uri[len("s3://"):].split("/", 1)
+        body = self.aws.buckets[bucket_name]["objects"][key][0]["Body"].decode("utf-8")
+        records = [json.loads(line) for line in body.splitlines() if line.strip()]
+        if len(records) < self.MIN_RECORDS:
+            raise client_error("ValidationException", f"Batch job needs at least {self.MIN_RECORDS} records, got {len(records)}", "CreateModelInvocationJob")
+
+        job_id = uuid.uuid4().hex[:12]
+        job_arn = f"arn:aws:bedrock:{self.region}:{ACCOUNT_ID}:model-invocation-job/{job_id}"
+        lines = []
+        for record in records:
+            result = {"recordId": record["recordId"], "modelInput": record["modelInput"]}
+            try:
+                result["modelOutput"] = model_response(self.aws, modelId, record["modelInput"])
+            except Exception as e:
+                result["error"] = {"errorCode": 400, "errorMessage": str(e)}
+            lines.append(json.dumps(result))
+        out_bucket, out_prefix = output_uri[len("s3://"):].split("/", 1)
+        out_key = f"{out_prefix.rstrip('/')}/{job_id}/{key.rsplit('/', 1)[-1]}.out"
+        self.aws.put_object(out_bucket, out_key, "\n".join(lines) + "\n")
+        self.aws.batch_jobs[job_arn] = {
+            "jobArn": job_arn, "jobName": jobName, "modelId": modelId, "roleArn": roleArn, "status": "Completed",
+            "inputDataConfig": inputDataConfig, "outputDataConfig": outputDataConfig, "submitTime": now()
+        }
+        return {"jobArn": job_arn}
+
+    @operation
+    def get_model_invocation_job(self, jobIdentifier, **kwargs):
+        job = self.aws.batch_jobs.get(jobIdentifier)
+        if job is None:
+            raise client_error("ResourceNotFoundException", f"Job {jobIdentifier} not found", "GetModelInvocationJob", 404)
+        return dict(job)
+
+
+class FakeBedrockAgentRuntime(FakeClient):
+    service = "bedrock-agent-runtime"
+
+    @operation
+    def retrieve(self, knowledgeBaseId=None, retrievalQuery=None, numberOfResults=5, **kwargs):
+        # Rank Markdown drift reports in every bucket by query term overlap
+        terms = set(re.findall(r"\w+", (retrievalQuery or {}).get("text", "").lower()))
+        scored = []
+        for bucket_name, bucket in self.aws.buckets.items():
+            for key, versions in bucket["objects"].items():
+                if not key.endswith(".md"):
+                    continue
+                text = versions[0]["Body"].decode("utf-8", errors="replace")
+                words = re.findall(r"\w+", text.lower())
+                score = sum(1 for w in words if w in terms) / (len(words) or 1)
+                if score > 0:
+                    scored.append((score, bucket_name, key, text))
+        scored.sort(key=lambda s: s[0], reverse=True)
+        return {
+            "retrievalResults": [
+                {"content": {"text": text}, "location": {"type": "S3", "s3Location": {"uri": f"s3://{bucket_name}/{key}"}}, "score": score}
+                for score, bucket_name, key, text in scored[:numberOfResults]
+            ]
+        }
+
+
+SERVICES = {
+    "s3": FakeS3,
+    "ec2": FakeEC2,
+    "iam": FakeIAM,
+    "rds": FakeRDS,
+    "cloudtrail": FakeCloudTrail,
+    "config": FakeConfig,
+    "resourcegroupstaggingapi": FakeResourceGroupsTagging,
+    "sns": FakeSNS,
+    "lambda": FakeLambda,
+    "bedrock": FakeBedrock,
+    "bedrock-runtime": FakeBedrockRuntime,
+    "bedrock-agent-runtime": FakeBedrockAgentRuntime,
+}
+
+
+class LambdaContext:
+    """Minimal Lambda context with a real deadline"""
+
+    def __init__(self, function_name, timeout=60):
+        self.function_name = function_name
+        self.function_version = "$LATEST"
+        self.invoked_function_arn = f"arn:aws:lambda:{DEFAULT_REGION}:{ACCOUNT_ID}:function:{function_name}"
+        self.memory_limit_in_mb = 256
+        self.aws_request_id = str(uuid.uuid4())
+        self.deadline = time.monotonic() + timeout
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self.deadline - time.monotonic()) * 1000))
+
+
+def default_model_responder(model_id, prompt):
+    """Deterministic stand-in for a model answer"""
+    return f"[{model_id}] Analysis of {len(prompt)} prompt characters.\n\n" + prompt[-2000:]
+
+
+class FakeAWS:
+    """Shared in-memory state behind every fake client"""
+
+    def __init__(self, latency=None, throttle_rate=None, seed=0, function_timeout=60, model_responder=None):
+        # latency / throttle_rate are keyed by "service.operation", "service" or "*"
+        self.latency = latency or {}
+        self.throttle_rate = throttle_rate or {}
+        self.rng = random.Random(seed)
+        self.function_timeout = function_timeout
+        self.model_responder = model_responder or default_model_responder
+        self.calls = Counter()
+        self.throttled = Counter()
+
+        self.buckets = {}
+        self.instances = {}
+        self.users = {}
+        self.databases = {}
+        self.trail = []
+        self.config_items = {}
+        self.published = []
+        self.functions = {}
+        self.invocations = []
+        self.model_calls = []
+        self.batch_jobs = {}
+        self.multipart_uploads = {}
+
+    def client(self, service_name, region_name=None, **kwargs):
+        if service_name not in SERVICES:
+            raise ValueError(f"Service {service_name} is not supported by the fake backend")
+        return SERVICES[service_name](self, region_name or os.environ.get("AWS_REGION", DEFAULT_REGION))
+
+    def _lookup(self, table, service, op):
+        for key in (f"{service}.{op}", service, "*"):
+            if key in table:
+                return table[key]
+        return 0
+
+    def before_call(self, service, op):
+        """Count the call, then apply injected latency and throttling"""
+        self.calls[f"{service}.{op}"] += 1
+        delay = self._lookup(self.latency, service, op)
+        if delay:
+            time.sleep(delay)
+        rate = self._lookup(self.throttle_rate, service, op)
+        if rate and self.rng.random() < rate:
+            self.throttled[f"{service}.{op}"] += 1
+            raise client_error("ThrottlingException", "Rate exceeded", op)
+
+    def reset_calls(self):
+        self.calls.clear()
+        self.throttled.clear()
+
+    # Seeding helpers
+
+    def add_bucket(self, name, tags=None, region=DEFAULT_REGION):
+        self.buckets.setdefault(name, {"objects": {}, "tags": dict(tags or {}), "created": now(), "region": region})
+        return self.buckets[name]
+
+    def store_object(self, bucket, key, body, content_type=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        elif hasattr(body, "read"):
+            body = body.read()
+        version = {
+            "VersionId": uuid.uuid4().hex,
+            "Body": bytes(body),
+            "ContentType": content_type or "binary/octet-stream",
+            "ETag": f"\"{uuid.uuid4().hex}\"",
+            "LastModified": now()
+        }
+        bucket["objects"].setdefault(key, []).insert(0, version)
+        return {"ETag": version["ETag"], "VersionId": version["VersionId"]}
+
+    def put_object(self, bucket, key, body, content_type=None):
+        return self.store_object(self.add_bucket(bucket), key, body, content_type)
+
+    def add_instance(self, instance_id, instance_type="t3.micro", tags=None, state="running", subnet_id=None, security_groups=None, image_id="ami-0abcdef1234567890"):
+        self.instances[instance_id] = {
+            "InstanceId": instance_id,
+            "ImageId": image_id,
+            "InstanceType": instance_type,
+            "State": {"Name": state},
+            "Tags": [{"Key": k, "Value": v} for k, v in (tags or {}).items()],
+            "SubnetId": subnet_id,
+            "SecurityGroups": [{"GroupId": sg} for sg in (security_groups or [])],
+            "LaunchTime": now()
+        }
+
+    def add_user(self, user_name, path="/", tags=None):
+        self.users[user_name] = {
+            "UserName": user_name,
+            "UserId": f"AIDA{uuid.uuid4().hex[:16].upper()}",
+            "Arn": f"arn:aws:iam::{ACCOUNT_ID}:user{path}{user_name}",
+            "Path": path,
+            "CreateDate": now(),
+            "Tags": dict(tags or {})
+        }
+
+    def add_db_instance(self, identifier, instance_class="db.t3.micro", engine="mysql", allocated_storage=20, multi_az=False, tags=None, resource_id=None, engine_version="8.0.35"):
+        self.databases[identifier] = {
+            "DBInstanceIdentifier": identifier,
+            "DBInstanceArn": f"arn:aws:rds:{DEFAULT_REGION}:{ACCOUNT_ID}:db:{identifier}",
+            "DbiResourceId": resource_id or f"db-{uuid.uuid4().hex[:26].upper()}",
+            "Engine": engine,
+            "EngineVersion": engine_version,
+            "DBInstanceClass": instance_class,
+            "AllocatedStorage": allocated_storage,
+            "MultiAZ": multi_az,
+            "Tags": dict(tags or {})
+        }
+
+    def add_cloudtrail_event(self, event_name, resource_names, user="console-user", event_time=None, region=DEFAULT_REGION, detail=None):
+        event_time = utc(event_time) or now()
+        event_id = str(uuid.uuid4())
+        cloudtrail_event = {
+            "eventVersion": "1.08",
+            "eventID": event_id,
+            "eventName": event_name,
+            "eventTime": event_time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "awsRegion": region,
+            "userIdentity": {"type": "IAMUser", "arn": f"arn:aws:iam::{ACCOUNT_ID}:user/{user}", "userName": user},
+            "requestParameters": {"resourceNames": list(resource_names)}
+        }
+        cloudtrail_event.update(detail or {})
+        self.trail.append({
+            "EventId": event_id,
+            "EventName": event_name,
+            "EventTime": event_time,
+            "Username": user,
+            "Resources": [{"ResourceName": name} for name in resource_names],
+            "CloudTrailEvent": json.dumps(cloudtrail_event),
+            "Region": region
+        })
+
+    def add_config_item(self, resource_type, resource_id, configuration, capture_time=None, status="OK", tags=None, resource_name=None):
+        items = self.config_items.setdefault((resource_type, resource_id), [])
+        items.append({
+            "version": "1.3",
+            "accountId": ACCOUNT_ID,
+            "configurationItemCaptureTime": utc(capture_time) or now(),
+            "configurationItemStatus": status,
+            "configurationStateId": str(len(items) + 1),
+            "resourceType": resource_type,
+            "resourceId": resource_id,
+            "resourceName": resource_name or resource_id,
+            "configuration": json.dumps(configuration),
+            "tags": dict(tags or {})
+        })
+
+    def register_function(self, name, handler):
+        self.functions[name] = handler
+
+    def register_pipeline_functions(self):
+        """Register the four drift Lambdas under their deployed names"""
+        import drift_checker
+        import bedrock_analyzer
+        import config_history
+        import drift_rag
+        self.register_function("iac-drift-checker", drift_checker.lambda_handler)
+        self.register_function("bedrock-drift-analyzer", bedrock_analyzer.lambda_handler)
+        self.register_function("config-history-analyzer", config_history.lambda_handler)
+        self.register_function("drift-rag-query", drift_rag.lambda_handler)
+
+    @classmethod
+    def from_env(cls):
+        """Build a fake from DRIFT_FAKE_* environment variables"""
+        aws = cls(
+            latency=json.loads(os.environ.get("DRIFT_FAKE_LATENCY", "{}")),
+            throttle_rate=json.loads(os.environ.get("DRIFT_FAKE_THROTTLE", "{}")),
+            seed=int(os.environ.get("DRIFT_FAKE_SEED", "0"))
+        )
+        aws.register_pipeline_functions()
+        state_file = os.environ.get("DRIFT_FAKE_STATE")
+        if state_file:
+            with open(state_file) as f:
+                aws.load(json.load(f))
+        return aws
+
+    def load(self, seed):
+        """
+        Seed resources from a dict such as
+        {"buckets": {"name": {"tags": {}, "objects": {"key": <json or str>}}},
+         "instances": [{"instance_id": ..., "instance_type": ..., "tags": {}}],
+         "users": [{"user_name": ...}], "db_instances": [{"identifier": ...}],
+         "cloudtrail": [{"event_name": ..., "resource_names": [...]}],
+         "config": [{"resource_type": ..., "resource_id": ..., "configuration": {}}]}
+        """
+        for name, bucket in seed.get("buckets", {}).items():
+            self.add_bucket(name, bucket.get("tags"))
+            for key, body in bucket.get("objects", {}).items():
+                self.put_object(name, key, body if isinstance(body, str) else json.dumps(body))
+        for instance in seed.get("instances", []):
+            self.add_instance(**instance)
+        for user in seed.get("users", []):
+            self.add_user(**user)
+        for db in seed.get("db_instances", []):
+            self.add_db_instance(**db)
+        for event in seed.get("cloudtrail", []):
+            self.add_cloudtrail_event(**event)
+        for item in seed.get("config", []):
+            self.add_config_item(**item)
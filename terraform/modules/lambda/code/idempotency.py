@@ -0,0 +1,186 @@
+import hashlib
+import os
+import threading
+import time
+from urllib.parse import unquote_plus
+
+import aws_backend
+import drift_json
+import drift_metrics
+
+IDEMPOTENCY_PREFIX = "drift-snapshots/idempotency/"
+
+# How long a finished event's result is returned for duplicate deliveries
+DEFAULT_TTL = 3600
+
+# A claim older than this belongs to an invocation that died; Lambda runs at most 15 minutes
+IN_PROGRESS_TIMEOUT = 900
+
+CONFLICT_CODES = ("PreconditionFailed", "ConditionalRequestConflict")
+
+
+def s3_identity(bucket, key, version_id, etag):
+    """Same identity whether the upload arrived as an S3 notification or through EventBridge"""
+    revision = version_id or (etag or "").strip("\"")
+    return f"s3:{bucket}/{key}@{revision}" if revision else None
+
+
+def event_identity(event):
+    """
+    Canonical identity of an event delivery, or None for events that are never deduplicated.
+
+    S3 uploads are identified by bucket, key and version id (ETag without
+    versioning), Config changes by resource and configurationStateId, and
+    CloudTrail calls by eventID.
+    """
+    detail = event.get("detail") or {}
+    if detail.get("configurationItem"):
+        item = detail["configurationItem"]
+        if item.get("configurationStateId") is None:
+            return None
+        return f"config:{item.get('resourceType')}/{item.get('resourceId')}@{item['configurationStateId']}"
+    if event.get("detail-type") == "AWS API Call via CloudTrail" and detail.get("eventID"):
+        return f"cloudtrail:{detail['eventID']}"
+    if event.get("detail-type") == "Object Created" and detail.get("object"):
+        return s3_identity(detail.get("bucket", {}).get("name"), detail["object"].get("key"), detail["object"].get("version-id"), detail["object"].get("etag"))
+    records = event.get("Records")
+    if records and records[0].get("s3"):
+        s3 = records[0]["s3"]
+        # Notification keys are URL-encoded, EventBridge keys are not
+        return s3_identity(s3["bucket"]["name"], unquote_plus(s3["object"]["key"]), s3["object"].get("versionId"), s3["object"].get("eTag"))
+    return None
+
+
+def is_live(record, now):
+    return record is not None and record.get("expires_at", 0) > now
+
+
+class S3IdempotencyStore:
+    """Idempotency records under IDEMPOTENCY_PREFIX, claimed with conditional writes"""
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.s3 = aws_backend.client("s3")
+
+    def key(self, identity):
+        return f"{IDEMPOTENCY_PREFIX}{hashlib.sha256(identity.encode('utf-8')).hexdigest()}.json"
+
+    def write(self, identity, record, **conditions):
+        self.s3.put_object(
+            Bucket=self.bucket, Key=self.key(identity), ContentType="application/json",
+            Body=drift_json.dumpb(record, default=str), **conditions
+        )
+
+    def claim(self, identity, record):
+        """
+        Write record unless a live one exists: (claimed, existing record).
+
+        If-None-Match makes the first writer win when two deliveries race. An
+        expired record is replaced with If-Match on its ETag, so only one of the
+        deliveries that find it expired takes it over.
+        """
+        try:
+            self.write(identity, record, IfNoneMatch="*")
+            return True, None
+        except Exception as e:
+            if drift_metrics.error_code(e) not in CONFLICT_CODES:
+                raise
+        obj = self.s3.get_object(Bucket=self.bucket, Key=self.key(identity))
+        existing = drift_json.loads(obj["Body"].read())
+        if is_live(existing, time.time()):
+            return False, existing
+        try:
+            self.write(identity, record, IfMatch=obj["ETag"])
+            return True, None
+        except Exception as e:
+            if drift_metrics.error_code(e) not in CONFLICT_CODES:
+                raise
+            return False, None
+
+    def complete(self, identity, record):
+        self.write(identity, record)
+
+    def release(self, identity):
+        self.s3.delete_object(Bucket=self.bucket, Key=self.key(identity))
+
+
+class MemoryIdempotencyStore:
+    """Idempotency records in process memory, shared by the invocations of one container"""
+
+    def __init__(self):
+        self.records = {}
+        self.lock = threading.Lock()
+
+    def claim(self, identity, record):
+        with self.lock:
+            existing = self.records.get(identity)
+            if is_live(existing, time.time()):
+                return False, existing
+            self.records[identity] = record
+            return True, None
+
+    def complete(self, identity, record):
+        with self.lock:
+            self.records[identity] = record
+
+    def release(self, identity):
+        with self.lock:
+            self.records.pop(identity, None)
+
+
+_memory_store = MemoryIdempotencyStore()
+
+
+def idempotency_store():
+    """
+    IDEMPOTENCY_STORE selects s3, memory or off; by default S3 in the snapshot
+    bucket, which deduplicates across containers, and memory without a bucket.
+    """
+    kind = os.environ.get("IDEMPOTENCY_STORE", "").lower()
+    bucket = os.environ.get("SNAPSHOT_BUCKET") or os.environ.get("TFSTATE_BUCKET")
+    if kind == "off":
+        return None
+    if kind == "memory" or not bucket:
+        return _memory_store
+    return S3IdempotencyStore(bucket)
+
+
+def run_once(identity, func, store=None):
+    """
+    Run func for the first delivery of an event, returning the cached result for repeats.
+
+    A repeat that arrives while the first delivery is still running returns
+    {"duplicate": True, "in_progress": True}. Failed attempts (an exception or
+    an "error" result) release their claim so a retry is processed again. If the
+    store itself fails the event is processed anyway.
+    """
+    store = store or idempotency_store()
+    if store is None:
+        return func()
+    ttl = int(os.environ.get("IDEMPOTENCY_TTL", DEFAULT_TTL))
+    try:
+        claimed, existing = store.claim(identity, {"identity": identity, "status": "in_progress", "expires_at": time.time() + IN_PROGRESS_TIMEOUT})
+    except Exception as e:
+        print(f"Error checking idempotency of {identity}, processing anyway: {e}")
+        return func()
+
+    if not claimed:
+        print(f"Duplicate delivery of {identity}")
+        if existing and existing.get("status") == "done":
+            result = existing.get("result")
+            return dict(result, duplicate=True) if isinstance(result, dict) else result
+        return {"duplicate": True, "in_progress": True}
+
+    try:
+        result = func()
+    except Exception:
+        store.release(identity)
+        raise
+    try:
+        if isinstance(result, dict) and "error" in result:
+            store.release(identity)
+        else:
+            store.complete(identity, {"identity": identity, "status": "done", "expires_at": time.time() + ttl, "result": result})
+    except Exception as e:
+        print(f"Error recording result of {identity}: {e}")
+    return result
@@ -0,0 +1,135 @@
+import fnmatch
+import json
+import os
+import re
+
+import resource_identity
+
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ignore_rules.json")
+
+DRIFT_KINDS = ("unmanaged", "deleted", "modified")
+
+_compiled = {}
+
+
+def compile_globs(patterns):
+    """One regex matching any of the glob patterns, or None for no patterns"""
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{fnmatch.translate(p)})" for p in patterns))
+
+
+class Rule:
+    """
+    One compiled ignore rule.
+
+    Selectors (all optional, all must match): types, ids (globs), id_regex, kinds
+    and tag_keys (globs; the resource carries a matching tag). Without attributes
+    a matching drift item is dropped; with attributes (path globs such as
+    "instance_type" or "tags.aws:*") only the matching changes are dropped.
+    """
+
+    __slots__ = ("name", "types", "ids", "id_regex", "kinds", "tag_keys", "attributes", "hits")
+
+    def __init__(self, spec):
+        self.name = spec["name"]
+        self.types = frozenset(spec.get("types", ())) or None
+        self.ids = compile_globs(spec.get("ids"))
+        self.id_regex = re.compile(spec["id_regex"]) if spec.get("id_regex") else None
+        self.kinds = frozenset(spec.get("kinds", ())) or None
+        self.tag_keys = compile_globs(spec.get("tag_keys"))
+        self.attributes = compile_globs(spec.get("attributes"))
+        self.hits = 0
+
+        unknown = (self.kinds or frozenset()) - set(DRIFT_KINDS)
+        if unknown:
+            raise ValueError(f"Ignore rule {self.name}: unknown kinds {sorted(unknown)}")
+
+    def selects(self, kind, resource, tags):
+        if self.kinds and kind not in self.kinds:
+            return False
+        if self.types and resource["type"] not in self.types and resource_identity.TERRAFORM_TYPES.get(resource["type"]) not in self.types:
+            return False
+        if self.ids and not self.ids.match(resource["id"]):
+            return False
+        if self.id_regex and not self.id_regex.search(resource["id"]):
+            return False
+        if self.tag_keys and not any(self.tag_keys.match(key) for key in tags):
+            return False
+        return True
+
+    def ignores_change(self, change):
+        """True when every difference in the change is on an ignored attribute path"""
+        name = change["attribute"]
+        expected, actual = change.get("expected"), change.get("actual")
+        if isinstance(expected, dict) or isinstance(actual, dict):
+            expected, actual = expected or {}, actual or {}
+            differing = [key for key in set(expected) | set(actual) if expected.get(key) != actual.get(key)]
+            return bool(differing) and all(self.attributes.match(f"{name}.{key}") for key in differing)
+        return bool(self.attributes.match(name))
+
+
+def load_rules(path=None):
+    """Compiled rules from a JSON file, cached per path for the life of the container"""
+    path = path or os.environ.get("IGNORE_RULES_FILE") or DEFAULT_RULES_FILE
+    if path not in _compiled:
+        try:
+            with open(path) as f:
+                specs = json.load(f).get("rules", [])
+            _compiled[path] = [Rule(spec) for spec in specs]
+            print(f"Loaded {len(_compiled[path])} ignore rules from {path}")
+        except FileNotFoundError:
+            _compiled[path] = []
+    return _compiled[path]
+
+
+def resource_tags(kind, resource, managed_resources, actual_resources):
+    """Tag keys of a drifted resource, from AWS and/or the Terraform state"""
+    keys = set()
+    if kind != "deleted":
+        record = actual_resources.get(resource["id"])
+        if record:
+            keys.update(record.attributes.get("tags") or {})
+    if kind != "unmanaged":
+        record = managed_resources.get(resource.get("terraform_id", resource["id"]))
+        if record:
+            keys.update(record.attributes.get("tags") or {})
+    return keys
+
+
+def apply(rules, unmanaged_resources, deleted_resources, modified_resources, managed_resources, actual_resources):
+    """
+    Drop ignored drift before it is attributed or analyzed.
+
+    Returns the filtered unmanaged, deleted and modified lists plus
+    {rule name: resources it applied to} for the rules that matched this run.
+    """
+    if not rules:
+        return unmanaged_resources, deleted_resources, modified_resources, {}
+
+    hits = {}
+    kept = {}
+    for kind, resources in zip(DRIFT_KINDS, (unmanaged_resources, deleted_resources, modified_resources)):
+        kept[kind] = []
+        for resource in resources:
+            tags = resource_tags(kind, resource, managed_resources, actual_resources)
+            for rule in rules:
+                if not rule.selects(kind, resource, tags):
+                    continue
+                if rule.attributes is None:
+                    resource = None
+                elif kind == "modified":
+                    changes = [c for c in resource["changes"] if not rule.ignores_change(c)]
+                    if len(changes) == len(resource["changes"]):
+                        continue
+                    resource = dict(resource, changes=changes) if changes else None
+                else:
+                    continue
+                rule.hits += 1
+                hits[rule.name] = hits.get(rule.name, 0) + 1
+                if resource is None:
+                    break
+            if resource is not None:
+                kept[kind].append(resource)
+
+    return kept["unmanaged"], kept["deleted"], kept["modified"], hits
@@ -0,0 +1,110 @@
+import gzip
+import os
+from datetime import datetime
+
+import aws_backend
+import drift_json
+import resource_records
+
+SNAPSHOT_PREFIX = "drift-snapshots/inventory/"
+LATEST_KEY = SNAPSHOT_PREFIX + "latest.json"
+
+
+def snapshot_bucket():
+    """Bucket snapshots are written to, SNAPSHOT_BUCKET falling back to the state bucket"""
+    return os.environ.get("SNAPSHOT_BUCKET") or os.environ.get("TFSTATE_BUCKET")
+
+
+def drift_keys(unmanaged_resources, deleted_resources, modified_resources):
+    """Stable identities for the drift found in a scan"""
+    keys = [f"unmanaged:{r['id']}" for r in unmanaged_resources]
+    keys += [f"deleted:{r['id']}" for r in deleted_resources]
+    keys += [f"modified:{r['id']}" for r in modified_resources]
+    return keys
+
+
+def encode_snapshot(scan_time, actual_resources, keys):
+    """Gzipped compact JSON: {"scan_time", "resources": {id: [type, attributes]}, "drift": [...]}"""
+    snapshot = {
+        "scan_time": scan_time,
+        "resources": {rid: [d.type, d.attributes] for rid, d in actual_resources.items()},
+        "drift": keys
+    }
+    return gzip.compress(drift_json.dumpb(snapshot, default=str, sort_keys=True), compresslevel=6)
+
+
+def decode_snapshot(data):
+    snapshot = drift_json.loads(gzip.decompress(data))
+    snapshot["resources"] = {rid: resource_records.ResourceRecord(t, a) for rid, (t, a) in snapshot["resources"].items()}
+    return snapshot
+
+
+def load_latest_snapshot(bucket):
+    """Load the most recent snapshot, or None if there is none yet"""
+    s3 = aws_backend.client("s3")
+    try:
+        pointer = drift_json.loads(s3.get_object(Bucket=bucket, Key=LATEST_KEY)["Body"].read())
+    except Exception as e:
+        print(f"No previous inventory snapshot: {e}")
+        return None
+    obj = s3.get_object(Bucket=bucket, Key=pointer["key"])
+    return decode_snapshot(obj["Body"].read())
+
+
+def save_snapshot(bucket, actual_resources, keys, scan_time=None):
+    """Write a snapshot keyed by scan time and point latest.json at it"""
+    s3 = aws_backend.client("s3")
+    scan_time = scan_time or datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    key = f"{SNAPSHOT_PREFIX}{scan_time.replace('-', '').replace(':', '')}.json.gz"
+    body = encode_snapshot(scan_time, actual_resources, keys)
+    s3.put_object(Bucket=bucket, Key=key, Body=body, ContentType="application/json", ContentEncoding="gzip")
+    s3.put_object(Bucket=bucket, Key=LATEST_KEY, Body=drift_json.dumpb({"key": key, "scan_time": scan_time}), ContentType="application/json")
+    print(f"Inventory snapshot saved to s3://{bucket}/{key} ({len(body)} bytes)")
+    return key
+
+
+def mark_reported(bucket, keys):
+    """Add drift keys processed after the latest snapshot was saved, e.g. by a resumed triage"""
+    s3 = aws_backend.client("s3")
+    pointer = drift_json.loads(s3.get_object(Bucket=bucket, Key=LATEST_KEY)["Body"].read())
+    snapshot = drift_json.loads(gzip.decompress(s3.get_object(Bucket=bucket, Key=pointer["key"])["Body"].read()))
+    snapshot["drift"] = sorted(set(snapshot.get("drift", [])) | set(keys))
+    body = gzip.compress(drift_json.dumpb(snapshot, default=str, sort_keys=True), compresslevel=6)
+    s3.put_object(Bucket=bucket, Key=pointer["key"], Body=body, ContentType="application/json", ContentEncoding="gzip")
+
+
+def compute_delta(previous_resources, current_resources):
+    """Added, removed and changed resource ids between two inventories, in one pass over each"""
+    added, changed = [], []
+    for resource_id, details in current_resources.items():
+        previous = previous_resources.get(resource_id)
+        if previous is None:
+            added.append(resource_id)
+        elif previous != details:
+            changed.append(resource_id)
+    removed = [resource_id for resource_id in previous_resources if resource_id not in current_resources]
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+def select_new_drift(previous_snapshot, delta, unmanaged_resources, deleted_resources, modified_resources):
+    """
+    Keep only drift that is new since the previous snapshot.
+
+    A drifted resource is passed on when it changed in AWS since the last scan or
+    when the drift itself was not present last time (e.g. after a state change).
+    Without a previous snapshot everything is new.
+    """
+    if previous_snapshot is None:
+        return unmanaged_resources, deleted_resources, modified_resources
+
+    touched = set(delta["added"]) | set(delta["removed"]) | set(delta["changed"])
+    previous_keys = set(previous_snapshot.get("drift", []))
+
+    def is_new(kind, resource):
+        return resource["id"] in touched or f"{kind}:{resource['id']}" not in previous_keys
+
+    return (
+        [r for r in unmanaged_resources if is_new("unmanaged", r)],
+        [r for r in deleted_resources if is_new("deleted", r)],
+        [r for r in modified_resources if is_new("modified", r)]
+    )
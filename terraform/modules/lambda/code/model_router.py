@@ -0,0 +1,162 @@
+"""
+Bedrock model tiers with per-call deadlines and hedging.
+
+A request starts on the tier chosen for it. If that tier has not answered
+within its hedge_after_s, the next faster tier is started as well and the
+first answer wins; a tier that fails hands over at once. If no tier answers
+by the deadline the caller gets None and sends its template output instead,
+so a notification never waits on a model for longer than the deadline.
+
+    text, routing = model_router.complete(prompt, model_router.choose_tier("HIGH", 1200), deadline)
+"""
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from botocore.config import Config
+
+import aws_backend
+import drift_json
+import drift_metrics
+import drift_severity
+
+# Slowest to fastest; a hedge moves right along this order
+TIER_ORDER = ("deep", "standard", "fast")
+
+# Tier -> model id env var, default model, answer length and seconds to wait before hedging
+TIERS = {
+    "deep": {"model_env": "DEEP_MODEL_ID", "model_id": "anthropic.claude-3-5-sonnet-20240620-v1:0", "max_tokens": 2000, "hedge_after_s": 12},
+    "standard": {"model_env": "MODEL_ID", "model_id": "anthropic.claude-3-haiku-20240307-v1:0", "max_tokens": 2000, "hedge_after_s": 8},
+    "fast": {"model_env": "FAST_MODEL_ID", "model_id": "anthropic.claude-3-haiku-20240307-v1:0", "max_tokens": 800, "hedge_after_s": 5}
+}
+
+DEFAULT_DEADLINE_S = 25
+
+# Prompts above this many estimated tokens skip the deep tier, which is slowest on long inputs
+DEEP_MAX_PROMPT_TOKENS = 6000
+
+
+def tier_config(tier):
+    """A tier's settings, with MODEL_TIERS (JSON, e.g. {"deep": {"hedge_after_s": 6}}) and its model env var applied"""
+    config = dict(TIERS[tier], tier=tier)
+    config.update(drift_json.loads(os.environ.get("MODEL_TIERS") or "{}").get(tier, {}))
+    config["model_id"] = os.environ.get(config["model_env"]) or config["model_id"]
+    return config
+
+
+def choose_tier(severity, prompt_tokens=0):
+    """Deep model for HIGH and CRITICAL drift unless the prompt is long, standard for MEDIUM, fast for LOW"""
+    if drift_severity.at_least(severity, "HIGH"):
+        return "deep" if prompt_tokens <= int(os.environ.get("DEEP_MAX_PROMPT_TOKENS", DEEP_MAX_PROMPT_TOKENS)) else "standard"
+    if drift_severity.at_least(severity, "MEDIUM"):
+        return "standard"
+    return "fast"
+
+
+def deadline_from_context(context, reserve_s=5):
+    """
+    Monotonic deadline for model calls: ANALYSIS_DEADLINE_S from now, and at
+    least reserve_s before the Lambda times out so the fallback can still be sent.
+    """
+    deadline = time.monotonic() + float(os.environ.get("ANALYSIS_DEADLINE_S", DEFAULT_DEADLINE_S))
+    if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+        deadline = min(deadline, time.monotonic() + max(0, context.get_remaining_time_in_millis() / 1000 - reserve_s))
+    return deadline
+
+
+def request_body(config, prompt):
+    """Anthropic messages request for one prompt, as invoke_model and batch records take it"""
+    return {
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": config["max_tokens"],
+        "temperature": 0.2,
+        "messages": [
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    }
+
+
+def invoke(config, prompt, timeout):
+    """One model call, with the client read timeout bounded by the time left"""
+    bedrock = aws_backend.client("bedrock-runtime", config=Config(
+        connect_timeout=min(5, timeout), read_timeout=timeout, retries={"max_attempts": 1}
+    ))
+    response = bedrock.invoke_model(
+        modelId=config["model_id"],
+        body=drift_json.dumpb(request_body(config, prompt))
+    )
+    result = drift_json.loads(response["body"].read())
+    return result["content"][0]["text"]
+
+
+def complete(prompt, tier, deadline):
+    """
+    Answer from the first tier to respond, starting at tier: (text, routing).
+
+    routing has the tier and model_id that answered (None for both if none did
+    by the deadline) and one attempt per tier started, with its outcome: ok,
+    error, or abandoned when it was still running as another tier answered or
+    the deadline passed. Abandoned calls are not waited for.
+    """
+    chain = list(TIER_ORDER[TIER_ORDER.index(tier):])
+    executor = ThreadPoolExecutor(max_workers=len(chain))
+    running = {}
+    attempts = []
+    hedge_at = None
+
+    def start_next():
+        nonlocal hedge_at
+        config = tier_config(chain.pop(0))
+        attempt = {"tier": config["tier"], "model_id": config["model_id"], "outcome": "running"}
+        attempt["started"] = time.monotonic()
+        timeout = max(1, int(deadline - attempt["started"]) + 1)
+        running[drift_metrics.submit(executor, invoke, config, prompt, timeout)] = attempt
+        attempts.append(attempt)
+        hedge_at = attempt["started"] + config["hedge_after_s"]
+
+    answer = None
+    try:
+        start_next()
+        while running:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            wake = min(deadline, hedge_at) if chain else deadline
+            done, _ = wait(running, timeout=max(0, wake - now), return_when=FIRST_COMPLETED)
+            failed = False
+            for future in done:
+                attempt = running.pop(future)
+                attempt["latency_s"] = round(time.monotonic() - attempt["started"], 3)
+                try:
+                    text = future.result()
+                except Exception as e:
+                    attempt["outcome"] = "error"
+                    attempt["error"] = str(e)
+                    failed = True
+                    print(f"Error from {attempt['tier']} model {attempt['model_id']}: {e}")
+                    continue
+                attempt["outcome"] = "ok"
+                if answer is None:
+                    answer = (text, attempt)
+            if answer:
+                break
+            # Hedge when the latest tier is over its budget, hand over at once when a call failed
+            if chain and (failed or time.monotonic() >= hedge_at):
+                start_next()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    for attempt in attempts:
+        if attempt["outcome"] == "running":
+            attempt["outcome"] = "abandoned"
+        attempt.pop("started", None)
+
+    text, winner = answer or (None, {})
+    if winner:
+        print(f"Model answer from {winner['tier']} tier ({winner['model_id']}) in {winner['latency_s']}s")
+    else:
+        print(f"No model answered by the deadline, {len(attempts)} tiers tried")
+    return text, {"tier": winner.get("tier"), "model_id": winner.get("model_id"), "attempts": attempts}
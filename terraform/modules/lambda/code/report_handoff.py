@@ -0,0 +1,70 @@
+import hashlib
+import uuid
+import zlib
+from datetime import datetime
+
+import drift_json
+
+REPORT_PREFIX = "drift-snapshots/reports/"
+
+# Read size when streaming a report back
+READ_CHUNK = 256 * 1024
+
+
+def report_key(scan_time=None):
+    stamp = (scan_time or datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")).replace(":", "").replace("-", "")
+    return f"{REPORT_PREFIX}{stamp}-{uuid.uuid4().hex[:8]}.json.gz"
+
+
+def compress_report(drift_report):
+    """Gzipped compact JSON of a report, encoded and compressed piece by piece"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    parts = []
+    for chunk in drift_json.iter_encode(drift_report, default=str):
+        data = compressor.compress(chunk)
+        if data:
+            parts.append(data)
+    parts.append(compressor.flush())
+    return b"".join(parts)
+
+
+def write_report(s3, bucket, drift_report, scan_time=None):
+    """
+    Store a drift report for the analyzer and return the pointer to pass instead.
+
+    The pointer carries the SHA-256 of the stored object so the reader can tell
+    a complete, unaltered report from a truncated or replaced one.
+    """
+    body = compress_report(drift_report)
+    key = report_key(scan_time)
+    s3.put_object(Bucket=bucket, Key=key, Body=body, ContentType="application/json", ContentEncoding="gzip")
+    return {
+        "bucket": bucket,
+        "key": key,
+        "sha256": hashlib.sha256(body).hexdigest(),
+        "size": len(body),
+        "encoding": "gzip"
+    }
+
+
+def read_report(s3, pointer):
+    """Fetch a report by pointer, decompressing and checking its digest while it streams in"""
+    body = s3.get_object(Bucket=pointer["bucket"], Key=pointer["key"])["Body"]
+    digest = hashlib.sha256()
+    decompressor = zlib.decompressobj(31)
+    data = []
+    for chunk in iter(lambda: body.read(READ_CHUNK), b""):
+        digest.update(chunk)
+        data.append(decompressor.decompress(chunk))
+    data.append(decompressor.flush())
+    if pointer.get("sha256") and digest.hexdigest() != pointer["sha256"]:
+        raise ValueError(f"Drift report s3://{pointer['bucket']}/{pointer['key']} does not match its digest")
+    return drift_json.loads(b"".join(data))
+
+
+def report_from_event(s3, event):
+    """The drift report an analyzer event carries inline or points to"""
+    pointer = event.get("drift_report_ref")
+    if pointer:
+        return read_report(s3, pointer)
+    return event.get("drift_report", {})
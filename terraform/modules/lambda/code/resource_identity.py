@@ -0,0 +1,65 @@
+# Terraform type -> inventory type it is collected as
+TERRAFORM_TYPES = {
+    "aws_instance": "EC2",
+    "aws_s3_bucket": "S3",
+    "aws_iam_user": "IAM",
+    "aws_db_instance": "RDS"
+}
+
+# Attributes that identify a resource besides its key, on each side.
+# aws_db_instance keeps the DB identifier in "identifier" and, from provider v5,
+# the DbiResourceId in "id"; the inventory is keyed by DBInstanceIdentifier.
+TERRAFORM_IDENTITY_ATTRIBUTES = ("id", "identifier", "name", "bucket", "arn", "resource_id")
+ACTUAL_IDENTITY_ATTRIBUTES = ("arn", "resource_id")
+
+
+def identity_keys(resource_id, attributes, names):
+    """Every value that identifies a resource, its own key first"""
+    keys = [resource_id]
+    for name in names:
+        value = attributes.get(name)
+        if isinstance(value, str) and value and value not in keys:
+            keys.append(value)
+    return keys
+
+
+def terraform_keys(attributes):
+    """Identifying values of one Terraform state instance"""
+    return identity_keys(attributes.get("id") or attributes.get("name"), attributes, TERRAFORM_IDENTITY_ATTRIBUTES)
+
+
+def build_index(actual_resources):
+    """(inventory type, identifying value) -> inventory key for every actual resource"""
+    index = {}
+    for resource_id, details in actual_resources.items():
+        for key in identity_keys(resource_id, details.attributes, ACTUAL_IDENTITY_ATTRIBUTES):
+            index.setdefault((details.type, key), resource_id)
+    return index
+
+
+def match_resources(managed_resources, actual_resources):
+    """
+    Pair Terraform resources with the AWS resources they describe.
+
+    Returns {managed id: actual id}. Lookups go through a multi-key index scoped
+    by inventory type, so e.g. an RDS instance whose state id is its resource id
+    still matches the inventory entry keyed by its identifier, and a bucket never
+    matches an IAM user of the same name. Each AWS resource is claimed once.
+    Types the inventory does not collect match on the key alone, as before.
+    """
+    index = build_index(actual_resources)
+    matches = {}
+    claimed = set()
+    for managed_id, details in managed_resources.items():
+        inventory_type = TERRAFORM_TYPES.get(details.type)
+        if inventory_type is None:
+            if managed_id in actual_resources:
+                matches[managed_id] = managed_id
+            continue
+        for key in identity_keys(managed_id, details.attributes, TERRAFORM_IDENTITY_ATTRIBUTES):
+            actual_id = index.get((inventory_type, key))
+            if actual_id is not None and actual_id not in claimed:
+                matches[managed_id] = actual_id
+                claimed.add(actual_id)
+                break
+    return matches
@@ -0,0 +1,54 @@
+import hashlib
+import json
+
+
+class ResourceRecord:
+    """
+    One Terraform-managed or actual AWS resource.
+
+    attributes holds only the attributes drift detection compares, matches on or
+    reports. digest is a hash of the attributes that were projected away, so a
+    change outside the projection still makes two records differ.
+    """
+
+    __slots__ = ("type", "attributes", "digest")
+
+    def __init__(self, type, attributes, digest=None):
+        self.type = type
+        self.attributes = attributes
+        self.digest = digest
+
+    def __eq__(self, other):
+        if not isinstance(other, ResourceRecord):
+            return NotImplemented
+        return self.type == other.type and self.digest == other.digest and self.attributes == other.attributes
+
+    def __repr__(self):
+        return f"ResourceRecord({self.type!r}, {self.attributes!r}, digest={self.digest!r})"
+
+    def to_dict(self):
+        record = {"type": self.type, "attributes": self.attributes}
+        if self.digest:
+            record["digest"] = self.digest
+        return record
+
+
+# Terraform writes state attributes in a fixed order, so no key sorting is needed
+_DIGEST_ENCODER = json.JSONEncoder(separators=(",", ":"), default=str, check_circular=False)
+
+
+def attribute_digest(attributes):
+    """Content hash of an attribute dict"""
+    return hashlib.blake2b(_DIGEST_ENCODER.encode(attributes).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def project(resource_type, attributes, keep):
+    """Record with the attributes named in keep, the rest reduced to a digest"""
+    projected = {}
+    rest = {}
+    for name, value in attributes.items():
+        if name in keep:
+            projected[name] = value
+        else:
+            rest[name] = value
+    return ResourceRecord(resource_type, projected, attribute_digest(rest) if rest else None)
@@ -0,0 +1,169 @@
+import gzip
+import os
+import time
+import uuid
+from datetime import datetime
+
+import aws_backend
+import drift_json
+import drift_triage
+import resource_records
+
+CHECKPOINT_PREFIX = "drift-snapshots/checkpoints/"
+
+# Time kept back from the deadline so the last slice can still diff, triage and notify
+DEFAULT_RESERVE_MS = 30000
+
+
+class S3CheckpointStore:
+    """Checkpoint objects under CHECKPOINT_PREFIX in an S3 bucket"""
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.s3 = aws_backend.client("s3")
+
+    def read(self, name):
+        return self.s3.get_object(Bucket=self.bucket, Key=CHECKPOINT_PREFIX + name)["Body"].read()
+
+    def write(self, name, data):
+        self.s3.put_object(Bucket=self.bucket, Key=CHECKPOINT_PREFIX + name, Body=data)
+
+    def delete(self, names):
+        for name in names:
+            self.s3.delete_object(Bucket=self.bucket, Key=CHECKPOINT_PREFIX + name)
+
+
+class LocalCheckpointStore:
+    """Checkpoint files in a local directory, for running outside Lambda"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def read(self, name):
+        with open(self.path(name), "rb") as f:
+            return f.read()
+
+    def write(self, name, data):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data.encode("utf-8") if isinstance(data, str) else data)
+
+    def delete(self, names):
+        for name in names:
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+
+
+def checkpoint_store():
+    """CHECKPOINT_DIR selects a local directory, otherwise the snapshot bucket; None if neither is set"""
+    if os.environ.get("CHECKPOINT_DIR"):
+        return LocalCheckpointStore(os.environ["CHECKPOINT_DIR"])
+    bucket = os.environ.get("SNAPSHOT_BUCKET") or os.environ.get("TFSTATE_BUCKET")
+    return S3CheckpointStore(bucket) if bucket else None
+
+
+def new_scan(services):
+    """Progress record for a scan that has not collected anything yet"""
+    scan_time = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    return {
+        "scan_id": f"{scan_time.replace('-', '').replace(':', '')}-{uuid.uuid4().hex[:8]}",
+        "scan_time": scan_time,
+        "services": {service: {"token": None, "done": False, "pages": 0} for service in services},
+        "parts": [],
+        "resources": 0,
+        "slices": 0
+    }
+
+
+def load_scan(store, scan_id):
+    return drift_json.loads(store.read(f"{scan_id}/manifest.json"))
+
+
+def save_scan(store, scan):
+    store.write(f"{scan['scan_id']}/manifest.json", drift_json.dumpb(scan))
+
+
+def encode_part(resources):
+    return gzip.compress(drift_json.dumpb({rid: [d.type, d.attributes] for rid, d in resources.items()}, default=str))
+
+
+def decode_part(data):
+    return {rid: resource_records.ResourceRecord(t, a) for rid, (t, a) in drift_json.loads(gzip.decompress(data)).items()}
+
+
+def deadline_from_context(context):
+    """Deadline for collecting pages in this invocation, None without a Lambda context"""
+    return drift_triage.deadline_from_context(context, int(os.environ.get("SCAN_RESERVE_MS", DEFAULT_RESERVE_MS)))
+
+
+def run_slice(store, scan, pages, deadline=None):
+    """
+    Collect inventory pages until the scan is complete or the deadline passes.
+
+    pages maps an inventory type to (client name, page function), where the page
+    function takes (client, token) and returns (resources, next_token). Every page
+    is written as its own part and the manifest records the next page token per
+    type, so a later invocation continues exactly where this one stopped. At least
+    one page is collected per slice so a scan always makes progress.
+
+    Returns the merged inventory once every type is done, otherwise None.
+    """
+    scan["slices"] += 1
+    collected = {}
+    collected_parts = set()
+    first_page = True
+    for service, (client_name, page) in pages.items():
+        progress = scan["services"][service]
+        if progress["done"]:
+            continue
+        client = aws_backend.client(client_name)
+        while not progress["done"]:
+            if not first_page and deadline is not None and time.monotonic() >= deadline:
+                save_scan(store, scan)
+                print(f"Scan {scan['scan_id']} paused at {service} after {scan['resources']} resources")
+                return None
+            first_page = False
+            try:
+                resources, token = page(client, progress["token"])
+            except Exception as e:
+                # Same as a full collection: report the error and move on to the next type
+                print(f"Error getting {service} resources: {e}")
+                progress.update(done=True, error=str(e))
+                save_scan(store, scan)
+                break
+            part = f"{scan['scan_id']}/part-{len(scan['parts']):05d}.json.gz"
+            store.write(part, encode_part(resources))
+            scan["parts"].append(part)
+            collected.update(resources)
+            collected_parts.add(part)
+            scan["resources"] += len(resources)
+            progress.update(token=token, done=not token, pages=progress["pages"] + 1)
+            save_scan(store, scan)
+
+    # Pages from earlier slices are read back, this slice's are already in memory
+    actual_resources = {}
+    for part in scan["parts"]:
+        if part not in collected_parts:
+            actual_resources.update(decode_part(store.read(part)))
+    actual_resources.update(collected)
+    return actual_resources
+
+
+def progress(scan):
+    """Short progress summary for a paused scan"""
+    return {
+        "resources": scan["resources"],
+        "slices": scan["slices"],
+        "services": {s: ("done" if p["done"] else f"{p['pages']} pages") for s, p in scan["services"].items()}
+    }
+
+
+def finish_scan(store, scan):
+    """Remove a completed scan's parts and manifest"""
+    store.delete(scan["parts"] + [f"{scan['scan_id']}/manifest.json"])
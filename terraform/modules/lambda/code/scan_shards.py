@@ -0,0 +1,131 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import aws_backend
+import drift_json
+import drift_metrics
+import scan_checkpoint
+
+SHARD_PREFIX = "drift-snapshots/shards/"
+
+# Last character of an EC2 instance id, matched server side with an instance-id filter
+INSTANCE_ID_SUFFIXES = "0123456789abcdef"
+
+
+def scan_regions():
+    """Regions EC2 and RDS are scanned in, SCAN_REGIONS or the function's own region"""
+    regions = [r.strip() for r in os.environ.get("SCAN_REGIONS", "").split(",") if r.strip()]
+    return regions or [None]
+
+
+def plan_shards(regions, id_shards):
+    """
+    Partition the inventory into independent shards.
+
+    Only EC2 is split by id, into id_shards instance id suffix groups per
+    region, because describe_instances filters them server side. S3 and RDS
+    can only be listed whole, and their tags come from one bulk index per
+    region, so each is one shard (RDS per region) that lists and indexes once.
+    IAM is global and cheap to list, so it stays one shard as well.
+    """
+    shards = []
+    for region in regions:
+        suffix_groups = [INSTANCE_ID_SUFFIXES[i::id_shards] for i in range(min(id_shards, len(INSTANCE_ID_SUFFIXES)))]
+        for group in suffix_groups:
+            shards.append({"service": "EC2", "region": region, "query": {"Filters": [{"Name": "instance-id", "Values": [f"i-*{c}" for c in group]}]}})
+        shards.append({"service": "RDS", "region": region})
+    shards.append({"service": "S3", "region": None})
+    shards.append({"service": "IAM", "region": None})
+
+    for index, shard in enumerate(shards):
+        shard["shard_id"] = f"{index:04d}-{shard['service'].lower()}"
+    return shards
+
+
+def collect_shard(shard, pages):
+    """All resources in one shard, using the same page functions as a full scan"""
+    client_name, page = pages[shard["service"]]
+    client = aws_backend.client(client_name, region_name=shard["region"]) if shard.get("region") else aws_backend.client(client_name)
+    query = dict(shard.get("query") or {})
+
+    resources = {}
+    token = None
+    while True:
+        batch, token = page(client, token, **query)
+        resources.update(batch)
+        if not token:
+            return resources
+
+
+def shard_key(scan_id, shard_id):
+    return f"{SHARD_PREFIX}{scan_id}/{shard_id}.json.gz"
+
+
+def run_worker(event, pages):
+    """Collect one shard and write it to S3 for the coordinator"""
+    shard = event["scan_shard"]
+    resources = collect_shard(shard, pages)
+    key = shard_key(event["scan_id"], shard["shard_id"])
+    aws_backend.client("s3").put_object(Bucket=event["bucket"], Key=key, Body=scan_checkpoint.encode_part(resources))
+    print(f"Shard {shard['shard_id']} collected {len(resources)} resources to s3://{event['bucket']}/{key}")
+    return {"shard_id": shard["shard_id"], "key": key, "resources": len(resources)}
+
+
+def coordinate(function_name, bucket, pages, workers, regions=None):
+    """
+    Fan a full inventory scan out over worker invocations of function_name.
+
+    Up to workers shards run at once. Each worker writes its shard to S3, since a
+    synchronous invoke response is capped at 6 MB, and the coordinator reads it
+    back as soon as the worker returns. A shard whose worker fails is collected
+    by the coordinator itself; if that fails too (a throttled region), the shard
+    is listed under "incomplete_shards" and the scan goes on with the others,
+    as a full scan does for a service it cannot list. Returns
+    (actual_resources, scan summary).
+    """
+    scan_id = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}-{os.urandom(4).hex()}"
+    shards = plan_shards(regions or scan_regions(), workers)
+    lambda_client = aws_backend.client("lambda")
+    s3 = aws_backend.client("s3")
+
+    def run_shard(shard):
+        try:
+            response = lambda_client.invoke(
+                FunctionName=function_name,
+                InvocationType="RequestResponse",
+                Payload=drift_json.dumpb({"scan_shard": shard, "scan_id": scan_id, "bucket": bucket})
+            )
+            payload = drift_json.loads(response["Payload"].read())
+            if response.get("FunctionError") or "error" in payload:
+                raise RuntimeError(payload.get("errorMessage") or payload.get("error"))
+            obj = s3.get_object(Bucket=bucket, Key=payload["key"])
+            resources = scan_checkpoint.decode_part(obj["Body"].read())
+            s3.delete_object(Bucket=bucket, Key=payload["key"])
+            return resources, "ok"
+        except Exception as e:
+            print(f"Shard {shard['shard_id']} failed in worker, collecting it here: {e}")
+        try:
+            return collect_shard(shard, pages), "local"
+        except Exception as e:
+            print(f"Error collecting shard {shard['shard_id']}, scanning without it: {e}")
+            return {}, "incomplete"
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = [future.result() for future in [drift_metrics.submit(executor, run_shard, shard) for shard in shards]]
+
+    actual_resources = {}
+    for resources, _ in outcomes:
+        actual_resources.update(resources)
+    summary = {
+        "scan_id": scan_id,
+        "workers": workers,
+        "shards": len(shards),
+        "failed_shards": sum(1 for _, status in outcomes if status != "ok"),
+        "resources": len(actual_resources)
+    }
+    incomplete = [shard["shard_id"] for shard, (_, status) in zip(shards, outcomes) if status == "incomplete"]
+    if incomplete:
+        summary["incomplete_shards"] = incomplete
+    print(f"Sharded scan {scan_id}: {summary}")
+    return actual_resources, summary
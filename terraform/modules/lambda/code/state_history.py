@@ -0,0 +1,109 @@
+import bisect
+from collections import OrderedDict
+from datetime import timezone
+
+import drift_json
+
+# Parsed versions kept per state object; the state handlers only need the last two
+HANDLER_CACHE_SIZE = 2
+
+# Parsed versions kept per state object by the state handlers, across warm invocations
+_handler_caches = {}
+
+
+def as_utc(value):
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+class StateHistory:
+    """
+    Versions of one Terraform state object, each parsed once and cached by version id.
+
+    Only versions of exactly this key count: a Prefix listing also returns e.g.
+    "terraform.tfstate.backup". parse turns a state document into whatever the
+    caller compares (an index of instances, managed resource records).
+    """
+
+    def __init__(self, s3, bucket, key, parse, cache=None, cache_size=HANDLER_CACHE_SIZE):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.parse = parse
+        self.cache = OrderedDict() if cache is None else cache
+        self.cache_size = cache_size
+        self.versions = None
+        self.times = None
+        self.loads = 0
+
+    def iter_versions(self):
+        """(last modified, version id, is delete marker) of this key, newest first, a page at a time"""
+        kwargs = {"Bucket": self.bucket, "Prefix": self.key}
+        while True:
+            response = self.s3.list_object_versions(**kwargs)
+            entries = [(as_utc(v["LastModified"]), v["VersionId"], False) for v in response.get("Versions", []) if v["Key"] == self.key]
+            entries += [(as_utc(m["LastModified"]), m["VersionId"], True) for m in response.get("DeleteMarkers", []) if m["Key"] == self.key]
+            # Each list is newest first already; the stable sort only interleaves the two
+            entries.sort(key=lambda entry: entry[0], reverse=True)
+            yield from entries
+            # Keys sort after the prefix itself, so once the listing moves on this key is done
+            if not response.get("IsTruncated") or response.get("NextKeyMarker") != self.key:
+                return
+            kwargs["KeyMarker"] = response["NextKeyMarker"]
+            kwargs["VersionIdMarker"] = response.get("NextVersionIdMarker")
+
+    def version_pair(self, version_id=None):
+        """
+        (current, previous) version ids for an upload of version_id, the latest if None.
+
+        Delete markers are skipped. previous is None for the first version, and
+        both are None if version_id is not listed (yet).
+        """
+        current = None
+        for _, listed_id, deleted in self.iter_versions():
+            if deleted:
+                continue
+            if current is None:
+                if version_id is None or listed_id == version_id:
+                    current = listed_id
+                continue
+            return current, listed_id
+        return current, None
+
+    def list_versions(self):
+        """Every version and delete marker of this key, oldest first"""
+        versions = list(self.iter_versions())
+        versions.reverse()
+        self.versions = versions
+        self.times = [version[0] for version in versions]
+
+    def version_at(self, when):
+        """(last modified, version id, is delete marker) current at when, or None before the first upload"""
+        if self.versions is None:
+            self.list_versions()
+        index = bisect.bisect_right(self.times, when)
+        return self.versions[index - 1] if index else None
+
+    def parsed(self, version_id):
+        """One version, parsed; the most recently used versions are kept"""
+        if version_id in self.cache:
+            self.cache.move_to_end(version_id)
+            return self.cache[version_id]
+        state_obj = self.s3.get_object(Bucket=self.bucket, Key=self.key, VersionId=version_id)
+        value = self.parse(drift_json.loads(state_obj["Body"].read()))
+        self.loads += 1
+        self.cache[version_id] = value
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return value
+
+
+def handler_history(s3, bucket, key, parse):
+    """
+    History of one state object for the state change handlers.
+
+    The parsed versions outlive the invocation, so on the next upload the
+    previous version is the one parsed as current last time and is not
+    downloaded again.
+    """
+    cache = _handler_caches.setdefault((bucket, key, parse), OrderedDict())
+    return StateHistory(s3, bucket, key, parse, cache=cache)
@@ -0,0 +1,52 @@
+import threading
+import time
+
+import aws_backend
+
+# Inventory type -> Resource Groups Tagging API resource type filter
+TAGGING_TYPES = {"S3": "s3", "RDS": "rds:db"}
+
+# Upper bound on how long an index is reused by later pages of the same scan
+INDEX_TTL = 300
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def client_region(client):
+    """Region a client was created for, None if it does not say"""
+    return getattr(getattr(client, "meta", None), "region_name", None)
+
+
+def fetch_tags(inventory_type, region=None):
+    """{ARN: tags} for every tagged resource of one inventory type, from paginated get_resources calls"""
+    tagging = aws_backend.client("resourcegroupstaggingapi", region_name=region) if region else aws_backend.client("resourcegroupstaggingapi")
+    tags = {}
+    paginator = tagging.get_paginator("get_resources")
+    for page in paginator.paginate(ResourceTypeFilters=[TAGGING_TYPES[inventory_type]], ResourcesPerPage=100):
+        for mapping in page.get("ResourceTagMappingList", []):
+            tags[mapping["ResourceARN"]] = {tag["Key"]: tag["Value"] for tag in mapping.get("Tags", [])}
+    return tags
+
+
+def tags_for(inventory_type, region=None, refresh=False):
+    """
+    Bulk tag index for one inventory type and region, or None when the tagging
+    API failed and tags have to be fetched per resource.
+
+    The first page of a scan passes refresh=True, so every scan starts from a
+    fresh index and its later pages reuse it. Resources missing from the index
+    have no tags.
+    """
+    key = (inventory_type, region)
+    with _lock:
+        cached = _indexes.get(key)
+        if not refresh and cached and time.monotonic() - cached[0] < INDEX_TTL:
+            return cached[1]
+        try:
+            tags = fetch_tags(inventory_type, region)
+        except Exception as e:
+            print(f"Error getting {inventory_type} tags from the tagging API, falling back to per-resource calls: {e}")
+            tags = None
+        _indexes[key] = (time.monotonic(), tags)
+        return tags
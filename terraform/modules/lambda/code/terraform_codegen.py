@@ -0,0 +1,257 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import aws_backend
+import drift_metrics
+import resource_identity
+
+REMEDIATION_PREFIX = "drift-snapshots/remediation/"
+
+# Inventory type -> Terraform type
+TERRAFORM_TYPES = {inventory: terraform for terraform, inventory in resource_identity.TERRAFORM_TYPES.items()}
+
+# Batch sizes of the describe calls used to fill in missing attributes; EC2
+# filters take at most 200 values
+EC2_BATCH = 200
+RDS_BATCH = 100
+
+IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_-]*$")
+
+
+def hcl_string(value):
+    """Quoted HCL string, with interpolation sequences escaped"""
+    value = value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return "\"" + value.replace("${", "$${").replace("%{", "%%{") + "\""
+
+
+def hcl_value(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(hcl_value(v) for v in value) + "]"
+    return hcl_string(str(value))
+
+
+def hcl_key(key):
+    return key if IDENTIFIER.match(key) else hcl_string(key)
+
+
+def aligned(pairs, indent):
+    """Attribute lines with their equals signs aligned, as terraform fmt does"""
+    width = max(len(name) for name, _ in pairs)
+    return [f"{indent}{name.ljust(width)} = {value}" for name, value in pairs]
+
+
+def resource_block(tf_type, name, attributes):
+    """One resource block; dict attributes are written as maps after the scalars"""
+    scalars = [(key, hcl_value(value)) for key, value in attributes if not isinstance(value, dict)]
+    lines = [f"resource \"{tf_type}\" \"{name}\" {{"]
+    if scalars:
+        lines.extend(aligned(scalars, "  "))
+    for key, value in attributes:
+        if isinstance(value, dict):
+            lines.append(f"  {key} = {{")
+            lines.extend(aligned([(hcl_key(k), hcl_value(v)) for k, v in value.items()], "    "))
+            lines.append("  }")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def import_block(tf_type, name, resource_id):
+    return f"import {{\n  to = {tf_type}.{name}\n  id = {hcl_string(resource_id)}\n}}\n"
+
+
+def user_tags(tags):
+    """Tags Terraform can manage; aws:* tags are reserved for AWS"""
+    return {k: v for k, v in (tags or {}).items() if not k.startswith("aws:")}
+
+
+def ec2_attributes(resource_id, attributes):
+    return [
+        ("ami", attributes.get("ami")),
+        ("instance_type", attributes.get("instance_type")),
+        ("subnet_id", attributes.get("subnet_id")),
+        ("vpc_security_group_ids", attributes.get("security_groups") or None),
+        ("tags", user_tags(attributes.get("tags")))
+    ]
+
+
+def s3_attributes(resource_id, attributes):
+    return [
+        ("bucket", resource_id),
+        ("tags", user_tags(attributes.get("tags")))
+    ]
+
+
+def iam_attributes(resource_id, attributes):
+    return [
+        ("name", resource_id),
+        ("path", attributes.get("path")),
+        ("tags", user_tags(attributes.get("tags")))
+    ]
+
+
+def rds_attributes(resource_id, attributes):
+    return [
+        ("identifier", resource_id),
+        ("engine", attributes.get("engine")),
+        ("engine_version", attributes.get("engine_version")),
+        ("instance_class", attributes.get("instance_class")),
+        ("allocated_storage", attributes.get("storage_size")),
+        ("multi_az", attributes.get("multi_az")),
+        ("tags", user_tags(attributes.get("tags")))
+    ]
+
+
+def describe_ec2(resource_ids):
+    """
+    AMI ids of instances, one describe call per EC2_BATCH instances.
+
+    Instances are selected with an instance-id filter rather than InstanceIds,
+    so an instance terminated since the scan is left out instead of failing the
+    whole call with InvalidInstanceID.NotFound.
+    """
+    ec2 = aws_backend.client("ec2")
+    found = {}
+    for start in range(0, len(resource_ids), EC2_BATCH):
+        query = {"Filters": [{"Name": "instance-id", "Values": resource_ids[start:start + EC2_BATCH]}]}
+        while True:
+            response = ec2.describe_instances(**query)
+            for reservation in response["Reservations"]:
+                for instance in reservation["Instances"]:
+                    found[instance["InstanceId"]] = {"ami": instance.get("ImageId")}
+            if not response.get("NextToken"):
+                break
+            query["NextToken"] = response["NextToken"]
+    return found
+
+
+def describe_rds(resource_ids):
+    """Engine versions of DB instances, one describe call per RDS_BATCH instances"""
+    rds = aws_backend.client("rds")
+    found = {}
+    for start in range(0, len(resource_ids), RDS_BATCH):
+        response = rds.describe_db_instances(Filters=[{"Name": "db-instance-id", "Values": resource_ids[start:start + RDS_BATCH]}])
+        for db in response["DBInstances"]:
+            found[db["DBInstanceIdentifier"]] = {"engine_version": db.get("EngineVersion")}
+    return found
+
+
+def describe_iam(resource_ids):
+    """User tags; IAM has no batch call for them, so one call per user"""
+    iam = aws_backend.client("iam")
+    found = {}
+    for user_name in resource_ids:
+        try:
+            response = iam.list_user_tags(UserName=user_name)
+        except Exception as e:
+            # Deleted since the scan; left out like the EC2 and RDS lookups leave it out
+            if drift_metrics.error_code(e) != "NoSuchEntity":
+                raise
+            continue
+        found[user_name] = {"tags": {tag["Key"]: tag["Value"] for tag in response.get("Tags", [])}}
+    return found
+
+
+# Inventory type -> (attribute writer, attribute the inventory may lack, describe call that fills it)
+GENERATORS = {
+    "EC2": (ec2_attributes, "ami", describe_ec2),
+    "S3": (s3_attributes, None, None),
+    "IAM": (iam_attributes, "tags", describe_iam),
+    "RDS": (rds_attributes, "engine_version", describe_rds)
+}
+
+NOTES = {
+    "RDS": "# Master credentials are not returned by the API; set username and password\n# (or manage_master_user_password) before the first apply.\n\n"
+}
+
+
+def resource_name(resource_id, attributes, used):
+    """Terraform resource name from the Name tag or id, unique within its type"""
+    base = re.sub(r"[^A-Za-z0-9_-]", "_", (attributes.get("tags") or {}).get("Name") or resource_id)
+    if not IDENTIFIER.match(base):
+        base = f"r_{base}"
+    name = base
+    suffix = 2
+    while name in used:
+        name = f"{base}_{suffix}"
+        suffix += 1
+    used.add(name)
+    return name
+
+
+def generate_type(inventory_type, resource_ids, actual_resources):
+    """Import and resource blocks for the unmanaged resources of one inventory type"""
+    write_attributes, needed, describe = GENERATORS[inventory_type]
+    tf_type = TERRAFORM_TYPES[inventory_type]
+
+    extra = {}
+    gone = set()
+    missing = [rid for rid in resource_ids if needed and actual_resources[rid].attributes.get(needed) is None]
+    if missing:
+        try:
+            extra = describe(missing)
+            gone = {rid for rid in missing if rid not in extra}
+        except Exception as e:
+            print(f"Error describing {inventory_type} resources for import blocks: {e}")
+
+    chunks = [f"# {tf_type} ({len(resource_ids) - len(gone)})\n\n", NOTES.get(inventory_type, "")]
+    used = set()
+    for resource_id in resource_ids:
+        if resource_id in gone:
+            continue
+        attributes = dict(actual_resources[resource_id].attributes, **extra.get(resource_id, {}))
+        name = resource_name(resource_id, attributes, used)
+        values = [(key, value) for key, value in write_attributes(resource_id, attributes) if value is not None and value != {}]
+        chunks.append(import_block(tf_type, name, resource_id))
+        chunks.append("\n")
+        chunks.append(resource_block(tf_type, name, values))
+        chunks.append("\n")
+    if gone:
+        chunks.append("# Not generated (no longer exists):\n")
+        chunks.extend(f"#   {inventory_type} {resource_id}\n" for resource_id in resource_ids if resource_id in gone)
+        chunks.append("\n")
+    return chunks
+
+
+def generate_import_file(unmanaged_resources, actual_resources, workers=4):
+    """
+    Terraform for adopting every unmanaged resource, as a list of text chunks.
+
+    Resources are grouped and deduplicated by type. Each type is generated on its
+    own worker thread from the attributes the inventory already holds, with
+    batched describe calls only for the fields it lacks. Types the generator does
+    not know are listed in a comment at the end.
+    """
+    by_type = {}
+    unsupported = []
+    for resource in unmanaged_resources:
+        resource_id = resource["id"]
+        if resource["type"] not in GENERATORS or resource_id not in actual_resources:
+            unsupported.append(resource)
+            continue
+        ids = by_type.setdefault(resource["type"], {})
+        ids[resource_id] = None
+
+    header = (
+        f"# Generated by DriftGuard from live AWS attributes at {datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')}\n"
+        "# Review before applying. import blocks need Terraform 1.5 or later.\n\n"
+    )
+    chunks = [header]
+    if by_type:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(by_type)))) as pool:
+            futures = [drift_metrics.submit(pool, generate_type, t, list(ids), actual_resources) for t, ids in by_type.items()]
+            for future in futures:
+                chunks.extend(future.result())
+    if unsupported:
+        chunks.append("# Not generated (unsupported type):\n")
+        chunks.extend(f"#   {r['type']} {r['id']}\n" for r in unsupported)
+    return chunks
+
+
+def remediation_key(scan_time=None):
+    stamp = (scan_time or datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")).replace(":", "").replace("-", "")
+    return f"{REMEDIATION_PREFIX}{stamp}/unmanaged.tf"
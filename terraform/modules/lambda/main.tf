@@ -1,3 +1,11 @@
+# All handlers share one package so they can import the common modules in code/
+data "archive_file" "lambda_code" {
+  type        = "zip"
+  source_dir  = "${path.module}/code"
+  output_path = "${path.module}/build/lambda_code.zip"
+  excludes    = ["__pycache__"]
+}
+
 resource "aws_iam_role" "drift_lambda" {
   name = "drift-checker-role"
   assume_role_policy = jsonencode({
@@ -31,6 +39,8 @@ resource "aws_iam_role_policy" "drift_lambda_permissions" {
           "s3:GetBucketTagging",
           "s3:PutObject",
           "s3:PutObjectAcl",
+          "s3:DeleteObject",
+          "s3:AbortMultipartUpload",
           "ec2:DescribeInstances",
           "ec2:DescribeVpcs",
           "lambda:ListFunctions",
@@ -39,68 +49,85 @@ resource "aws_iam_role_policy" "drift_lambda_permissions" {
           "rds:ListTagsForResource",
           "dynamodb:ListTables",
           "iam:ListUsers",
+          "iam:ListUserTags",
           "logs:DescribeLogGroups",
           "ecs:ListClusters",
           "eks:ListClusters",
           "sns:Publish",
           "bedrock:InvokeModel",
           "cloudtrail:LookupEvents",
-          "config:GetResourceConfigHistory"
+          "config:GetResourceConfigHistory",
+          "config:ListDiscoveredResources",
+          "tag:GetResources"
         ]
         Resource = "*"
+      },
+      {
+        # Listing the queue, checkpoint and batch prefixes needs ListBucket on the bucket itself
+        Effect   = "Allow"
+        Action   = ["s3:ListBucket"]
+        Resource = ["arn:aws:s3:::${var.s3_bucket}", "arn:aws:s3:::${var.snapshot_bucket}"]
       }
     ]
   })
 }
 
 resource "aws_lambda_function" "drift_checker" {
-  filename         = "${path.module}/code/drift_checker.zip"
+  filename         = data.archive_file.lambda_code.output_path
   function_name    = "iac-drift-checker"
   role             = aws_iam_role.drift_lambda.arn
   handler          = "drift_checker.lambda_handler"
   runtime          = "python3.10"
   timeout          = 60
   memory_size     = 256
-  source_code_hash = filebase64sha256("${path.module}/code/drift_checker.zip")
+  source_code_hash = data.archive_file.lambda_code.output_base64sha256
   environment {
     variables = {
       TFSTATE_BUCKET = var.s3_bucket
       SNS_TOPIC_ARN = var.sns_topic_arn
       BEDROCK_ANALYZER_ARN = aws_lambda_function.bedrock_analyzer.arn
+      SNAPSHOT_BUCKET = var.snapshot_bucket
+      PROFILE_BUCKET = var.snapshot_bucket
     }
   }
 }
 
 resource "aws_lambda_function" "bedrock_analyzer" {
-  filename         = "${path.module}/code/bedrock_analyzer.zip"
+  filename         = data.archive_file.lambda_code.output_path
   function_name    = "bedrock-drift-analyzer"
   role             = aws_iam_role.drift_lambda.arn
   handler          = "bedrock_analyzer.lambda_handler"
   runtime          = "python3.10"
   timeout          = 60
   memory_size      = 512
-  source_code_hash = filebase64sha256("${path.module}/code/bedrock_analyzer.zip")
+  source_code_hash = data.archive_file.lambda_code.output_base64sha256
   environment {
     variables = {
       MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
+      DEEP_MODEL_ID = "anthropic.claude-3-5-sonnet-20240620-v1:0"
+      FAST_MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
       SNS_TOPIC_ARN = var.sns_topic_arn
       HISTORY_BUCKET = var.s3_bucket
+      BATCH_BUCKET = var.snapshot_bucket
+      PROFILE_BUCKET = var.snapshot_bucket
+      BATCH_ROLE_ARN = aws_iam_role.bedrock_batch.arn
     }
   }
 }
 
 resource "aws_lambda_function" "config_history" {
-  filename         = "${path.module}/code/config_history.zip"
+  filename         = data.archive_file.lambda_code.output_path
   function_name    = "config-history-analyzer"
   role             = aws_iam_role.drift_lambda.arn
   handler          = "config_history.lambda_handler"
   runtime          = "python3.10"
   timeout          = 10
   memory_size      = 256
-  source_code_hash = filebase64sha256("${path.module}/code/config_history.zip")
+  source_code_hash = data.archive_file.lambda_code.output_base64sha256
   environment {
     variables = {
       SNS_TOPIC_ARN = var.sns_topic_arn
+      PROFILE_BUCKET = var.snapshot_bucket
     }
   }
 }
@@ -124,11 +151,75 @@ resource "aws_iam_role_policy" "bedrock_invoke" {
           "bedrock-agent:RetrieveAndGenerate"
         ],
         Resource = "*"
+      },
+      {
+        Effect   = "Allow",
+        Action   = [
+          "bedrock:CreateModelInvocationJob",
+          "bedrock:GetModelInvocationJob"
+        ],
+        Resource = "*"
+      },
+      {
+        Effect   = "Allow",
+        Action   = ["iam:PassRole"],
+        Resource = aws_iam_role.bedrock_batch.arn
       }
     ]
   })
 }
 
+# Role Bedrock batch inference jobs run as, reading prompts from and writing answers to the snapshot bucket
+resource "aws_iam_role" "bedrock_batch" {
+  name = "drift-bedrock-batch-role"
+  assume_role_policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [{
+      Effect = "Allow",
+      Principal = { Service = "bedrock.amazonaws.com" },
+      Action = "sts:AssumeRole"
+    }]
+  })
+}
+
+resource "aws_iam_role_policy" "bedrock_batch_s3" {
+  name = "bedrock-batch-s3"
+  role = aws_iam_role.bedrock_batch.id
+
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [
+      {
+        Effect   = "Allow",
+        Action   = ["s3:GetObject", "s3:PutObject", "s3:ListBucket"],
+        Resource = ["arn:aws:s3:::${var.snapshot_bucket}", "arn:aws:s3:::${var.snapshot_bucket}/drift-snapshots/analysis-batches/*"]
+      }
+    ]
+  })
+}
+
+# Hourly batch analysis run: submit queued drift reports and deliver finished batch jobs
+resource "aws_cloudwatch_event_rule" "batch_analysis" {
+  name                = "drift-batch-analysis"
+  description         = "Submit and collect batched drift analysis every hour"
+  schedule_expression = "rate(1 hour)"
+}
+
+resource "aws_cloudwatch_event_target" "batch_analysis_lambda" {
+  rule      = aws_cloudwatch_event_rule.batch_analysis.name
+  target_id = "BatchAnalysisLambda"
+  arn       = aws_lambda_function.bedrock_analyzer.arn
+  input     = jsonencode({ batch_analysis = "run" })
+}
+
+resource "aws_lambda_permission" "batch_analysis_invoke" {
+  statement_id  = "AllowBatchAnalysisInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.bedrock_analyzer.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.batch_analysis.arn
+}
+
 resource "aws_lambda_permission" "allow_drift_to_invoke_bedrock" {
   statement_id  = "AllowDriftToInvokeBedrock"
   action        = "lambda:InvokeFunction"
@@ -138,19 +229,20 @@ resource "aws_lambda_permission" "allow_drift_to_invoke_bedrock" {
 }
 
 resource "aws_lambda_function" "drift_rag" {
-  filename         = "${path.module}/code/drift_rag.zip"
+  filename         = data.archive_file.lambda_code.output_path
   function_name    = "drift-rag-query"
   role             = aws_iam_role.drift_lambda.arn
   handler          = "drift_rag.lambda_handler"
   runtime          = "python3.10"
   timeout          = 60
   memory_size      = 512
-  source_code_hash = filebase64sha256("${path.module}/code/drift_rag.zip")
+  source_code_hash = data.archive_file.lambda_code.output_base64sha256
   environment {
     variables = {
       MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
       KNOWLEDGE_BASE_ID = var.knowledge_base_id
       RETRIEVER_ID = var.retriever_id
+      PROFILE_BUCKET = var.snapshot_bucket
     }
   }
 }
\ No newline at end of file
@@ -3,6 +3,11 @@ variable "s3_bucket" {
   type        = string
 }
 
+variable "snapshot_bucket" {
+  description = "Name of the S3 bucket for drift snapshots, checkpoints, idempotency records and batch analysis"
+  type        = string
+}
+
 variable "sns_topic_arn" {
   description = "ARN of the SNS topic for drift alerts"
   type        = string
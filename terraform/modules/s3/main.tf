@@ -3,6 +3,102 @@ resource "aws_s3_bucket" "tfstate" {
   # force_destroy = true
 }
 
+# Drift objects written before the snapshot bucket existed, or by deployments that still
+# point SNAPSHOT_BUCKET at the state bucket. Only these prefixes expire, state versions are kept.
+resource "aws_s3_bucket_lifecycle_configuration" "tfstate" {
+  bucket = aws_s3_bucket.tfstate.id
+
+  rule {
+    id     = "expire-drift-snapshots"
+    status = "Enabled"
+    filter {
+      prefix = "drift-snapshots/"
+    }
+    expiration {
+      days = 30
+    }
+    noncurrent_version_expiration {
+      noncurrent_days = 1
+    }
+    abort_incomplete_multipart_upload {
+      days_after_initiation = 1
+    }
+  }
+
+  rule {
+    id     = "expire-drift-profiles"
+    status = "Enabled"
+    filter {
+      prefix = "drift-profiles/"
+    }
+    expiration {
+      days = 14
+    }
+    noncurrent_version_expiration {
+      noncurrent_days = 1
+    }
+  }
+}
+
+# Operational objects: inventory snapshots, scan checkpoints and shards, idempotency records,
+# report handoffs, remediation files, the batch analysis queue and profiles
+resource "aws_s3_bucket" "drift_snapshots" {
+  bucket = "statetf-bucket-drift-snapshots"
+}
+
+resource "aws_s3_bucket_lifecycle_configuration" "drift_snapshots" {
+  bucket = aws_s3_bucket.drift_snapshots.id
+
+  rule {
+    id     = "expire-drift-snapshots"
+    status = "Enabled"
+    filter {
+      prefix = "drift-snapshots/"
+    }
+    expiration {
+      days = 30
+    }
+    abort_incomplete_multipart_upload {
+      days_after_initiation = 1
+    }
+  }
+
+  # A snapshot is written every scan; latest.json is rewritten each time and never ages out
+  rule {
+    id     = "expire-inventory-snapshots"
+    status = "Enabled"
+    filter {
+      prefix = "drift-snapshots/inventory/"
+    }
+    expiration {
+      days = 7
+    }
+  }
+
+  # Records are only consulted for an hour
+  rule {
+    id     = "expire-idempotency-records"
+    status = "Enabled"
+    filter {
+      prefix = "drift-snapshots/idempotency/"
+    }
+    expiration {
+      days = 1
+    }
+  }
+
+  rule {
+    id     = "expire-drift-profiles"
+    status = "Enabled"
+    filter {
+      prefix = "drift-profiles/"
+    }
+    expiration {
+      days = 14
+    }
+  }
+}
+
 output "bucket_name" {
     description = "S3 bucket name."
     value = aws_s3_bucket.tfstate.bucket
@@ -11,4 +107,14 @@ output "bucket_name" {
 output "bucket_arn" {
     description = "S3 bucket ARN."
     value = aws_s3_bucket.tfstate.arn
+}
+
+output "snapshot_bucket_name" {
+    description = "S3 bucket for drift snapshots and other operational objects."
+    value = aws_s3_bucket.drift_snapshots.bucket
+}
+
+output "snapshot_bucket_arn" {
+    description = "S3 bucket ARN for drift snapshots."
+    value = aws_s3_bucket.drift_snapshots.arn
 }
\ No newline at end of file
@@ -0,0 +1,30 @@
+"""
+Shared fixtures: the Lambda code directory on sys.path, as the repo's scripts
+do, and a fresh in-process fake AWS backend per test.
+"""
+import os
+import sys
+
+import pytest
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "terraform", "modules", "lambda", "code")
+sys.path.insert(0, CODE_DIR)
+
+import aws_backend
+import fake_aws
+
+BUCKET = "drift-test-bucket"
+
+
+@pytest.fixture
+def aws():
+    backend = fake_aws.FakeAWS()
+    backend.add_bucket(BUCKET)
+    previous = aws_backend.set_backend(backend)
+    yield backend
+    aws_backend.set_backend(previous)
+
+
+@pytest.fixture
+def s3(aws):
+    return aws_backend.client("s3")
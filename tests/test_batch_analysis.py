@@ -0,0 +1,96 @@
+import pytest
+
+import batch_analysis
+from conftest import BUCKET
+
+
+class FinishedProcessor:
+    """Batch processor whose job has already finished with the given status"""
+
+    name = "local"
+    min_records = 1
+
+    def __init__(self, status="Failed"):
+        self.job_status = status
+
+    def status(self, job):
+        return self.job_status
+
+
+class Crash(BaseException):
+    """Stands in for a Lambda timeout: not caught by collect's per-record handler"""
+
+
+def manifest(records=5):
+    return {
+        "batch_id": "20260101T000000Z-test",
+        "job": "job-1",
+        "processor": "local",
+        "model_id": "model",
+        "status": "submitted",
+        "output_prefix": f"{batch_analysis.BATCH_PREFIX}20260101T000000Z-test/output/",
+        "records": {f"{i:08d}": {"bucket": BUCKET, "key": f"report-{i}"} for i in range(records)}
+    }
+
+
+def report(n):
+    return {"unmanaged_resources": [{"id": f"i-{n}", "type": "EC2"}], "deleted_resources": [], "modified_resources": []}
+
+
+def test_collect_resumes_after_a_crash_without_redelivering(s3):
+    batch = manifest()
+    batch_analysis.save_manifest(s3, BUCKET, batch)
+    delivered = []
+
+    def crash_after_three(record_id, pointer, analysis, model_id):
+        if len(delivered) == 3:
+            raise Crash()
+        delivered.append(record_id)
+
+    with pytest.raises(Crash):
+        batch_analysis.collect(s3, BUCKET, batch, crash_after_three, FinishedProcessor())
+    assert [m["status"] for m in batch_analysis.pending(s3, BUCKET)] == ["submitted"]
+
+    [batch] = batch_analysis.pending(s3, BUCKET)
+    batch_analysis.collect(s3, BUCKET, batch, lambda record_id, *args: delivered.append(record_id), FinishedProcessor())
+    assert delivered == sorted(batch["records"])
+    assert batch_analysis.pending(s3, BUCKET) == []
+
+
+def test_collect_retries_nothing_once_the_batch_is_delivered(s3):
+    batch = manifest(2)
+    batch_analysis.save_manifest(s3, BUCKET, batch)
+    delivered = []
+    deliver = lambda record_id, pointer, analysis, model_id: delivered.append((record_id, analysis, model_id))
+
+    assert batch_analysis.poll(s3, BUCKET, deliver) == {"delivered": [batch["batch_id"]], "pending": []}
+    assert batch_analysis.poll(s3, BUCKET, deliver) == {"delivered": [], "pending": []}
+    # A failed job has no answers, every record gets the template report
+    assert delivered == [("00000000", None, None), ("00000001", None, None)]
+
+
+def test_collect_waits_for_a_running_job(s3):
+    batch = manifest(1)
+    batch_analysis.save_manifest(s3, BUCKET, batch)
+    assert batch_analysis.collect(s3, BUCKET, batch, lambda *args: pytest.fail("delivered early"), FinishedProcessor("InProgress")) is None
+    assert batch_analysis.delivered(s3, BUCKET, batch) == set()
+
+
+def test_submit_leaves_unreadable_entries_queued(s3):
+    keys = [batch_analysis.enqueue(s3, BUCKET, {"drift_report": report(n)}) for n in range(3)]
+    broken = batch_analysis.queued_pointer(s3, BUCKET, keys[1])
+    s3.delete_object(Bucket=broken["bucket"], Key=broken["key"])
+
+    submitted = batch_analysis.submit(s3, BUCKET, keys, batch_analysis.LocalBatchProcessor())
+
+    assert len(submitted["records"]) == 2
+    assert batch_analysis.queued(s3, BUCKET) == [keys[1]]
+
+
+def test_submit_below_minimum_keeps_the_queue(s3):
+    keys = [batch_analysis.enqueue(s3, BUCKET, {"drift_report": report(0)})]
+    processor = FinishedProcessor()
+    processor.min_records = 2
+    with pytest.raises(ValueError):
+        batch_analysis.submit(s3, BUCKET, keys, processor)
+    assert batch_analysis.queued(s3, BUCKET) == keys
@@ -0,0 +1,60 @@
+import drift_triage
+import resource_records
+
+
+def drift():
+    unmanaged = [{"id": "db-adhoc", "type": "RDS"}]
+    deleted = [{"id": "deployer", "type": "aws_iam_user"}]
+    modified = [
+        {"id": "i-web", "type": "aws_instance", "changes": [{"attribute": "instance_type", "expected": "t3.micro", "actual": "t3.large"}]},
+        {"id": "i-dev", "type": "aws_instance", "changes": [{"attribute": "tags", "expected": {}, "actual": {"Owner": "bob"}}]}
+    ]
+    managed = {
+        "deployer": resource_records.ResourceRecord("aws_iam_user", {"tags": {}}),
+        "i-web": resource_records.ResourceRecord("aws_instance", {"tags": {"Environment": "prod"}}),
+        "i-dev": resource_records.ResourceRecord("aws_instance", {"tags": {"Environment": "dev"}})
+    }
+    actual = {
+        "db-adhoc": resource_records.ResourceRecord("RDS", {"tags": {}}),
+        "i-web": resource_records.ResourceRecord("EC2", {"tags": {"Environment": "prod"}}),
+        "i-dev": resource_records.ResourceRecord("EC2", {"tags": {"Environment": "dev"}})
+    }
+    return unmanaged, deleted, modified, managed, actual
+
+
+def test_token_round_trip_resumes_the_remaining_work():
+    unmanaged, deleted, modified, managed, actual = drift()
+    queue = drift_triage.build_queue(unmanaged, deleted, modified, managed, actual)
+    processed, remaining = queue[:2], queue[2:]
+
+    payload = drift_triage.decode_token(drift_triage.encode_token(remaining, "2026-01-01T00:00:00Z"))
+
+    assert payload["scan_time"] == "2026-01-01T00:00:00Z"
+    # A later invocation rebuilds the queue from a fresh diff and keeps only what was left
+    resumed = drift_triage.resume_queue(drift_triage.build_queue(*drift()), payload)
+    assert [(kind, r["id"]) for kind, r in resumed] == [(kind, r["id"]) for kind, r in remaining]
+    assert not {r["id"] for _, r in resumed} & {r["id"] for _, r in processed}
+
+
+def test_token_is_url_safe():
+    _, _, modified, _, _ = drift()
+    token = drift_triage.encode_token([("modified", r) for r in modified * 50], "2026-01-01T00:00:00Z")
+    assert token.isascii() and not set(token) & set("+/ ")
+
+
+def test_run_queue_stops_at_the_deadline():
+    unmanaged, deleted, modified, managed, actual = drift()
+    queue = drift_triage.build_queue(unmanaged, deleted, modified, managed, actual)
+    worked = []
+
+    processed, remaining = drift_triage.run_queue(queue, lambda kind, r: worked.append(r["id"]), deadline=0)
+
+    assert processed == [] and remaining == queue and worked == []
+    processed, remaining = drift_triage.run_queue(queue, lambda kind, r: worked.append(r["id"]))
+    assert remaining == [] and worked == [r["id"] for _, r in queue]
+
+
+def test_prod_drift_is_triaged_before_dev():
+    queue = drift_triage.build_queue(*drift())
+    order = [r["id"] for _, r in queue]
+    assert order.index("i-web") < order.index("i-dev")
@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+import idempotency
+from conftest import BUCKET
+
+IDENTITY = "s3:statetf-bucket/terraform.tfstate@v1"
+
+
+@pytest.fixture
+def store(aws):
+    return idempotency.S3IdempotencyStore(BUCKET)
+
+
+def record(status="in_progress", ttl=60):
+    return {"identity": IDENTITY, "status": status, "expires_at": time.time() + ttl}
+
+
+def test_first_claim_wins(store):
+    assert store.claim(IDENTITY, record()) == (True, None)
+    claimed, existing = store.claim(IDENTITY, record())
+    assert not claimed
+    assert existing["status"] == "in_progress"
+
+
+def test_expired_claim_is_taken_over_once(store):
+    store.claim(IDENTITY, record(ttl=-1))
+    assert store.claim(IDENTITY, record()) == (True, None)
+    assert store.claim(IDENTITY, record())[0] is False
+
+
+def test_takeover_loses_to_a_concurrent_write(store, s3, monkeypatch):
+    store.claim(IDENTITY, record(ttl=-1))
+    read = store.s3.get_object
+
+    def racing_get_object(**kwargs):
+        # Another delivery replaces the expired record between our read and write
+        response = read(**kwargs)
+        s3.put_object(Bucket=BUCKET, Key=store.key(IDENTITY), Body=b"{}")
+        return response
+
+    monkeypatch.setattr(store.s3, "get_object", racing_get_object, raising=False)
+    assert store.claim(IDENTITY, record()) == (False, None)
+
+
+def test_run_once_returns_the_stored_result(store):
+    calls = []
+    func = lambda: calls.append(1) or {"state_changed": True}
+
+    assert idempotency.run_once(IDENTITY, func, store) == {"state_changed": True}
+    assert idempotency.run_once(IDENTITY, func, store) == {"state_changed": True, "duplicate": True}
+    assert len(calls) == 1
+
+
+def test_run_once_releases_failed_attempts(store):
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        idempotency.run_once(IDENTITY, fail, store)
+    assert idempotency.run_once(IDENTITY, lambda: {"error": "state missing"}, store) == {"error": "state missing"}
+    assert idempotency.run_once(IDENTITY, lambda: {"ok": True}, store) == {"ok": True}
+
+
+def test_notification_and_eventbridge_share_an_identity():
+    notification = {"Records": [{"s3": {
+        "bucket": {"name": "statetf-bucket"},
+        "object": {"key": "envs/prod+eu/terraform.tfstate", "versionId": "v1"}
+    }}]}
+    eventbridge = {"detail-type": "Object Created", "detail": {
+        "bucket": {"name": "statetf-bucket"},
+        "object": {"key": "envs/prod eu/terraform.tfstate", "version-id": "v1"}
+    }}
+    assert idempotency.event_identity(notification) == idempotency.event_identity(eventbridge)
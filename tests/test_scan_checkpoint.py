@@ -0,0 +1,84 @@
+import drift_checker
+import resource_records
+import scan_checkpoint
+from conftest import BUCKET
+
+
+def paged(service, ids, page_size=2):
+    """Page function over a fixed id list, tokens being the next offset"""
+    def page(client, token=None):
+        start = int(token or 0)
+        batch = {rid: resource_records.ResourceRecord(service, {"tags": {}}) for rid in ids[start:start + page_size]}
+        end = start + page_size
+        return batch, str(end) if end < len(ids) else None
+    return page
+
+
+PAGES = {
+    "EC2": ("ec2", paged("EC2", [f"i-{n}" for n in range(5)])),
+    "S3": ("s3", paged("S3", ["logs", "assets"]))
+}
+
+
+def resume_until_done(store, scan_id, pages):
+    """Run one page per invocation, reloading the scan from its checkpoint each time"""
+    invocations = 1
+    while True:
+        scan = scan_checkpoint.load_scan(store, scan_id)
+        resources = scan_checkpoint.run_slice(store, scan, pages, deadline=0)
+        invocations += 1
+        if resources is not None:
+            return scan, resources, invocations
+
+
+def test_paused_scan_resumes_where_it_stopped(aws):
+    store = scan_checkpoint.S3CheckpointStore(BUCKET)
+    scan = scan_checkpoint.new_scan(PAGES)
+
+    # An expired deadline still collects one page, so every invocation makes progress
+    assert scan_checkpoint.run_slice(store, scan, PAGES, deadline=0) is None
+    assert scan_checkpoint.progress(scan)["services"] == {"EC2": "1 pages", "S3": "0 pages"}
+
+    scan, resources, invocations = resume_until_done(store, scan["scan_id"], PAGES)
+
+    assert sorted(resources) == sorted([f"i-{n}" for n in range(5)] + ["logs", "assets"])
+    assert invocations == 4
+    assert scan["resources"] == 7
+
+
+def test_failing_service_is_skipped_like_a_full_scan(aws):
+    def broken(client, token=None):
+        raise RuntimeError("AccessDenied")
+
+    pages = dict(PAGES, S3=("s3", broken))
+    store = scan_checkpoint.S3CheckpointStore(BUCKET)
+    scan = scan_checkpoint.new_scan(pages)
+
+    resources = scan_checkpoint.run_slice(store, scan, pages)
+
+    assert sorted(resources) == [f"i-{n}" for n in range(5)]
+    assert scan["services"]["S3"]["error"] == "AccessDenied"
+
+
+def test_finished_scan_leaves_no_checkpoint_objects(aws):
+    store = scan_checkpoint.S3CheckpointStore(BUCKET)
+    scan = scan_checkpoint.new_scan(PAGES)
+    scan_checkpoint.run_slice(store, scan, PAGES)
+
+    scan_checkpoint.finish_scan(store, scan)
+
+    assert not [key for key in aws.buckets[BUCKET]["objects"] if key.startswith(scan_checkpoint.CHECKPOINT_PREFIX)]
+
+
+def test_checkpointed_inventory_matches_a_direct_scan(aws):
+    for n in range(25):
+        aws.add_instance(f"i-{n:017x}", tags={"Name": f"app-{n}"})
+    aws.add_bucket("bank-app-logs", {"Environment": "prod"})
+    aws.add_db_instance("ledger-db")
+    store = scan_checkpoint.S3CheckpointStore(BUCKET)
+    scan = scan_checkpoint.new_scan(drift_checker.INVENTORY_PAGES)
+    scan_checkpoint.save_scan(store, scan)
+
+    _, resources, _ = resume_until_done(store, scan["scan_id"], drift_checker.INVENTORY_PAGES)
+
+    assert resources == drift_checker.get_actual_resources()